@@ -0,0 +1,126 @@
+# coding=utf-8
+
+# Benchmark: cluster-wide requests/sec budget (see loadtest/budget.py)
+#
+# Starts the stand-in server (see server.py), a Locust master with
+# LOCUST_TARGET_RPS and a number of slaves. Halfway through the run, one
+# slave is stopped; its share should shift to the others. Prints the achieved
+# requests/sec of the whole cluster (from the master's web UI) and the
+# master's split of the budget over time.
+#
+# Usage: python bench/budget.py [--target-rps 200] [--slaves 3] [--clients 300] [--run-time 60]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from urllib.parse import urlencode  # NOQA: E402
+from urllib.request import urlopen  # NOQA: E402
+import argparse  # NOQA: E402
+import json  # NOQA: E402
+import subprocess  # NOQA: E402
+import time  # NOQA: E402
+
+import server  # NOQA: E402
+from swarm import locust_command  # NOQA: E402
+
+
+def get(url, data=None):
+    return json.loads(urlopen(url, data=data, timeout=5).read().decode())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the requests/sec budget against a local stand-in server")
+    parser.add_argument("--target-rps", type=float, default=200)
+    parser.add_argument("--slaves", type=int, default=3)
+    parser.add_argument("--clients", type=int, default=300)
+    parser.add_argument("--run-time", type=int, default=60)
+    parser.add_argument("--interval", type=float, default=2, help="seconds between rebalancing")
+    args = parser.parse_args()
+
+    process, base_url = server.start()
+    web_port = server.free_port()
+    master_port = server.free_port()
+    env = dict(
+        os.environ,
+        LOCUST_TARGET_RPS=str(args.target_rps),
+        LOCUST_BUDGET_INTERVAL=str(args.interval),
+        LOCUST_MASTER_WEB_PORT=str(web_port),
+        LOCUST_WAIT_TIME_MIN="0",
+        LOCUST_WAIT_TIME_MAX="0",
+        LOCUST_REQUEST_LOG_SAMPLE_RATE="0",
+    )
+    devnull = open(os.devnull, "w")
+
+    def start_slave():
+        return subprocess.Popen(
+            locust_command("--slave", "--master-port", str(master_port), "--host", base_url),
+            env=env,
+            stdout=devnull,
+            stderr=devnull
+        )
+
+    master = subprocess.Popen(
+        locust_command(
+            "--master",
+            "--web-port", str(web_port),
+            "--master-bind-port", str(master_port),
+            "--host", base_url,
+        ),
+        env=env,
+        stdout=devnull,
+        stderr=devnull
+    )
+    slaves = [start_slave() for _ in range(args.slaves)]
+    web_url = "http://127.0.0.1:{}".format(web_port)
+
+    try:
+        # Wait for the master's web UI and the slaves
+        for _ in range(30):
+            time.sleep(0.5)
+            try:
+                if len(get(web_url + "/stats/requests")["slaves"]) == args.slaves:
+                    break
+            except OSError:
+                pass
+
+        get(web_url + "/swarm", urlencode({"locust_count": args.clients, "hatch_rate": args.clients}).encode())
+
+        print("{:>6} {:>8} {:>12}  {}".format("time", "slaves", "requests/s", "shares (requests/s)"))
+        started = time.time()
+        previous = (started, 0)
+        while time.time() - started < args.run_time:
+            time.sleep(args.interval)
+            now = time.time()
+            elapsed = now - started
+
+            if slaves[0].poll() is None and elapsed >= args.run_time / 2:
+                print("-- stopping a slave")
+                slaves[0].terminate()
+
+            stats = get(web_url + "/stats/requests")
+            budget = get(web_url + "/budget")
+            # HTTP requests only, not the "(Iteration) ..." entries
+            requests = sum(
+                entry["num_requests"]
+                for entry in stats["stats"]
+                if entry["method"] not in ("ITERATION", None)
+            )
+            rps = (requests - previous[1]) / (now - previous[0])
+            previous = (now, requests)
+            print("{:>5.0f}s {:>8} {:>12.1f}  {}".format(
+                elapsed,
+                len(stats["slaves"]),
+                rps,
+                " ".join("{:.0f}".format(slave["share_rps"]) for slave in budget["slaves"].values())
+            ))
+    finally:
+        for slave in slaves + [master]:
+            if slave.poll() is None:
+                slave.terminate()
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
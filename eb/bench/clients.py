@@ -0,0 +1,81 @@
+# coding=utf-8
+
+# Benchmark: HTTP client backends, requests (HttpLocust) vs. fasthttp (FastHttpLocust)
+#
+# Drives the stand-in server (see server.py) through `loadtest.client.request()`
+# with each backend, and reports requests/sec per core of the load generator.
+# Given a target request rate, it also estimates the number of instances
+# needed with each backend.
+#
+# Usage: python bench/clients.py [--duration 5] [--users 50] [--target-rps 10000] [--cores 2]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust.clients import HttpSession  # NOQA: E402
+from locust.contrib.fasthttp import FastHttpSession  # NOQA: E402
+import argparse  # NOQA: E402
+import gevent  # NOQA: E402
+import math  # NOQA: E402
+import time  # NOQA: E402
+
+from loadtest import client  # NOQA: E402
+import server  # NOQA: E402
+
+SESSIONS = (
+    ("requests", HttpSession),
+    ("fasthttp", FastHttpSession),
+)
+
+
+def user(session, end, counter):
+    """ A simulated user, sending requests back-to-back until `end` """
+
+    while time.time() < end:
+        client.request(session, "GET", "/", name="#0: (Benchmark) Visit /")
+        counter[0] += 1
+
+
+def run(session_class, base_url, users, duration):
+    counter = [0]
+    end = time.time() + duration
+    cpu_start = time.process_time()
+    gevent.joinall([
+        gevent.spawn(user, session_class(base_url=base_url), end, counter)
+        for _ in range(users)
+    ])
+    cpu = time.process_time() - cpu_start
+
+    return counter[0] / cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare HTTP client backends")
+    parser.add_argument("--duration", type=float, default=5)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--body-size", type=int, default=4096)
+    parser.add_argument("--target-rps", type=int, default=10000)
+    parser.add_argument("--cores", type=int, default=2, help="vCPUs per instance (c5.large: 2)")
+    args = parser.parse_args()
+
+    process, base_url = server.start("--body-size", str(args.body_size))
+
+    try:
+        print("{:<10} {:>14} {:>22}".format(
+            "backend",
+            "req/s/core",
+            "instances @{} req/s".format(args.target_rps)
+        ))
+        for backend, session_class in SESSIONS:
+            rate = run(session_class, base_url, args.users, args.duration)
+            # One follower process per core, see build.rb
+            instances = math.ceil(args.target_rps / (rate * args.cores))
+            print("{:<10} {:>14.0f} {:>22}".format(backend, rate, instances))
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
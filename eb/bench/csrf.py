@@ -0,0 +1,72 @@
+# coding=utf-8
+
+# Benchmark: CSRF token extraction
+#
+# Compares `loadtest.csrf.extract_token()` with parsing the full page using
+# BeautifulSoup (the previous, commented-out approach) on HTML pages of
+# increasing size.
+#
+# Usage: python bench/csrf.py [iterations]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # NOQA: E402
+import timeit  # NOQA: E402
+
+from loadtest.csrf import extract_token  # NOQA: E402
+
+PAGE_SIZES = (10 * 1024, 100 * 1024, 1024 * 1024)
+
+HEAD = (
+    b'<!DOCTYPE html>\n<html lang="en">\n<head>\n'
+    b'<meta charset="utf-8">\n'
+    b'<title>Benchmark</title>\n'
+    b'<link rel="stylesheet" href="/css/app.css">\n'
+    b'<meta name="csrf-param" content="authenticity_token" />\n'
+    b'<meta name="csrf-token" content="qU2YwXmMj1k1hw8VyT3lD6kI9lIY0yYpG7XoN4Wbqk4=" />\n'
+    b'<script src="/js/app.js"></script>\n'
+    b'</head>\n<body>\n'
+)
+ROW = b'<tr><td class="flight">9696</td><td><a href="/reserve.php?id=1">Aer Lingus</a></td><td>200.98</td></tr>\n'
+TAIL = b'</body>\n</html>\n'
+
+
+def build_page(size):
+    rows = max((size - len(HEAD) - len(TAIL)) // len(ROW), 0)
+
+    return HEAD + b"<table>\n" + ROW * rows + b"</table>\n" + TAIL
+
+
+def beautifulsoup_token(html):
+    soup = BeautifulSoup(html, "html.parser")
+
+    return (
+        soup.find("meta", attrs={"name": "csrf-param"}).get("content"),
+        soup.find("meta", attrs={"name": "csrf-token"}).get("content"),
+    )
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+
+    print("{:>10} {:>16} {:>16} {:>10}".format("page", "beautifulsoup", "extract_token", "speedup"))
+    for size in PAGE_SIZES:
+        html = build_page(size)
+        assert extract_token(html) == beautifulsoup_token(html)
+
+        baseline = timeit.timeit(lambda: beautifulsoup_token(html), number=iterations) / iterations
+        fast = timeit.timeit(lambda: extract_token(html), number=iterations * 1000) / (iterations * 1000)
+
+        print("{:>7} KB {:>13.2f} ms {:>13.2f} us {:>9.0f}x".format(
+            size // 1024,
+            baseline * 1000,
+            fast * 1000000,
+            baseline / fast
+        ))
+
+
+if __name__ == "__main__":
+    main()
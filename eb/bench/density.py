@@ -0,0 +1,133 @@
+# coding=utf-8
+
+# Benchmark: simulated users per follower, with long think times
+#
+# For each HTTP client backend, number of users (1k, 5k, 10k) and idle
+# connection handling, starts a fresh process which imports the Locustfile,
+# hatches that many simulated users (500 per second, like Locust's hatch
+# rate) against the stand-in server (see server.py) with 30 to 60 seconds
+# between steps, as in a long think-time test, and reports, once every user
+# has sent its first request and waits:
+#
+# * memory (RSS) per simulated user, over the process before the users
+# * open file descriptors (mostly connections) per simulated user
+#
+# "keep-alive" holds every user's connection through its waits (Locust's
+# behavior), "release" closes it before waits of 5 seconds or more
+# (LOCUST_IDLE_RELEASE, see loadtest/connections.py).
+#
+# Usage: python bench/density.py [--users 1000 5000 10000] [--hatch-rate 500]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse  # NOQA: E402
+import json  # NOQA: E402
+import psutil  # NOQA: E402
+import subprocess  # NOQA: E402
+
+import server  # NOQA: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BACKENDS = ("requests", "fasthttp")
+
+VARIANTS = (
+    ("keep-alive", "0"),
+    ("release", "5"),
+)
+
+
+def measure(base_url, users, hatch_rate):
+    """ Run `users` simulated users in this process, returns their RSS and file descriptors per user """
+
+    from locust import events
+    import gevent
+    import locustfile
+
+    locustfile.LoadTest.host = base_url
+    process = psutil.Process()
+    requests = [0]
+
+    def on_request(**kwargs):
+        requests[0] += 1
+
+    events.request_success += on_request
+    events.request_failure += on_request
+
+    # Load the modules used by the first request, ahead of the baseline
+    locustfile.LoadTest().client.get("/")
+    rss, fds = process.memory_info().rss, process.num_fds()
+    requests[0] = 0
+
+    # Hatch a batch every 0.1 seconds
+    batch = max(int(hatch_rate / 10), 1)
+    for start in range(0, users, batch):
+        for _ in range(min(batch, users - start)):
+            gevent.spawn(locustfile.LoadTest().run)
+        gevent.sleep(0.1)
+
+    while requests[0] < users:
+        gevent.sleep(0.5)
+    # Long enough for every user to be waiting
+    gevent.sleep(2)
+
+    return {
+        "rss_kb_per_user": (process.memory_info().rss - rss) / users / 1024,
+        "fds_per_user": (process.num_fds() - fds) / float(users),
+    }
+
+
+def run_child(base_url, users, hatch_rate, backend, idle_release):
+    """ Measure in a fresh process """
+
+    env = dict(
+        os.environ,
+        LOCUST_CLIENT_BACKEND=backend,
+        LOCUST_IDLE_RELEASE=idle_release,
+        LOCUST_WAIT_TIME_MIN="30",
+        LOCUST_WAIT_TIME_MAX="60",
+        LOCUST_REQUEST_LOG_SAMPLE_RATE="0",
+    )
+    output = subprocess.check_output(
+        [
+            sys.executable, os.path.abspath(__file__), "--child", base_url,
+            "--users", str(users), "--hatch-rate", str(hatch_rate)
+        ],
+        cwd=BASE_DIR,
+        env=env,
+        universal_newlines=True
+    )
+
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the simulated users per follower, with long think times")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--hatch-rate", type=float, default=500, help="users started per second")
+    parser.add_argument("--child", metavar="BASE_URL", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.users[0], args.hatch_rate)))
+        return
+
+    process, base_url = server.start()
+    try:
+        print("{:<10} {:<11} {:>7} {:>13} {:>10}".format("backend", "idle", "users", "RSS/user (KB)", "fds/user"))
+        for backend in BACKENDS:
+            for variant, idle_release in VARIANTS:
+                for users in args.users:
+                    result = run_child(base_url, users, args.hatch_rate, backend, idle_release)
+                    print("{:<10} {:<11} {:>7} {:>13.1f} {:>10.2f}".format(
+                        backend, variant, users, result["rss_kb_per_user"], result["fds_per_user"]
+                    ))
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env ruby
+#encoding: utf-8
+
+# Benchmark: master discovery at cluster startup (time-to-full-swarm)
+#
+# Runs the followers' master discovery of build.rb (get_master_ip) against a
+# local, in-memory stand-in for the DynamoDB table. All followers start polling
+# at once, the master writes its IP after --master-delay seconds. Reports how
+# long after the master's write the followers found it, and how many reads
+# they used (and how many were throttled), next to the previous linear
+# schedule (reads at 0, 3, 9, 18, 30 s).
+#
+# The table is billed per request (see .ebextensions/resources.config), which
+# the stand-in models by default: reads aren't limited. --rcu models
+# provisioned read capacity instead: strongly consistent reads per second,
+# with DynamoDB's burst capacity (300 s of unused capacity, none for a new
+# table), beyond which reads are throttled.
+#
+# Usage: ruby bench/discovery.rb [--followers 50] [--master-delay 2] [--latency 0.005] [--rcu 1]
+
+require 'optparse'
+require 'tmpdir'
+
+# build.rb requires the AWS SDK, which isn't needed (nor usually installed)
+# to run the stand-in: provide the few error classes it uses instead
+begin
+  require 'aws-sdk'
+rescue LoadError
+  module Aws
+    module DynamoDB
+      module Errors
+        class ServiceError < StandardError; end
+        class ConditionalCheckFailedException < ServiceError; end
+        class ProvisionedThroughputExceededException < ServiceError; end
+        class ThrottlingException < ServiceError; end
+        class RequestLimitExceeded < ServiceError; end
+      end
+    end
+  end
+
+  stub_dir = Dir.mktmpdir
+  File.write(File.join(stub_dir, 'aws-sdk.rb'), '')
+  $LOAD_PATH.unshift(stub_dir)
+end
+
+require_relative '../build'
+
+# The previous schedule: sleep 0, 3, 6, 9 and 12 s before each of five reads
+LEGACY_READ_TIMES = [0, 3, 9, 18, 30]
+
+# Stand-in for the master IP table: get_item with a fixed latency, and
+# optionally `rcu` strongly consistent reads per second (0: per request)
+class FakeTable
+  Result = Struct.new(:data)
+  Data = Struct.new(:item)
+
+  attr_reader :reads, :throttled
+
+  def initialize(latency, rcu = 0)
+    @latency = latency
+    @rcu = rcu
+    @items = {}
+    @reads = 0
+    @throttled = 0
+    # token bucket of the provisioned reads, empty for a new table
+    @tokens = 0.0
+    @refilled = Time.now
+    @lock = Mutex.new
+  end
+
+  def take_read
+    return true if @rcu <= 0
+
+    now = Time.now
+    @tokens = [@tokens + (now - @refilled) * @rcu, @rcu * 300.0].min
+    @refilled = now
+    return false if @tokens < 1
+
+    @tokens -= 1
+    true
+  end
+
+  def put(key, item)
+    @lock.synchronize { @items[key] = item }
+  end
+
+  def get_item(params)
+    sleep(@latency)
+    @lock.synchronize do
+      @reads += 1
+      unless take_read
+        @throttled += 1
+        raise Aws::DynamoDB::Errors::ProvisionedThroughputExceededException, "The level of configured provisioned throughput for the table was exceeded"
+      end
+      Result.new(Data.new(@items[params[:key][:HashKey]]))
+    end
+  end
+end
+
+def percentile(values, p)
+  values.sort[((values.length - 1) * p).round]
+end
+
+options = { followers: 50, master_delay: 2.0, latency: 0.005, timeout: 30.0, rcu: 0 }
+OptionParser.new do |opts|
+  opts.banner = "Usage: ruby bench/discovery.rb [options]"
+  opts.on("--followers N", Integer) { |v| options[:followers] = v }
+  opts.on("--master-delay SECONDS", Float, "delay of the master's write") { |v| options[:master_delay] = v }
+  opts.on("--latency SECONDS", Float, "latency of a single read") { |v| options[:latency] = v }
+  opts.on("--timeout SECONDS", Float) { |v| options[:timeout] = v }
+  opts.on("--rcu READS", Float, "provisioned reads per second (0: billed per request)") { |v| options[:rcu] = v }
+end.parse!
+
+$ddb = FakeTable.new(options[:latency], options[:rcu])
+$stdout = File.open(File::NULL, "w")
+
+started = Time.now
+followers = Array.new(options[:followers]) do
+  Thread.new do
+    get_master_ip("MasterIPTable", "loadtest", 2, options[:timeout])
+    Time.now
+  end
+end
+
+sleep(options[:master_delay])
+written = Time.now
+$ddb.put("loadtest", { "IP" => "10.0.0.1", "DeploymentID" => 2 })
+
+joined = followers.map { |follower| follower.value - written }
+elapsed = Time.now - started
+$stdout = STDOUT
+
+legacy = LEGACY_READ_TIMES.find { |time| time >= options[:master_delay] }
+
+puts "#{options[:followers]} followers, master writes after #{options[:master_delay]} s, #{options[:latency] * 1000} ms per read, " +
+     (options[:rcu] > 0 ? "#{options[:rcu]} provisioned reads/sec" : "billed per request")
+puts
+puts "%-28s %10s %10s" % ["", "discovery", "legacy"]
+puts "%-28s %10.3f %10s" % ["median join after write (s)", percentile(joined, 0.5), legacy ? "%.3f" % (legacy - options[:master_delay]) : "never"]
+puts "%-28s %10.3f %10s" % ["full swarm after write (s)", joined.max, legacy ? "%.3f" % (legacy - options[:master_delay]) : "never"]
+puts "%-28s %10.1f %10d" % ["reads per follower", $ddb.reads.to_f / options[:followers], LEGACY_READ_TIMES.index(legacy).to_i + 1]
+puts "%-28s %10.1f" % ["reads/sec (all followers)", $ddb.reads / elapsed]
+puts "%-28s %10d" % ["throttled reads", $ddb.throttled]
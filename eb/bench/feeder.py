@@ -0,0 +1,120 @@
+# coding=utf-8
+
+# Benchmark: the test data feeder on large datasets (see loadtest/feeder.py)
+#
+# Writes CSV datasets of accounts (10k, 1M and 10M rows by default), builds
+# their line indexes (once, like the supervisor), then for each dataset and
+# policy starts a fresh process, which opens the dataset like a slave does
+# and takes rows for 10,000 simulated users, and reports:
+#
+# * the time to open the dataset (the slave's startup cost)
+# * the memory (RSS) after opening it, and after taking the rows, over the
+#   process before
+# * the CPU time per row taken
+#
+# None of these should grow with the dataset.
+#
+# Usage: python bench/feeder.py [--rows 10000 1000000 10000000] [--takes 10000]
+#
+# The datasets (about 60 bytes per row, plus 8 for the index) are written to
+# `--directory` (default: /tmp), and removed afterwards.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse  # NOQA: E402
+import json  # NOQA: E402
+import subprocess  # NOQA: E402
+import time  # NOQA: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+POLICIES = ("sequential", "random", "unique")
+
+
+def write_dataset(path, rows):
+    with open(path, "w") as f:
+        f.write("account_id,email,password,name\n")
+        for row in range(rows):
+            f.write("{0},user{0}@example.org,pw-{0:08x},Test User {0}\n".format(row))
+
+
+def measure(path, policy, takes):
+    """ Open the dataset and take `takes` rows in this process, returns the costs """
+
+    import logging
+    import psutil
+    from loadtest.feeder import DataFeeder, Dataset
+
+    process = psutil.Process()
+    rss = process.memory_info().rss
+
+    start = time.perf_counter()
+    feeder = DataFeeder(logging.getLogger("bench"), Dataset(path), policy=policy)
+    opened = time.perf_counter() - start
+    rss_open = process.memory_info().rss
+
+    cpu_start = time.process_time()
+    rows = [feeder.take() for _ in range(takes)]
+    cpu = time.process_time() - cpu_start
+
+    return {
+        "open_ms": opened * 1000,
+        "rss_open_mb": (rss_open - rss) / 1024.0 / 1024.0,
+        "rss_taken_mb": (process.memory_info().rss - rss) / 1024.0 / 1024.0,
+        "us_per_take": cpu / len(rows) * 1000000,
+    }
+
+
+def run_child(path, policy, takes):
+    """ Measure in a fresh process """
+
+    output = subprocess.check_output(
+        [sys.executable, os.path.abspath(__file__), "--child", path, policy, str(takes)],
+        cwd=BASE_DIR,
+        universal_newlines=True
+    )
+
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    if sys.argv[1:2] == ["--child"]:
+        path, policy, takes = sys.argv[2:5]
+        print(json.dumps(measure(path, policy, int(takes))))
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the test data feeder on large datasets")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 1000000, 10000000])
+    parser.add_argument("--takes", type=int, default=10000, help="rows taken, one per simulated user")
+    parser.add_argument("--directory", default="/tmp")
+    args = parser.parse_args()
+
+    from loadtest.feeder import INDEX_SUFFIX, build_index
+
+    print("{:>9} {:>10} {:>9} {:<11} {:>9} {:>13} {:>14} {:>9}".format(
+        "rows", "size (MB)", "index (s)", "policy", "open (ms)", "RSS open (MB)", "RSS taken (MB)", "us/take"
+    ))
+    for rows in args.rows:
+        path = os.path.join(args.directory, "bench-feeder-{}.csv".format(rows))
+        write_dataset(path, rows)
+        try:
+            start = time.time()
+            build_index(path)
+            indexed = time.time() - start
+            size = os.path.getsize(path) / 1024.0 / 1024.0
+            for policy in POLICIES:
+                result = run_child(path, policy, min(args.takes, rows))
+                print("{:>9} {:>10.0f} {:>9.1f} {:<11} {:>9.2f} {:>13.2f} {:>14.2f} {:>9.1f}".format(
+                    rows, size, indexed, policy, result["open_ms"], result["rss_open_mb"],
+                    result["rss_taken_mb"], result["us_per_take"]
+                ))
+        finally:
+            os.remove(path)
+            os.remove(path + INDEX_SUFFIX)
+
+
+if __name__ == "__main__":
+    main()
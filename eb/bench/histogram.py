@@ -0,0 +1,129 @@
+# coding=utf-8
+
+# Benchmark: response time histograms (see loadtest/histogram.py)
+#
+# Simulates slaves reporting to a master: log-normally distributed response
+# times are recorded per request name in several slave HistogramSets, shipped
+# encoded (and msgpack'ed, like Locust's reports) and merged on a master
+# HistogramSet. Checks that the merged counts equal those of a single
+# histogram of all values, and compares the percentiles with the exact ones
+# and with Locust's own (rounded) response times. Reports the cost of recording, encoding and merging, and the memory
+# used per request name.
+#
+# Usage: python bench/histogram.py [--values 1000000] [--slaves 4] [--names 20]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse  # NOQA: E402
+import logging  # NOQA: E402
+import msgpack  # NOQA: E402
+import random  # NOQA: E402
+import time  # NOQA: E402
+
+from loadtest.histogram import PERCENTILES, Histogram, HistogramSet  # NOQA: E402
+
+
+def locust_rounded(response_time):
+    """ Response time (ms) as counted by Locust 0.13's StatsEntry """
+
+    if response_time < 100:
+        return round(response_time)
+    elif response_time < 1000:
+        return round(response_time, -1)
+    elif response_time < 10000:
+        return round(response_time, -2)
+    else:
+        return round(response_time, -3)
+
+
+def exact_percentile(values, fraction):
+    return values[max(0, int(round(fraction * len(values))) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the response time histograms")
+    parser.add_argument("--values", type=int, default=1000000)
+    parser.add_argument("--slaves", type=int, default=4)
+    parser.add_argument("--names", type=int, default=20)
+    parser.add_argument("--reports", type=int, default=10, help="reports per slave")
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    random.seed(1)
+    names = ["#{}: request".format(1000 + index) for index in range(args.names)]
+    # Mostly around 100 ms, with a long tail
+    values = [(random.choice(names), random.lognormvariate(4.6, 0.6)) for _ in range(args.values)]
+
+    slaves = [HistogramSet(logger) for _ in range(args.slaves)]
+    master = HistogramSet(logger)
+    reference = Histogram()
+
+    chunks = args.slaves * args.reports
+    chunk_size = len(values) // chunks + 1
+    record_time = encode_time = merge_time = 0
+    blobs = blob_bytes = 0
+
+    for chunk in range(chunks):
+        slave = slaves[chunk % args.slaves]
+        chunk_values = values[chunk * chunk_size:(chunk + 1) * chunk_size]
+
+        start = time.perf_counter()
+        for name, response_time in chunk_values:
+            slave.record(name, response_time)
+        record_time += time.perf_counter() - start
+
+        data = {}
+        start = time.perf_counter()
+        slave.on_report_to_master(chunk % args.slaves, data)
+        encode_time += time.perf_counter() - start
+
+        blobs += len(data["histograms"])
+        blob_bytes += sum(len(msgpack.dumps(encoded)) for encoded in data["histograms"].values())
+
+        data = msgpack.loads(msgpack.dumps(data), raw=False)
+        start = time.perf_counter()
+        master.on_slave_report(chunk % args.slaves, data)
+        merge_time += time.perf_counter() - start
+
+    for name, response_time in values:
+        reference.record(response_time * 1000)
+
+    merged = master.total()
+    assert merged.counts == reference.counts, "merged counts differ"
+    assert (merged.count, merged.min, merged.max, merged.total) == \
+        (reference.count, reference.min, reference.max, reference.total), "merged summary differs"
+    print("Merge check: OK ({} values, {} slaves, {} reports)".format(len(values), args.slaves, chunks))
+    print()
+
+    exact = sorted(response_time for _, response_time in values)
+    rounded = sorted(locust_rounded(response_time) for _, response_time in values)
+
+    print("{:<10} {:>12} {:>12} {:>8} {:>12} {:>8}".format("", "exact", "histogram", "error", "locust", "error"))
+    for fraction in PERCENTILES:
+        expected = exact_percentile(exact, fraction)
+        histogram = merged.percentile(fraction) / 1000
+        locust = exact_percentile(rounded, fraction)
+        print("p{:<9g} {:>9.3f} ms {:>9.3f} ms {:>7.2f}% {:>9.3f} ms {:>7.2f}%".format(
+            fraction * 100,
+            expected,
+            histogram,
+            abs(histogram - expected) / expected * 100,
+            locust,
+            abs(locust - expected) / expected * 100
+        ))
+
+    histogram = Histogram()
+    memory = sys.getsizeof(histogram) + sys.getsizeof(histogram.counts)
+    print()
+    print("{:<32} {:>10.2f} us".format("record", record_time / len(values) * 1000000))
+    print("{:<32} {:>10.2f} us".format("encode, per name and report", encode_time / blobs * 1000000))
+    print("{:<32} {:>10.2f} us".format("merge, per name and report", merge_time / blobs * 1000000))
+    print("{:<32} {:>10.0f} bytes".format("msgpack'ed, per name and report", blob_bytes / blobs))
+    print("{:<32} {:>10.1f} KB".format("memory, per name", memory / 1024))
+
+
+if __name__ == "__main__":
+    main()
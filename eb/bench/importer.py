@@ -0,0 +1,167 @@
+# coding=utf-8
+
+# Benchmark: the scenario importer on large access logs (see loadtest/importer.py)
+#
+# Writes a synthetic nginx access log in the "main" log_format: interleaved
+# sessions of known sequences (BlazeDemo-like, with IDs in the paths, static
+# assets and failed requests), then runs the importer on it in a fresh
+# process, with 1 and more worker processes, and reports:
+#
+# * lines per second
+# * peak memory (max RSS) of the importer, which shouldn't grow with the log
+# * whether the most common sequences written are the generated ones
+#
+# Usage: python bench/importer.py [--lines 1000000 4000000] [--processes 1 4]
+#
+# The logs (about 250 bytes per line) are written to `--directory` (default:
+# /tmp), and removed afterwards.
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse  # NOQA: E402
+import json  # NOQA: E402
+import random  # NOQA: E402
+import resource  # NOQA: E402
+import subprocess  # NOQA: E402
+import time  # NOQA: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (weight, requests) of the generated sequences, "{n}" is a random ID
+SEQUENCES = (
+    (50, ("GET /", "GET /reserve.php?fromPort=Paris&toPort=Rome", "GET /purchase.php?flight={n}")),
+    (30, ("GET /", "GET /login", "POST /login", "GET /home")),
+    (15, ("GET /", "GET /register", "POST /register", "GET /home")),
+    (5, ("GET /", "GET /reserve.php?fromPort=Boston&toPort=London", "POST /purchase.php", "GET /confirmation.php?id={n}")),
+)
+
+STATIC = ("GET /assets/app.css", "GET /assets/app.js", "GET /favicon.ico")
+
+USER_AGENTS = (
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/90.0 Safari/537.36",
+    "Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/14.1 Safari/605.1.15",
+)
+
+LINE = '10.0.0.1 - - [{}] "{} HTTP/1.1" {} {} "-" "{}" "{}"\n'
+
+
+def write_log(path, lines, clients=2000):
+    """ Write an access log of interleaved sessions, at most `clients` active at once """
+
+    rng = random.Random(0)
+    weights = [weight for weight, _ in SEQUENCES]
+    now = 1600000000
+    # [client, remaining requests]
+    active = []
+    written = 0
+    clients_seen = 0
+    with open(path, "w") as f:
+        while written < lines:
+            if len(active) < clients:
+                sequence = rng.choices(SEQUENCES, weights)[0][1]
+                clients_seen += 1
+                address = "10.{}.{}.{}".format(clients_seen >> 16 & 255, clients_seen >> 8 & 255, clients_seen & 255)
+                active.append([address, rng.choice(USER_AGENTS), list(sequence)])
+                continue
+
+            now += 0.01
+            stamp = time.strftime("%d/%b/%Y:%H:%M:%S +0000", time.gmtime(now))
+            index = rng.randrange(len(active))
+            address, user_agent, remaining = active[index]
+            if rng.random() < 0.02:
+                # Static assets and failed requests, which the importer skips
+                request, status = rng.choice(STATIC + ("GET /missing",)), 200
+                if request == "GET /missing":
+                    status = 404
+            else:
+                request, status = remaining.pop(0).replace("{n}", str(rng.randrange(1, 100000))), 200
+            f.write(LINE.format(stamp, request, status, rng.randrange(500, 20000), user_agent, address))
+            written += 1
+            if not remaining:
+                active.pop(index)
+
+
+def run_importer(path, processes, output):
+    """ Run the importer in a fresh process, returns (seconds, max RSS in MB) """
+
+    start = time.time()
+    result = subprocess.check_output(
+        [
+            sys.executable, os.path.abspath(__file__), "--child", path, "--processes", str(processes),
+            "--output", output, "--sequences", str(len(SEQUENCES)), "--chunk-size", str(16 * 1024 * 1024),
+        ],
+        cwd=BASE_DIR,
+        universal_newlines=True
+    )
+
+    return time.time() - start, json.loads(result.splitlines()[-1])["max_rss_mb"]
+
+
+def child(arguments):
+    """ Run the importer, then print its peak memory: the largest of itself and its workers """
+
+    from loadtest import importer
+
+    sys.argv = ["importer"] + arguments
+    importer.main()
+    print(json.dumps({
+        "max_rss_mb": max(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+            resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+        ) / 1024.0
+    }))
+
+
+def recovered(output):
+    """ Whether the written sequences are the generated ones, IDs aside """
+
+    from loadtest.importer import pattern
+
+    def endpoints(requests):
+        return tuple(
+            "{} {}".format(method, pattern(url))
+            for method, url in (request.split(" ", 1) for request in requests)
+        )
+
+    with open(output) as f:
+        sequences = json.load(f)["sequences"]
+    found = sorted(endpoints(step["method"] + " " + step["url"] for step in sequence["steps"]) for sequence in sequences)
+    expected = sorted(endpoints(requests) for _, requests in SEQUENCES)
+
+    return found == expected
+
+
+def main():
+    if sys.argv[1:2] == ["--child"]:
+        child(sys.argv[2:])
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark the scenario importer on large access logs")
+    parser.add_argument("--lines", type=int, nargs="+", default=[1000000, 4000000])
+    parser.add_argument("--processes", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--directory", default="/tmp")
+    args = parser.parse_args()
+
+    output = os.path.join(args.directory, "bench-importer-scenarios.json")
+    print("{:>9} {:>9} {:>10} {:>11} {:>13} {:>10}".format("lines", "processes", "size (MB)", "lines/sec", "max RSS (MB)", "recovered"))
+    for lines in args.lines:
+        path = os.path.join(args.directory, "bench-importer-{}.log".format(lines))
+        if not os.path.exists(path):
+            write_log(path, lines)
+        size = os.path.getsize(path) / 1024.0 / 1024.0
+        try:
+            for processes in args.processes:
+                elapsed, rss = run_importer(path, processes, output)
+                print("{:>9} {:>9} {:>10.0f} {:>11.0f} {:>13.1f} {:>10}".format(
+                    lines, processes, size, lines / elapsed, rss, "yes" if recovered(output) else "no"
+                ))
+        finally:
+            os.remove(path)
+    os.remove(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+# coding=utf-8
+
+# Benchmark: the master's cost of ingesting slave reports (see loadtest/aggregator.py)
+#
+# Builds realistic reports of simulated slaves: Locust's stats and errors,
+# and response time histograms, for the request names of the scenario file,
+# msgpack'ed like Locust's messages. Measures the master's CPU time per
+# report interval (unpacking and merging every report), for slaves reporting
+# directly, and through a per-instance aggregator (which then sends a single
+# merged report per instance). Also reports the aggregator's own CPU time,
+# spent on each instance, and the bytes the master receives.
+#
+# Usage: python bench/ingest.py [--instances 20] [--slaves 8] [--requests 300]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust.rpc import Message  # NOQA: E402
+from locust.stats import RequestStats, global_stats, on_slave_report  # NOQA: E402
+import argparse  # NOQA: E402
+import logging  # NOQA: E402
+import random  # NOQA: E402
+import time  # NOQA: E402
+
+from loadtest import settings  # NOQA: E402
+from loadtest.aggregator import ReportMerger  # NOQA: E402
+from loadtest.histogram import HistogramSet  # NOQA: E402
+from loadtest.scenario import load_steps, read_scenario_file  # NOQA: E402
+
+INTERVAL = 3.0
+
+
+def slave_report(client_id, steps, requests, logger):
+    """ A slave's serialized "stats" message, for `requests` requests """
+
+    stats = RequestStats()
+    histograms = HistogramSet(logger)
+
+    for _ in range(requests):
+        step = random.choice(steps)
+        response_time = random.lognormvariate(4.6, 0.6)
+        stats.log_request(step.method, step.name, response_time, 5000)
+        histograms.record(step.name, response_time)
+        if random.random() < 0.01:
+            stats.log_error(step.method, step.name, "HTTPError('500 Server Error')")
+
+    data = {
+        "stats": stats.serialize_stats(),
+        "stats_total": stats.total.get_stripped_report(),
+        "errors": stats.serialize_errors(),
+        "user_count": 100,
+        "cpu": 0.5,
+    }
+    histograms.on_report_to_master(client_id, data)
+
+    return Message("stats", data, client_id).serialize()
+
+
+def ingest(messages, master):
+    """ The master's handling of reports, returns the CPU time it took """
+
+    start = time.process_time()
+    for message in messages:
+        msg = Message.unserialize(message)
+        on_slave_report(msg.node_id, msg.data)
+        master.on_slave_report(msg.node_id, msg.data)
+
+    return time.process_time() - start
+
+
+def aggregate(messages):
+    """ An aggregator's handling of its slaves' reports, returns (merged report, CPU time) """
+
+    start = time.process_time()
+    merger = ReportMerger()
+    for message in messages:
+        msg = Message.unserialize(message)
+        merger.add(msg.node_id, msg.data)
+    leader = Message.unserialize(messages[0]).node_id
+    merged = Message("stats", merger.pop(leader), leader).serialize()
+
+    return merged, time.process_time() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the master's ingest of slave reports")
+    parser.add_argument("--instances", type=int, default=20)
+    parser.add_argument("--slaves", type=int, default=8, help="slaves per instance")
+    parser.add_argument("--requests", type=int, default=300, help="requests per slave and report")
+    parser.add_argument("--rounds", type=int, default=5, help="report intervals to measure")
+    parser.add_argument("--scenario", default=settings.SCENARIO_FILE)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    random.seed(1)
+    steps = [step for sequence in read_scenario_file(args.scenario)["sequences"] for step in load_steps(sequence)]
+
+    rounds = []
+    for _ in range(args.rounds):
+        rounds.append([
+            [
+                slave_report("instance{}_slave{}".format(instance, slave), steps, args.requests, logger)
+                for slave in range(args.slaves)
+            ]
+            for instance in range(args.instances)
+        ])
+
+    direct_time = direct_bytes = 0
+    global_stats.clear_all()
+    master = HistogramSet(logger)
+    for instances in rounds:
+        messages = [message for instance in instances for message in instance]
+        direct_bytes += sum(len(message) for message in messages)
+        direct_time += ingest(messages, master)
+
+    aggregated_time = aggregated_bytes = aggregator_time = 0
+    global_stats.clear_all()
+    master = HistogramSet(logger)
+    for instances in rounds:
+        merged = []
+        for messages in instances:
+            message, cpu_time = aggregate(messages)
+            merged.append(message)
+            aggregator_time += cpu_time
+        aggregated_bytes += sum(len(message) for message in merged)
+        aggregated_time += ingest(merged, master)
+
+    print("{} instance(s) x {} slave(s), {} request names, {} requests per slave and report".format(
+        args.instances, args.slaves, len(steps), args.requests
+    ))
+    print()
+    print("{:<24} {:>10} {:>16} {:>10} {:>14}".format("", "reports", "master CPU (ms)", "of 3 s", "received (KB)"))
+    for label, reports, cpu_time, received in (
+        ("direct", args.instances * args.slaves, direct_time, direct_bytes),
+        ("through aggregators", args.instances, aggregated_time, aggregated_bytes),
+    ):
+        print("{:<24} {:>10} {:>16.1f} {:>9.1f}% {:>14.1f}".format(
+            label,
+            reports,
+            cpu_time / args.rounds * 1000,
+            cpu_time / args.rounds / INTERVAL * 100,
+            received / args.rounds / 1024
+        ))
+    print()
+    print("Aggregator CPU per instance and report interval: {:.1f} ms".format(
+        aggregator_time / args.rounds / args.instances * 1000
+    ))
+
+
+if __name__ == "__main__":
+    main()
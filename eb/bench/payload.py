@@ -0,0 +1,58 @@
+# coding=utf-8
+
+# Benchmark: rendering request payloads
+#
+# Compares the precompiled payload Templates (see loadtest/payload.py) with
+# urlencoding a dict of form values per request, for each POST body in the
+# scenario file.
+#
+# Usage: python bench/payload.py [iterations]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from urllib.parse import parse_qsl, urlencode  # NOQA: E402
+import timeit  # NOQA: E402
+
+from loadtest import settings  # NOQA: E402
+from loadtest.payload import UserData  # NOQA: E402
+from loadtest.scenario import load_steps, read_scenario_file  # NOQA: E402
+
+
+def form_values(step, user_data):
+    """ The decoded form values of a step's body, for the urlencode() baseline """
+
+    values = {
+        field: value.decode()
+        for field, value in user_data.values.items()
+    }
+
+    return dict(parse_qsl(step.body.text.format(**values)))
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    user_data = UserData()
+
+    print("{:<8} {:>12} {:>12} {:>8}".format("step", "urlencode", "template", "speedup"))
+    for sequence in read_scenario_file(settings.SCENARIO_FILE)["sequences"]:
+        for step in load_steps(sequence):
+            if step.body is None:
+                continue
+
+            values = form_values(step, user_data)
+            baseline = timeit.timeit(lambda: urlencode(values).encode(), number=iterations)
+            template = timeit.timeit(lambda: step.body.render(user_data), number=iterations)
+
+            print("{:<8} {:>9.2f} us {:>9.2f} us {:>7.1f}x".format(
+                step.id,
+                baseline / iterations * 1000000,
+                template / iterations * 1000000,
+                baseline / template
+            ))
+
+
+if __name__ == "__main__":
+    main()
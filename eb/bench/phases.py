@@ -0,0 +1,99 @@
+# coding=utf-8
+
+# Benchmark: overhead of per-phase request timing (see loadtest/phases.py)
+#
+# Drives the stand-in server (see server.py) through `loadtest.client.request()`
+# with each HTTP client backend, alternately without and with the phase
+# timer's socket hooks, and reports the load generator's CPU time per request
+# (the fastest of the rounds), the timer's overhead, and the mean of each
+# measured phase.
+#
+# Usage: python bench/phases.py [--duration 5] [--users 50] [--rounds 3]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust.clients import HttpSession  # NOQA: E402
+from locust.contrib.fasthttp import FastHttpSession  # NOQA: E402
+import argparse  # NOQA: E402
+import gevent  # NOQA: E402
+import time  # NOQA: E402
+
+from loadtest import client  # NOQA: E402
+from loadtest.phases import PHASES, PhaseHistograms, PhaseTimer  # NOQA: E402
+import server  # NOQA: E402
+
+SESSIONS = (
+    ("requests", HttpSession),
+    ("fasthttp", FastHttpSession),
+)
+
+NAME = "#0: (Benchmark) Visit /"
+
+
+def user(session, end, counter):
+    """ A simulated user, sending requests back-to-back until `end` """
+
+    while time.time() < end:
+        client.request(session, "GET", "/", name=NAME)
+        counter[0] += 1
+
+
+def run(session_class, base_url, users, duration):
+    """ CPU time per request, in microseconds """
+
+    counter = [0]
+    end = time.time() + duration
+    cpu_start = time.process_time()
+    gevent.joinall([
+        gevent.spawn(user, session_class(base_url=base_url), end, counter)
+        for _ in range(users)
+    ])
+    cpu = time.process_time() - cpu_start
+
+    return cpu / counter[0] * 1000000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the overhead of per-phase request timing")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per run")
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5, help="runs per backend and mode, the fastest counts")
+    parser.add_argument("--body-size", type=int, default=4096)
+    args = parser.parse_args()
+
+    process, base_url = server.start("--body-size", str(args.body_size))
+    histograms = PhaseHistograms()
+    timer = PhaseTimer(histograms)
+
+    try:
+        results = {}
+        run(HttpSession, base_url, args.users, 1)
+        for _ in range(args.rounds):
+            for backend, session_class in SESSIONS:
+                for mode in ("off", "on"):
+                    if mode == "on":
+                        timer.install()
+                    cpu = run(session_class, base_url, args.users, args.duration)
+                    if mode == "on":
+                        timer.uninstall()
+                    results[(backend, mode)] = min(cpu, results.get((backend, mode), cpu))
+
+        print("{:<10} {:>16} {:>16} {:>10}".format("backend", "CPU/req off (us)", "CPU/req on (us)", "overhead"))
+        for backend, _ in SESSIONS:
+            off, on = results[(backend, "off")], results[(backend, "on")]
+            print("{:<10} {:>16.1f} {:>16.1f} {:>9.1f}%".format(backend, off, on, (on - off) / off * 100))
+
+        print()
+        print("Mean per phase (ms), both backends: " + ", ".join(
+            "{} {:.3f} ({} requests)".format(phase, values["mean"], values["count"])
+            for phase, values in sorted(histograms.percentiles()[NAME].items(), key=lambda item: PHASES.index(item[0]))
+        ))
+    finally:
+        process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+# coding=utf-8
+
+# Benchmark: compact slave reports (see loadtest/compact.py)
+#
+# Builds a series of slave reports with Locust's statistics for a number of
+# request names (the scenario's steps, and its sequences' iterations), and
+# compares Locust's format with the compact one: msgpack'ed bytes per report
+# (the first report, which defines the interned names, and later ones, once
+# the master acknowledged them), the slave's CPU time to encode, and the
+# master's CPU time to unpack, expand and merge a report into Locust's
+# statistics.
+#
+# Usage: python bench/reports.py [--names 22] [--requests 300] [--reports 200]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust.rpc import Message  # NOQA: E402
+from locust.stats import RequestStats, global_stats, on_slave_report  # NOQA: E402
+import argparse  # NOQA: E402
+import logging  # NOQA: E402
+import random  # NOQA: E402
+import time  # NOQA: E402
+
+from loadtest import settings  # NOQA: E402
+from loadtest.compact import VERSION, ReportDecoder, ReportEncoder  # NOQA: E402
+from loadtest.scenario import load_steps, read_scenario_file  # NOQA: E402
+
+
+def request_names(scenario, count):
+    """ (method, name) of the scenario's steps, then of its sequences' iterations """
+
+    sequences = read_scenario_file(scenario)["sequences"]
+    names = [(step.method, step.name) for sequence in sequences for step in load_steps(sequence)]
+    names += [("ITERATION", "(Iteration) {}".format(sequence["name"])) for sequence in sequences]
+
+    return names[:count]
+
+
+def report(names, requests):
+    """ A slave's report of `requests` requests, in Locust's format """
+
+    stats = RequestStats()
+    for _ in range(requests):
+        method, name = random.choice(names)
+        stats.log_request(method, name, random.lognormvariate(4.6, 0.6), 5000)
+        if random.random() < 0.01:
+            stats.log_error(method, name, "HTTPError('500 Server Error: Internal Server Error')")
+
+    return {
+        "stats": stats.serialize_stats(),
+        "stats_total": stats.total.get_stripped_report(),
+        "errors": stats.serialize_errors(),
+        "user_count": 100,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark compact slave reports")
+    parser.add_argument("--names", type=int, default=22, help="request names")
+    parser.add_argument("--requests", type=int, default=300, help="requests per report")
+    parser.add_argument("--reports", type=int, default=200)
+    parser.add_argument("--scenario", default=settings.SCENARIO_FILE)
+    args = parser.parse_args()
+
+    logger = logging.getLogger("bench")
+    random.seed(1)
+    names = request_names(args.scenario, args.names)
+    reports = [report(names, args.requests) for _ in range(args.reports)]
+
+    results = {}
+    for label in ("locust", "compact"):
+        encoder = decoder = None
+        if label == "compact":
+            # The master accepted compact reports, and acknowledges their definitions
+            encoder = ReportEncoder()
+            encoder.on_ack({"version": VERSION, "names": 0, "errors": 0})
+            decoder = ReportDecoder(logger, send=lambda client_id, ack: encoder.on_ack(ack))
+        global_stats.clear_all()
+        sizes = []
+        encode_time = master_time = 0
+
+        for data in reports:
+            data = dict(data)
+            start = time.process_time()
+            if encoder is not None:
+                encoder.encode(data)
+            message = Message("stats", data, "slave").serialize()
+            encode_time += time.process_time() - start
+            sizes.append(len(message))
+
+            start = time.process_time()
+            msg = Message.unserialize(message)
+            if decoder is not None:
+                decoder.decode(msg.node_id, msg.data)
+            on_slave_report(msg.node_id, msg.data)
+            master_time += time.process_time() - start
+
+        results[label] = (sizes, encode_time, master_time, global_stats.total.num_requests, len(global_stats.errors))
+
+    # Both formats must add up to the same statistics on the master
+    assert results["locust"][3:] == results["compact"][3:], "compact reports differ"
+
+    print("{} request names, {} requests per report, {} reports".format(len(names), args.requests, args.reports))
+    print()
+    print("{:<10} {:>14} {:>14} {:>16} {:>16}".format(
+        "", "first (bytes)", "later (bytes)", "slave CPU (us)", "master CPU (us)"
+    ))
+    for label, (sizes, encode_time, master_time, _, _) in sorted(results.items(), reverse=True):
+        print("{:<10} {:>14} {:>14.0f} {:>16.0f} {:>16.0f}".format(
+            label,
+            sizes[0],
+            sum(sizes[1:]) / len(sizes[1:]),
+            encode_time / len(sizes) * 1000000,
+            master_time / len(sizes) * 1000000
+        ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+# coding=utf-8
+
+# Benchmark: request logging overhead per follower core
+#
+# Runs every Step of the scenario file through CustomTaskSequence.run_step()
+# against an in-process fake client, so only the Locustfile's own per-request
+# work is measured. Reports requests/sec on a single core with request logging
+# off, sampled and full (DEBUG).
+#
+# Usage: make -C eb bench  (or: python bench/requestlog.py [seconds])
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust import Locust, between  # NOQA: E402
+from requests import Response  # NOQA: E402
+from requests.cookies import RequestsCookieJar  # NOQA: E402
+from requests.structures import CaseInsensitiveDict  # NOQA: E402
+import logging  # NOQA: E402
+import time  # NOQA: E402
+
+import locustfile  # NOQA: E402
+from loadtest.requestlog import RequestLog  # NOQA: E402
+
+MODES = (
+    # (mode, log level, sample rate)
+    ("off", logging.INFO, 0),
+    ("sampled", logging.INFO, 100),
+    ("full", logging.DEBUG, 1),
+)
+
+
+class FakeResponse(Response):
+    """ Response which, like Locust's, reports itself when used with catch_response """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc, value, traceback):
+        return exc is None
+
+    def success(self):
+        pass
+
+    def failure(self, exc):
+        pass
+
+
+class FakeClient(object):
+    """ Stand-in for HttpSession, returning a canned response """
+
+    def __init__(self):
+        response = FakeResponse()
+        response.status_code = 200
+        response.url = "http://127.0.0.1/"
+        response.headers = CaseInsensitiveDict({
+            "Content-Type": "text/html; charset=UTF-8",
+            "Content-Length": "4096",
+            "Server": "nginx",
+        })
+        response._content = b"x" * 4096
+        self.response = response
+        self.cookies = RequestsCookieJar()
+        self.cookies.set("XSRF-TOKEN", "x" * 200)
+
+    def request(self, method, url, **kwargs):
+        return self.response
+
+
+class BenchLocust(Locust):
+    task_set = locustfile.UserBehavior
+    wait_time = between(0, 0)
+
+
+def run(mode, level, sample_rate, duration):
+    logger = logging.getLogger("bench.requestlog.{}".format(mode))
+    logger.propagate = False
+    logger.setLevel(level)
+    handler = logging.StreamHandler(open(os.devnull, "w"))
+    handler.setFormatter(logging.Formatter("[%(asctime)s] %(name)s/%(levelname)s: %(message)s"))
+    logger.addHandler(handler)
+    locustfile.request_log = RequestLog(logger, sample_rate=sample_rate)
+
+    locust = BenchLocust()
+    locust.client = FakeClient()
+    task_sequences = [task_sequence(locust) for task_sequence in locustfile.UserBehavior.tasks]
+    for task_sequence in task_sequences:
+        task_sequence.on_start()
+
+    count = 0
+    cpu_start = time.process_time()
+    end = time.time() + duration
+    while time.time() < end:
+        for task_sequence in task_sequences:
+            for step in task_sequence.tasks:
+                step(task_sequence)
+                count += 1
+    cpu = time.process_time() - cpu_start
+
+    return count / cpu, cpu / count * 1000000
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 3
+
+    print("{:<10} {:>14} {:>14}".format("logging", "req/s/core", "us/request"))
+    for mode, level, sample_rate in MODES:
+        rate, per_request = run(mode, level, sample_rate, duration)
+        print("{:<10} {:>14.0f} {:>14.2f}".format(mode, rate, per_request))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+# coding=utf-8
+
+# Benchmark: response handling modes on large pages (see loadtest/responses.py)
+#
+# Drives the stand-in server (see server.py), serving large pages plain and
+# gzip-compressed, through `loadtest.client.request()` with each HTTP client
+# backend and response mode (full, validate, discard), and reports the load
+# generator's CPU time per request (the fastest of the rounds), and the peak
+# memory allocated by a single request (traced separately).
+#
+# Usage: python bench/responses.py [--duration 3] [--users 20] [--rounds 2] [--body-size 262144]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from locust.clients import HttpSession  # NOQA: E402
+from locust.contrib.fasthttp import FastHttpSession  # NOQA: E402
+import argparse  # NOQA: E402
+import gevent  # NOQA: E402
+import time  # NOQA: E402
+import tracemalloc  # NOQA: E402
+
+from loadtest import client  # NOQA: E402
+from loadtest.responses import ResponseMode  # NOQA: E402
+import server  # NOQA: E402
+
+SESSIONS = (
+    ("requests", HttpSession),
+    ("fasthttp", FastHttpSession),
+)
+
+MODES = (
+    ("full", ResponseMode("full", contains="csrf-token")),
+    ("validate", ResponseMode("validate", contains="csrf-token", max_bytes=4096)),
+    ("discard", ResponseMode("discard")),
+)
+
+NAME = "#0: (Benchmark) Visit /"
+
+
+def user(session, mode, end, counter):
+    """ A simulated user, sending requests back-to-back until `end` """
+
+    while time.time() < end:
+        client.request(session, "GET", "/", name=NAME, mode=mode)
+        counter[0] += 1
+
+
+def run(session_class, base_url, mode, users, duration):
+    """ CPU time per request, in microseconds """
+
+    counter = [0]
+    end = time.time() + duration
+    cpu_start = time.process_time()
+    gevent.joinall([
+        gevent.spawn(user, session_class(base_url=base_url), mode, end, counter)
+        for _ in range(users)
+    ])
+    cpu = time.process_time() - cpu_start
+
+    return cpu / counter[0] * 1000000
+
+
+def peak_memory(session_class, base_url, mode):
+    """ Peak memory allocated by a request, in KB """
+
+    session = session_class(base_url=base_url)
+    client.request(session, "GET", "/", name=NAME, mode=mode)
+    tracemalloc.start()
+    client.request(session, "GET", "/", name=NAME, mode=mode)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the response handling modes on large pages")
+    parser.add_argument("--duration", type=float, default=3, help="seconds per run")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=2, help="runs per backend and mode, the fastest counts")
+    parser.add_argument("--body-size", type=int, default=256 * 1024)
+    args = parser.parse_args()
+
+    print("{:<6} {:<10} {:<10} {:>12} {:>16}".format("gzip", "backend", "mode", "CPU/req (us)", "peak memory (KB)"))
+    for compress in (False, True):
+        arguments = ["--body-size", str(args.body_size)] + (["--gzip"] if compress else [])
+        process, base_url = server.start(*arguments)
+        try:
+            results = {}
+            for _ in range(args.rounds):
+                for backend, session_class in SESSIONS:
+                    for mode, response_mode in MODES:
+                        cpu = run(session_class, base_url, response_mode, args.users, args.duration)
+                        results[(backend, mode)] = min(cpu, results.get((backend, mode), cpu))
+
+            for backend, session_class in SESSIONS:
+                for mode, response_mode in MODES:
+                    print("{:<6} {:<10} {:<10} {:>12.1f} {:>16.1f}".format(
+                        "yes" if compress else "no",
+                        backend,
+                        mode,
+                        results[(backend, mode)],
+                        peak_memory(session_class, base_url, response_mode)
+                    ))
+        finally:
+            process.terminate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+# coding=utf-8
+
+# Stand-in target server for local benchmarks
+#
+# A minimal HTTP/1.1 server (keep-alive, Content-Length bodies only) on top of
+# gevent's StreamServer, serving prebuilt responses. It is much cheaper per
+# request than the Locust slaves driving it, so benchmarks measure the load
+# generator rather than the target.
+#
+# Every URL used in the scenario file (/, /register, /login, /reserve.php,
+# /purchase.php, ...) returns an HTML page with CSRF meta tags, for GET as
+# well as POST requests. Other URLs return HTTP 404.
+#
+# With --gzip, pages are sent gzip-compressed (Content-Encoding: gzip).
+#
+# Usage: python bench/server.py [--port 8089] [--body-size 4096] [--gzip]
+
+from gevent import monkey
+monkey.patch_all()
+
+from gevent.server import StreamServer  # NOQA: E402
+import argparse  # NOQA: E402
+import gzip  # NOQA: E402
+import os  # NOQA: E402
+import random  # NOQA: E402
+import socket  # NOQA: E402
+import subprocess  # NOQA: E402
+import sys  # NOQA: E402
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loadtest import settings  # NOQA: E402
+from loadtest.scenario import read_scenario_file  # NOQA: E402
+
+STATUS_LINES = {
+    200: b"HTTP/1.1 200 OK\r\n",
+    404: b"HTTP/1.1 404 Not Found\r\n",
+}
+
+WORDS = (
+    b"<p>", b"</p>", b"<div class=\"row\">", b"</div>", b"<a href=\"/reserve.php\">", b"</a>",
+    b"flight", b"from", b"to", b"Paris", b"Boston", b"London", b"Rome", b"price", b"choose",
+    b"this", b"airline", b"departs", b"arrives", b"Virgin", b"United", b"Lufthansa",
+) + tuple(str(number).encode() for number in range(100, 1000, 7))
+
+
+def build_response(status, body, content_type=b"text/html; charset=UTF-8", compress=False):
+    """ Prebuild a complete HTTP response """
+
+    if compress:
+        body = gzip.compress(body)
+
+    return b"".join((
+        STATUS_LINES[status],
+        b"Content-Type: ", content_type, b"\r\n",
+        b"Content-Encoding: gzip\r\n" if compress else b"",
+        b"Content-Length: ", str(len(body)).encode(), b"\r\n",
+        b"Connection: keep-alive\r\n",
+        b"\r\n",
+        body,
+    ))
+
+
+def build_page(size):
+    """ Build an HTML page of roughly `size` bytes """
+
+    head = (
+        b"<!DOCTYPE html><html><head><title>Stand-in</title>"
+        b'<meta name="csrf-param" content="_token" />'
+        b'<meta name="csrf-token" content="c3RhbmQtaW4tY3NyZi10b2tlbg==" />'
+        b"</head><body>"
+    )
+    tail = b"</body></html>"
+    filler = max(size - len(head) - len(tail), 0)
+
+    # Text which compresses about as well as a real page's
+    words = random.Random(0).choices(WORDS, k=filler // 4 + 1)
+
+    return head + b" ".join(words)[:filler] + tail
+
+
+def scenario_urls(path):
+    """ The URLs of all steps in a scenario file """
+
+    return set(
+        step["url"]
+        for sequence in read_scenario_file(path).get("sequences", [])
+        for step in sequence.get("steps", [])
+    )
+
+
+class Handler(object):
+    """ Serve prebuilt responses for the requests on a connection """
+
+    def __init__(self, routes, not_found):
+        # {path (bytes): response}
+        self.routes = routes
+        self.not_found = not_found
+
+    def __call__(self, sock, address):
+        buffer = b""
+
+        try:
+            while True:
+                # Read the request head
+                while b"\r\n\r\n" not in buffer:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    buffer += data
+
+                head, _, buffer = buffer.partition(b"\r\n\r\n")
+                path = head.split(b" ", 2)[1].partition(b"?")[0]
+
+                # Skip the request body
+                content_length = 0
+                for line in head.split(b"\r\n")[1:]:
+                    name, _, value = line.partition(b":")
+                    if name.strip().lower() == b"content-length":
+                        content_length = int(value)
+
+                while len(buffer) < content_length:
+                    data = sock.recv(65536)
+                    if not data:
+                        return
+                    buffer += data
+                buffer = buffer[content_length:]
+
+                sock.sendall(self.routes.get(path, self.not_found))
+        except (OSError, IndexError, ValueError):
+            # Connection reset, or a malformed request
+            pass
+        finally:
+            sock.close()
+
+
+def free_port():
+    """ Pick a free local TCP port """
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+
+    return port
+
+
+def start(*args):
+    """ Start the server in a separate process
+
+    Returns the process and the server's base URL, once it accepts requests.
+
+    """
+
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--port", str(port)] + list(args),
+        stdout=subprocess.PIPE,
+        universal_newlines=True
+    )
+    process.stdout.readline()
+
+    return process, "http://127.0.0.1:{}".format(port)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stand-in target server for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--body-size", type=int, default=4096)
+    parser.add_argument("--scenario-file", default=settings.SCENARIO_FILE)
+    parser.add_argument("--gzip", action="store_true", help="send the pages gzip-compressed")
+    args = parser.parse_args()
+
+    page = build_response(200, build_page(args.body_size), compress=args.gzip)
+    handler = Handler(
+        {url.encode(): page for url in scenario_urls(args.scenario_file)},
+        build_response(404, b"Not Found")
+    )
+    server = StreamServer((args.host, args.port), handler, backlog=4096)
+    print("Serving on http://{}:{}".format(args.host, args.port), flush=True)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
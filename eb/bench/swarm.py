@@ -0,0 +1,196 @@
+# coding=utf-8
+
+# Benchmark: load generator capacity, master/slave mode on a single machine
+#
+# Starts the stand-in server (see server.py), a headless Locust master and a
+# number of Locust slaves running the Locustfile, as on the cluster. The
+# simulated users don't wait between tasks, so the slaves run at their CPU
+# limit. Reports:
+#
+# * max requests/sec per slave (follower) process
+# * CPU time per request, in the slaves
+# * memory (RSS) per simulated user, in the slaves
+#
+# Results are written as JSON, for comparison between runs/commits.
+#
+# Usage: python bench/swarm.py [--slaves 2] [--clients 200] [--run-time 20] [--output results/swarm.json]
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import argparse  # NOQA: E402
+import csv  # NOQA: E402
+import json  # NOQA: E402
+import platform  # NOQA: E402
+import psutil  # NOQA: E402
+import shutil  # NOQA: E402
+import subprocess  # NOQA: E402
+import tempfile  # NOQA: E402
+import time  # NOQA: E402
+
+import server  # NOQA: E402
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def locust_command(*args):
+    """ Run Locust with the Locustfile, from the interpreter running this benchmark """
+
+    return [
+        sys.executable, "-c", "from locust.main import main; main()",
+        "--locustfile", os.path.join(BASE_DIR, "locustfile.py"),
+    ] + list(args)
+
+
+def slave_usage(slaves):
+    """ Total CPU seconds and RSS bytes of the slave processes """
+
+    cpu = 0
+    rss = 0
+    for slave in slaves:
+        process = psutil.Process(slave.pid)
+        times = process.cpu_times()
+        cpu += times.user + times.system
+        rss += process.memory_info().rss
+
+    return cpu, rss
+
+
+def aggregated_stats(csv_base):
+    """ The "Aggregated" row of Locust's requests CSV """
+
+    with open(csv_base + "_stats.csv") as f:
+        for row in csv.DictReader(f):
+            if row["Name"] == "Aggregated":
+                return row
+
+    raise RuntimeError("No aggregated stats in {}_stats.csv".format(csv_base))
+
+
+def run(args, base_url, csv_base):
+    env = dict(
+        os.environ,
+        LOCUST_WAIT_TIME_MIN="0",
+        LOCUST_WAIT_TIME_MAX="0",
+        LOCUST_REQUEST_LOG_SAMPLE_RATE="0",
+    )
+    port = server.free_port()
+    devnull = open(os.devnull, "w")
+
+    master = subprocess.Popen(
+        locust_command(
+            "--master",
+            "--no-web",
+            "--only-summary",
+            "--master-bind-port", str(port),
+            "--expect-slaves", str(args.slaves),
+            "--clients", str(args.clients),
+            "--hatch-rate", str(args.hatch_rate),
+            "--run-time", "{}s".format(args.run_time),
+            "--csv", csv_base,
+            "--host", base_url,
+        ),
+        env=env,
+        stdout=devnull,
+        stderr=devnull
+    )
+    slaves = [
+        subprocess.Popen(
+            locust_command(
+                "--slave",
+                "--master-port", str(port),
+                "--host", base_url,
+            ),
+            env=env,
+            stdout=devnull,
+            stderr=devnull
+        )
+        for _ in range(args.slaves)
+    ]
+
+    try:
+        # Baseline: slaves started, no simulated users yet
+        time.sleep(args.startup_time)
+        cpu_start, rss_start = slave_usage(slaves)
+
+        # Sample during the run: the slaves exit as soon as the master stops
+        cpu_end, rss_end = cpu_start, rss_start
+        while master.poll() is None:
+            time.sleep(0.5)
+            try:
+                cpu_end, rss_end = slave_usage(slaves)
+            except psutil.NoSuchProcess:
+                break
+
+        master.wait()
+    finally:
+        for process in slaves + [master]:
+            if process.poll() is None:
+                process.terminate()
+
+    stats = aggregated_stats(csv_base)
+    requests = int(stats["# requests"])
+    rps = float(stats["Requests/s"])
+
+    return {
+        "requests": requests,
+        "failures": int(stats["# failures"]),
+        "requests_per_second": rps,
+        "requests_per_second_per_slave": rps / args.slaves,
+        "cpu_us_per_request": (cpu_end - cpu_start) / requests * 1000000 if requests else None,
+        "rss_kb_per_user": (rss_end - rss_start) / args.clients / 1024,
+        "rss_mb_per_slave": rss_end / args.slaves / 1024 / 1024,
+        "median_response_time": float(stats["Median response time"]),
+        "average_response_time": float(stats["Average response time"]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the load generator against a local stand-in server")
+    parser.add_argument("--slaves", type=int, default=2)
+    parser.add_argument("--clients", type=int, default=200)
+    parser.add_argument("--hatch-rate", type=int, default=100)
+    parser.add_argument("--run-time", type=int, default=20)
+    parser.add_argument("--startup-time", type=float, default=3, help="seconds for the slaves to connect")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "results", "swarm.json"))
+    args = parser.parse_args()
+
+    process, base_url = server.start()
+    csv_dir = tempfile.mkdtemp()
+
+    try:
+        results = run(args, base_url, os.path.join(csv_dir, "swarm"))
+    finally:
+        process.terminate()
+        shutil.rmtree(csv_dir)
+
+    report = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "cpu_count": psutil.cpu_count(),
+        "settings": {
+            name: value
+            for name, value in sorted(os.environ.items())
+            if name.startswith("LOCUST_")
+        },
+        "slaves": args.slaves,
+        "clients": args.clients,
+        "run_time": args.run_time,
+        "results": results,
+    }
+
+    output_dir = os.path.dirname(os.path.abspath(args.output))
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+
+    for name, value in sorted(results.items()):
+        print("{:<32} {}".format(name, round(value, 2) if isinstance(value, float) else value))
+    print("Results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
@@ -18,13 +18,26 @@ require 'open3'
 require 'aws-sdk'
 require 'open-uri'
 
-# get the region that the instance is running in
-$region = JSON.parse(open('http://169.254.169.254/latest/dynamic/instance-identity/document').read)["region"]
-
-# create a new DynamoDB client
-$ddb = Aws::DynamoDB::Client.new({ region: $region })
+# Master discovery: followers poll the DynamoDB table with strongly consistent
+# reads, starting immediately and backing off exponentially (with full jitter)
+# from POLL_INTERVAL_MIN to POLL_INTERVAL_MAX seconds, so they find the master
+# within about a second of its write. A fleet of followers reads up to 20 times
+# per second each at first, so the table is billed per request (see
+# .ebextensions/resources.config): with provisioned capacity, the reads would
+# be throttled. Throttled followers back off to POLL_INTERVAL_MAX at once.
+# Deployment fails after MASTER_WAIT_TIMEOUT seconds (or the
+# MASTER_WAIT_TIMEOUT environment property) without a master.
+MASTER_WAIT_TIMEOUT = 120
+POLL_INTERVAL_MIN = 0.05
+POLL_INTERVAL_MAX = 1.0
 
 def main
+  # get the region that the instance is running in
+  $region = JSON.parse(open('http://169.254.169.254/latest/dynamic/instance-identity/document').read)["region"]
+
+  # create a new DynamoDB client
+  $ddb = Aws::DynamoDB::Client.new({ region: $region })
+
   # read environment variables using the get-config utility
   env_vars = JSON.parse(%x(/opt/elasticbeanstalk/bin/get-config environment))
 
@@ -33,13 +46,11 @@ def main
 
   # read the private IP of the instance from the metadata service
   private_ip = open('http://169.254.169.254/latest/meta-data/local-ipv4').read
-  
-  # get the number of CPU cores available
-  num_cores = get_num_cores()
 
   eb_env_name = env_vars["EB_ENV_NAME"]
   master_ip_table = env_vars["MASTER_IP_TABLE"]
   deployment_id = dep_manifest["DeploymentId"]
+  master_wait_timeout = (env_vars["MASTER_WAIT_TIMEOUT"] || MASTER_WAIT_TIMEOUT).to_f
 
   # Use DynamoDB conditional update to select a master and save it's IP.
   # Only a single instance will be able to update the record, all others
@@ -53,25 +64,26 @@ def main
     # to be used by the follower processes
     File.open('.masterIP', "w") { |f| f.print "127.0.0.1" }
 
-    # write .foreman file with a single master process and the number of cores
-    # available minus 1 follower processes
-    File.open('.foreman', "w") { |f| f.print "concurrency: locust-master=1,locust-follower=#{num_cores - 1}" }
+    # write .foreman file with a single master process and a single follower
+    # supervisor, which starts one follower process per physical CPU core,
+    # keeping one core free for the master and nginx (see loadtest/supervisor.py)
+    File.open('.foreman', "w") { |f| f.print "concurrency: locust-master=1,locust-follower=1" }
   else
     # since this instance is a follower, get the master IP from the DynamoDB table
-    master_ip = get_master_ip(master_ip_table, eb_env_name)
+    # (fails the deployment when no master shows up in time)
+    master_ip = get_master_ip(master_ip_table, eb_env_name, deployment_id, master_wait_timeout)
 
-    if master_ip
-      # save the master IP to be used by the follower processes
-      File.open('.masterIP', "w") { |f| f.print "#{master_ip}" }
+    # save the master IP to be used by the follower processes, which
+    # reconnect when it changes (see loadtest/supervisor.py)
+    File.open('.masterIP', "w") { |f| f.print "#{master_ip}" }
 
-      # update the nginx.conf to use the master instances IP for upstream
-      run_command('sed -i -e "s|\(.*\)http://\(.*\):\(.*\)|\1http://' + master_ip + ':\3|g" '\
-                  '.ebextensions/nginx/nginx.conf')
-    end
+    # update the nginx.conf to use the master instances IP for upstream
+    run_command('sed -i -e "s|\(.*\)http://\(.*\):\(.*\)|\1http://' + master_ip + ':\3|g" '\
+                '.ebextensions/nginx/nginx.conf')
 
-    # write the .foreman file with zero master processes and number of cores
-    # available follower proceses
-    File.open('.foreman', "w") { |f| f.print "concurrency: locust-master=0,locust-follower=#{num_cores}" }
+    # write the .foreman file with zero master processes and a single follower
+    # supervisor, which starts one follower process per physical CPU core
+    File.open('.foreman', "w") { |f| f.print "concurrency: locust-master=0,locust-follower=1" }
   end
 
   # Recreate the application.conf since we have modified the .foreman file
@@ -84,16 +96,6 @@ def main
               '/var/elasticbeanstalk/staging/supervisor')
 end
 
-def get_num_cores()
-  num_cores ||= begin
-    cpuinfo = File.read('/proc/cpuinfo')
-    cpuinfo.scan(/^processor\s*:/).count
-  rescue Exception => e
-    puts "Error getting CPU cores"
-    puts e.message
-  end
-end
-
 def run_command(command)
   output, status = Open3.capture2e(command)
   puts "#{command}"
@@ -125,11 +127,10 @@ def write_master_ip(table_name, key, ip, deployment_id)
     $ddb.update_item(
       :table_name => table_name,
       :key => { :HashKey => key },
-      :update_expression => "SET IP = :val, ChangedAt = :time, ReadCount = :rc, 
+      :update_expression => "SET IP = :val, ChangedAt = :time,
                              DeploymentID = :dep_id, InstanceID = :inst_id",
       :condition_expression => "attribute_not_exists(DeploymentID) OR DeploymentID < :dep_id",
       :expression_attribute_values => {
-        ":rc" => 0,
         ":val" => ip,
         ":time" => update_time.to_s,
         ":inst_id" => instance_id,
@@ -147,31 +148,52 @@ def write_master_ip(table_name, key, ip, deployment_id)
   end
 end
 
-def get_master_ip(table_name, key)
-  5.downto(1) do |retries|
-    begin
-      sleep(3 * (5 - retries))
-      puts "Read Attempt #{6 - retries}"
+def get_master_ip(table_name, key, deployment_id, timeout = MASTER_WAIT_TIMEOUT)
+  started = Time.now
+  interval = POLL_INTERVAL_MIN
+  attempt = 0
+
+  loop do
+    attempt += 1
+    throttled = false
 
+    begin
+      # strongly consistent, so the master's write is seen as soon as it's done
       item = $ddb.get_item(
         :table_name => table_name,
-        :key => { :HashKey => key }
+        :key => { :HashKey => key },
+        :consistent_read => true
       ).data.item
 
-      if item
-        $ddb.update_item(
-          :table_name => table_name,
-          :key => { :HashKey => key },
-          :update_expression => "ADD ReadCount :val",
-          :expression_attribute_values => {":val" => 1}
-        )
-
+      # ignore the master of a previous deployment
+      if item && item["DeploymentID"].to_i >= deployment_id.to_i
+        puts "Found master #{item["IP"]} after #{attempt} read(s), #{(Time.now - started).round(2)} s"
         return item["IP"]
       end
-    rescue Exception => e
-      puts "Error reading master IP from #{table_name}"
+    rescue Aws::DynamoDB::Errors::ProvisionedThroughputExceededException,
+           Aws::DynamoDB::Errors::ThrottlingException,
+           Aws::DynamoDB::Errors::RequestLimitExceeded => e
+      throttled = true
+      puts "Throttled reading master IP from #{table_name} (read #{attempt}), backing off"
+      puts e.message
+    rescue Aws::DynamoDB::Errors::ServiceError => e
+      # retried like a missing master
+      puts "Error reading master IP from #{table_name} (read #{attempt})"
       puts e.message
     end
+
+    if Time.now - started >= timeout
+      raise "No master for deployment #{deployment_id} in #{table_name} after #{attempt} read(s), #{timeout} s"
+    end
+
+    if throttled
+      # the other followers use up the table's reads too: spread out over the longest interval
+      interval = POLL_INTERVAL_MAX
+      sleep(interval * (1 + rand))
+    else
+      sleep(rand * interval)
+      interval = [interval * 2, POLL_INTERVAL_MAX].min
+    end
   end
 end
 
@@ -0,0 +1,3 @@
+# coding=utf-8
+
+# Helpers for the Locustfile: scenario loading, request handling, ...
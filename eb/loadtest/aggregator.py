@@ -0,0 +1,299 @@
+# coding=utf-8
+
+# Per-instance aggregator of the slaves' reports
+#
+# Without it, every slave process on every instance sends its statistics to
+# the master every 3 seconds; at 20 instances with 8 slaves each, the
+# master's single gevent loop spends its time unpacking and merging 160
+# reports, and the web UI stalls. With LOCUST_AGGREGATOR=1, the supervisor
+# starts an aggregator on each instance, and points the local slaves at it:
+#
+# * the aggregator relays all messages but the statistics between each slave
+#   and the master, on a connection per slave with the slave's own ID: the
+#   master still sees, hatches, stops and checks the heartbeats of each
+#   slave, as before
+# * the slaves' statistics (Locust's stats and errors, the response time
+#   and phase histograms, the connection counts and the missed arrival
+#   slots, see `loadtest/histogram.py`, `loadtest/phases.py`,
+#   `loadtest/connections.py` and `loadtest/arrival.py`) are merged, and
+#   sent to the master as a single report every `interval`
+#   seconds, on behalf of one of the instance's slaves (the first one to
+#   connect)
+# * the merged report carries each slave's user count, requests, CPU usage
+#   and saturation ("slaves"), so the master's user counts, requests/sec
+#   budget (see `loadtest/budget.py`) and saturation warnings (see
+#   `loadtest/saturation.py`) stay per slave; `install()` applies the user
+#   counts on the master
+#
+# So the master's report handling scales with the number of instances, not
+# with the number of slave processes. For example:
+#
+#   python3 -m loadtest.aggregator --master-host 10.0.1.23
+
+from locust import events, runners
+from locust.rpc import Message, rpc
+from locust.stats import StatsEntry
+from loadtest.arrival import MissedSlots, target_requests
+from loadtest.compact import ACK, ReportDecoder, ReportEncoder
+from loadtest.connections import ConnectionStats
+from loadtest.histogram import Histogram
+from loadtest.phases import PhaseHistograms
+import argparse
+import gevent
+import logging
+import os
+
+# Locust's default port of the master, and of the aggregator
+MASTER_PORT = 5557
+PORT = 5567
+
+# Seconds between merged reports (Locust's SLAVE_REPORT_INTERVAL)
+INTERVAL = 3.0
+
+logger = logging.getLogger("locust.aggregator")
+
+
+def unserialize(serialized):
+    """ A StatsEntry of a report's entry
+
+    With copies of its dicts: StatsEntry.unserialize() shares the report's,
+    which merging would add to in place.
+
+    """
+
+    entry = StatsEntry.unserialize(serialized)
+    entry.response_times = dict(entry.response_times)
+    entry.num_reqs_per_sec = dict(entry.num_reqs_per_sec)
+    entry.num_fail_per_sec = dict(entry.num_fail_per_sec)
+
+    return entry
+
+
+class ReportMerger(object):
+    """ Merge slave reports into a single report """
+
+    def __init__(self):
+        # Last user count of each slave
+        self.user_counts = {}
+        self.reset()
+
+    def reset(self):
+        self.reports = 0
+        self.entries = {}
+        self.total = None
+        self.errors = {}
+        self.histograms = {}
+        self.phases = PhaseHistograms()
+        self.connections = ConnectionStats()
+        self.missed_slots = MissedSlots()
+        self.slaves = {}
+
+    def add(self, client_id, data):
+        """ Merge a slave's report """
+
+        for serialized in data["stats"]:
+            entry = unserialize(serialized)
+            key = (entry.name, entry.method)
+            if key in self.entries:
+                self.entries[key].extend(entry)
+            else:
+                self.entries[key] = entry
+
+        total = unserialize(data["stats_total"])
+        if self.total is None:
+            self.total = total
+        else:
+            self.total.extend(total)
+
+        for key, error in data["errors"].items():
+            if key in self.errors:
+                self.errors[key]["occurrences"] += error["occurrences"]
+            else:
+                self.errors[key] = dict(error)
+
+        for name, encoded in data.get("histograms", {}).items():
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.merge_encoded(encoded)
+
+        self.phases.on_slave_report(client_id, data)
+        self.connections.on_slave_report(client_id, data)
+        self.missed_slots.on_slave_report(client_id, data)
+
+        slave = self.slaves.get(client_id)
+        if slave is None:
+            slave = self.slaves[client_id] = {"num_requests": 0, "cpu": 0}
+        slave["num_requests"] += target_requests(data["stats"])
+        slave["cpu"] = data.get("cpu", slave["cpu"])
+        if "saturation" in data:
+            # See `loadtest/saturation.py`
+            slave["saturation"] = data["saturation"]
+
+        self.user_counts[client_id] = data.get("user_count", 0)
+        self.reports += 1
+
+    def remove(self, client_id):
+        self.user_counts.pop(client_id, None)
+
+    def pop(self, leader):
+        """ The merged report, sent on behalf of `leader`, and start over """
+
+        slaves = {
+            client_id: dict(self.slaves.get(client_id, {"num_requests": 0, "cpu": 0}), user_count=user_count)
+            for client_id, user_count in self.user_counts.items()
+        }
+        data = {
+            "stats": [entry.serialize() for entry in self.entries.values()],
+            "stats_total": self.total.serialize(),
+            "errors": self.errors,
+            # The master sets the user count of the sender from this
+            "user_count": self.user_counts.get(leader, 0),
+            "slaves": slaves,
+        }
+        if self.histograms:
+            data["histograms"] = {name: histogram.encode() for name, histogram in self.histograms.items()}
+        self.phases.on_report_to_master(leader, data)
+        self.connections.on_report_to_master(leader, data)
+        self.missed_slots.on_report_to_master(leader, data)
+
+        self.reset()
+
+        return data
+
+
+class Aggregator(object):
+    """ Relay the local slaves' messages to the master, merging their reports """
+
+    def __init__(self, master_host, master_port=MASTER_PORT, bind_host="127.0.0.1", port=PORT, interval=INTERVAL, compact=True):
+        self.master_host = master_host
+        self.master_port = master_port
+        self.interval = interval
+        self.server = rpc.Server(bind_host, port)
+        # Connection to the master, per slave ID, in order of connection
+        self.upstreams = {}
+        self.merger = ReportMerger()
+        # Compact reports (see `loadtest/compact.py`): from each slave, and to
+        # the master on behalf of each leader
+        self.decoder = ReportDecoder(logger, send=self.send_ack)
+        self.encoders = {}
+        self.compact = compact
+        # Greenlet relaying the master's messages, per slave ID
+        self.relays = {}
+        self.greenlet = None
+
+    def connect(self, client_id):
+        upstream = self.upstreams[client_id] = rpc.Client(self.master_host, self.master_port, client_id)
+        self.relays[client_id] = gevent.spawn(self.relay_down, client_id, upstream)
+        logger.info("Slave %s connected (%s in total)", client_id, len(self.upstreams))
+
+        return upstream
+
+    def disconnect(self, client_id):
+        self.relays.pop(client_id).kill()
+        self.upstreams.pop(client_id).socket.close(linger=1000)
+        self.merger.remove(client_id)
+        self.decoder.forget(client_id)
+        self.encoders.pop(client_id, None)
+        logger.info("Slave %s quit (%s left)", client_id, len(self.upstreams))
+
+    def relay_down(self, client_id, upstream):
+        """ Relay the master's messages to a slave, but its acknowledgements of our compact reports """
+
+        while True:
+            msg = upstream.recv()
+            if msg.type == ACK:
+                encoder = self.encoders.get(client_id)
+                if encoder is not None:
+                    encoder.on_ack(msg.data)
+                continue
+            self.server.send_to_client(msg)
+
+    def send_ack(self, client_id, ack):
+        """ Acknowledge a slave's compact reports """
+
+        self.server.send_to_client(Message(ACK, ack, client_id))
+
+    def relay_up(self):
+        """ Relay the slaves' messages to the master, merging reports """
+
+        while True:
+            client_id, msg = self.server.recv_from_client()
+            upstream = self.upstreams.get(client_id) or self.connect(client_id)
+
+            if msg.type == "stats":
+                self.decoder.decode(client_id, msg.data)
+                self.merger.add(client_id, msg.data)
+            elif msg.type == "quit":
+                # The slave's final report, before the master forgets it
+                self.flush()
+                upstream.send(msg)
+                self.disconnect(client_id)
+            else:
+                upstream.send(msg)
+
+    def flush(self):
+        """ Send the merged report to the master """
+
+        if not self.merger.reports or not self.upstreams:
+            return
+
+        leader = next(iter(self.upstreams))
+        data = self.merger.pop(leader)
+        if self.compact:
+            encoder = self.encoders.get(leader)
+            if encoder is None:
+                encoder = self.encoders[leader] = ReportEncoder()
+            encoder.encode(data)
+        self.upstreams[leader].send(Message("stats", data, leader))
+
+    def report(self):
+        while True:
+            gevent.sleep(self.interval)
+            self.flush()
+
+    def run(self):
+        logger.info("Relaying to the master at %s:%s", self.master_host, self.master_port)
+        self.greenlet = gevent.spawn(self.report)
+        self.relay_up()
+
+
+def on_slave_report(client_id, data):
+    """ Set the user counts of the slaves in an aggregated report (master) """
+
+    clients = runners.locust_runner.clients
+    for slave_id, slave in data.get("slaves", {}).items():
+        # Locust itself sets the sender's user count
+        if slave_id != client_id and slave_id in clients:
+            clients[slave_id].user_count = slave["user_count"]
+
+
+def install():
+    """ Hook into Locust's events """
+
+    events.slave_report += on_slave_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay the local Locust slaves to the master, merging their reports")
+    parser.add_argument("--master-host", required=True)
+    parser.add_argument("--master-port", type=int, default=MASTER_PORT)
+    parser.add_argument("--bind-host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--interval", type=float, default=INTERVAL, help="seconds between merged reports")
+    parser.add_argument(
+        "--compact",
+        type=int,
+        choices=(0, 1),
+        default=int(os.environ.get("LOCUST_COMPACT_REPORTS", "1")),
+        help="send compact reports to the master"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(name)s/%(levelname)s: %(message)s")
+
+    Aggregator(args.master_host, args.master_port, args.bind_host, args.port, args.interval, args.compact == 1).run()
+
+
+if __name__ == "__main__":
+    main()
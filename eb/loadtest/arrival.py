@@ -0,0 +1,170 @@
+# coding=utf-8
+
+# Open-model (constant arrival rate) scheduling of TaskSequence iterations
+#
+# With `wait_time = between(...)`, each simulated user only starts a new
+# iteration after the previous one finished: when the web application slows
+# down, fewer iterations start, and the latency we're looking for is hidden
+# (coordinated omission). In arrival-rate mode, iterations of a sequence
+# start at fixed slots, `1 / rate` seconds apart, no matter how long earlier
+# iterations take:
+#
+# * the slots of a sequence are shared by all its users in a Locust process;
+#   a user which finishes an iteration waits until the next slot is due, and
+#   claims it, unless another user was first (the wait time between Steps
+#   within an iteration still applies). Slots are only claimed when due, so
+#   a change of the rate applies from the next slot on
+# * a user which claims a slot that has already passed (all users were busy)
+#   starts right away. Its iteration is timed from the slot, the intended
+#   start, reported as "(Iteration) <sequence>"
+# * slots more than `max_lag` seconds in the past are skipped, like tokens
+#   overflowing a token bucket: the load generator fell behind (too few
+#   users, or CPU bound). Each catch-up is reported as a single failure of
+#   "(Missed slot) <sequence>", however many slots it skipped, and the slots
+#   are counted per sequence, merged on the master, and served at
+#   /stats/missed_slots (JSON)
+#
+# A schedule with a rate of 0 is paused: no iterations start.
+#
+# Enough users must be hatched to sustain the rate: at least the rate times
+# the duration of an iteration (Little's law), per sequence.
+
+from locust import events
+from loadtest import resets
+
+# Seconds between checks of a paused schedule
+PAUSED_DELAY = 1.0
+
+# Request type of the iterations and missed slots, which aren't requests of
+# the target: requests/sec and response times leave them out
+REQUEST_TYPE = "ITERATION"
+
+
+def target_requests(entries):
+    """ Requests of serialized StatsEntries (eg. of a slave report), but for iterations and missed slots """
+
+    return sum(entry["num_requests"] for entry in entries if entry["method"] != REQUEST_TYPE)
+
+
+class MissedSlot(Exception):
+    """ Reported when an iteration couldn't start within `max_lag` of its slot """
+
+
+class MissedSlots(object):
+    """ Slots skipped per sequence, merged on the master """
+
+    def __init__(self):
+        # {sequence name: slots}
+        self.counts = {}
+
+    def add(self, name, count):
+        self.counts[name] = self.counts.get(name, 0) + count
+
+    def on_report_to_master(self, client_id, data):
+        if self.counts:
+            data["missed_slots"] = self.counts
+        self.counts = {}
+
+    def on_slave_report(self, client_id, data):
+        for name, count in data.get("missed_slots", {}).items():
+            self.add(name, count)
+
+    def reset(self):
+        self.counts = {}
+
+    def install(self):
+        """ Hook into Locust's events, and serve /stats/missed_slots """
+
+        events.report_to_master += self.on_report_to_master
+        events.slave_report += self.on_slave_report
+        resets.install()
+        resets.reset_stats += self.reset
+
+        from locust.web import app
+        from flask import jsonify
+
+        @app.route("/stats/missed_slots")
+        def missed_slots():
+            return jsonify(dict(sorted(self.counts.items())))
+
+
+# Slots skipped by the schedules of this Locust process
+missed_slots = MissedSlots()
+
+
+class ArrivalSchedule(object):
+    """ Start slots of a single sequence's iterations, in a single Locust process """
+
+    __slots__ = ("name", "interval", "max_lag", "next_start", "missed")
+
+    def __init__(self, name, rate, max_lag=1.0):
+        self.name = name
+        self.interval = None
+        self.max_lag = max_lag
+        self.next_start = None
+        self.missed = 0
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        """ Change the rate (0: pause), from the next slot on """
+
+        if rate <= 0:
+            self.interval = None
+            # Resume without counting the slots of the pause as missed
+            self.next_start = None
+        else:
+            self.interval = 1.0 / rate
+
+    def delay(self, now):
+        """ Seconds until the next slot is due """
+
+        if self.interval is None:
+            return PAUSED_DELAY
+
+        if self.next_start is None:
+            return 0
+
+        return max(0, self.next_start - now)
+
+    def take(self, now):
+        """ Claim the slot which is due, returns its (intended) start time
+
+        Returns None when the next slot isn't due yet, or the schedule is paused.
+
+        """
+
+        if self.interval is None:
+            return None
+
+        if self.next_start is None:
+            self.next_start = now
+        elif self.next_start > now:
+            return None
+
+        if self.next_start < now - self.max_lag:
+            missed = int((now - self.max_lag - self.next_start) / self.interval) + 1
+            self.next_start += missed * self.interval
+            self.missed += missed
+            missed_slots.add(self.name, missed)
+            events.request_failure.fire(
+                request_type=REQUEST_TYPE,
+                name="(Missed slot) {}".format(self.name),
+                response_time=0,
+                response_length=0,
+                exception=MissedSlot("Iterations not started within {} s of their slots".format(self.max_lag))
+            )
+
+        start = self.next_start
+        self.next_start += self.interval
+
+        return start
+
+    def record(self, intended_start, end):
+        """ Report an iteration, timed from its intended start """
+
+        events.request_success.fire(
+            request_type=REQUEST_TYPE,
+            name="(Iteration) {}".format(self.name),
+            response_time=(end - intended_start) * 1000,
+            response_length=0
+        )
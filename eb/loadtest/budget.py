@@ -0,0 +1,291 @@
+# coding=utf-8
+
+# Cluster-wide requests/sec budget, split over the slaves by the master
+#
+# With LOCUST_TARGET_RPS set, the sequences run in arrival-rate mode (see
+# `loadtest/arrival.py`), and their rates are set by the master instead of
+# LOCUST_ARRIVAL_RATE:
+#
+# * every report, slaves send their CPU usage since the previous report (a
+#   fraction of a core: a Locust slave runs on a single core)
+# * every `interval` seconds, the master estimates each connected slave's
+#   capacity, the requests/sec it can do at MAX_CPU, from its achieved
+#   requests/sec (but for the iterations and missed slots, see
+#   `loadtest/arrival.py`) and CPU usage, and splits the target over the slaves:
+#   equal shares, except for slaves which can't do their share, whose
+#   remainder is spread over the others ("water filling")
+# * slaves fetch their share from the master's web UI (/budget), and set the
+#   rates of their sequences' ArrivalSchedules, so the share is met with
+#   iterations split by weight like LOCUST_ARRIVAL_RATE
+#
+# The shares of slaves which quit or miss heartbeats go to the others at the
+# next rebalance. Slaves which join get a share once they run users (in
+# Locust 0.13, after the swarm is (re)started). The target can be changed
+# during a run: POST target_rps=... to /budget.
+
+from locust import events, runners
+from loadtest.arrival import target_requests
+from urllib.request import urlopen
+import gevent
+import json
+import math
+import os
+import time
+
+# CPU usage (fraction of a core) up to which a slave is loaded
+MAX_CPU = 0.8
+
+# Below this CPU usage, a slave's capacity can't be estimated
+MIN_CPU = 0.05
+
+# Slaves running simulated users (Locust 0.13 only hatches users on slaves which
+# joined before the swarm was started)
+ACTIVE_STATES = (runners.STATE_HATCHING, runners.STATE_RUNNING)
+
+
+def split_budget(target, capacities):
+    """ Split `target` requests/sec over slaves with the given capacities
+
+    `capacities` maps a slave's ID to its capacity in requests/sec, or None
+    when unknown. Returns a {slave ID: requests/sec} dict, which adds up to
+    less than `target` when the slaves' capacity doesn't suffice.
+
+    """
+
+    shares = {}
+    remaining = target
+    pending = sorted(
+        capacities,
+        key=lambda slave: float("inf") if capacities[slave] is None else capacities[slave]
+    )
+
+    while pending:
+        equal = remaining / len(pending)
+        capacity = capacities[pending[0]]
+        if capacity is None or capacity >= equal:
+            for slave in pending:
+                shares[slave] = equal
+            break
+
+        shares[pending.pop(0)] = capacity
+        remaining -= capacity
+
+    return shares
+
+
+def parse_target(value):
+    """ A target in requests/sec: a finite number, 0 or more, None when invalid """
+
+    try:
+        target = float(value)
+    except (TypeError, ValueError):
+        return None
+
+    return target if math.isfinite(target) and target >= 0 else None
+
+
+class SlaveLoad(object):
+    """ Achieved requests/sec and CPU usage of a slave, as reported """
+
+    __slots__ = ("rps", "cpu", "capacity", "last_report")
+
+    def __init__(self):
+        self.rps = 0
+        self.cpu = 0
+        self.capacity = None
+        self.last_report = None
+
+    def update(self, requests, cpu):
+        now = time.time()
+        last_report, self.last_report = self.last_report, now
+        self.cpu = cpu
+        if last_report is None:
+            # The interval of the first report is unknown
+            return
+
+        self.rps = requests / max(now - last_report, 0.001)
+
+        if cpu >= MIN_CPU and self.rps > 0:
+            capacity = self.rps / cpu * MAX_CPU
+            # Smoothed, so a single slow report doesn't move the shares
+            self.capacity = capacity if self.capacity is None else (self.capacity + capacity) / 2
+
+
+class BudgetController(object):
+    """ Split the target requests/sec over the connected slaves (master) """
+
+    def __init__(self, logger, target_rps, interval=5):
+        self.logger = logger
+        self.target_rps = target_rps
+        self.interval = interval
+        self.slaves = {}
+        self.shares = {}
+        self.greenlet = None
+
+    def on_slave_report(self, client_id, data):
+        # Reports merged by an instance's aggregator carry the load of each of
+        # its slaves (see `loadtest/aggregator.py`)
+        loads = data.get("slaves") or {
+            client_id: {"num_requests": target_requests(data["stats"]), "cpu": data.get("cpu", 0)}
+        }
+
+        for slave_id, load in loads.items():
+            slave = self.slaves.get(slave_id)
+            if slave is None:
+                slave = self.slaves[slave_id] = SlaveLoad()
+
+            slave.update(load["num_requests"], load["cpu"])
+
+    def rebalance(self, states=ACTIVE_STATES):
+        if not isinstance(runners.locust_runner, runners.MasterLocustRunner):
+            # A local run paces itself (see BudgetFollower)
+            return
+
+        connected = [
+            client.id
+            for client in runners.locust_runner.clients.all
+            if client.state in states
+        ]
+        for client_id in list(self.slaves):
+            if client_id not in connected:
+                del self.slaves[client_id]
+
+        capacities = {
+            client_id: self.slaves[client_id].capacity if client_id in self.slaves else None
+            for client_id in connected
+        }
+        self.shares = split_budget(self.target_rps, capacities)
+
+        assigned = sum(self.shares.values())
+        if connected and assigned < self.target_rps * 0.99:
+            self.logger.warning(
+                "Slaves can do about %.0f of the target %.0f requests/sec",
+                assigned,
+                self.target_rps
+            )
+
+    def run(self):
+        while True:
+            gevent.sleep(self.interval)
+            self.rebalance()
+
+    def start(self, **kwargs):
+        # Shares for the slaves about to hatch
+        self.rebalance(ACTIVE_STATES + (runners.STATE_INIT,))
+        if self.greenlet is None:
+            self.greenlet = gevent.spawn(self.run)
+
+    def status(self):
+        return {
+            "target_rps": self.target_rps,
+            "slaves": {
+                client_id: {
+                    "share_rps": share,
+                    "achieved_rps": self.slaves[client_id].rps if client_id in self.slaves else None,
+                    "cpu": self.slaves[client_id].cpu if client_id in self.slaves else None,
+                    "capacity_rps": self.slaves[client_id].capacity if client_id in self.slaves else None,
+                }
+                for client_id, share in self.shares.items()
+            },
+        }
+
+    def install(self):
+        """ Hook into Locust's events, and serve the shares at /budget """
+
+        events.slave_report += self.on_slave_report
+        events.master_start_hatching += self.start
+
+        from locust.web import app
+        from flask import Response, jsonify, request
+
+        @app.route("/budget", methods=["GET", "POST"])
+        def budget():
+            if request.method == "POST":
+                target_rps = parse_target(request.form.get("target_rps"))
+                if target_rps is None:
+                    return Response("target_rps must be a number of requests/sec, 0 or more\n", status=400, mimetype="text/plain")
+                self.target_rps = target_rps
+                self.rebalance()
+
+            client_id = request.args.get("client_id")
+            if client_id is not None:
+                return jsonify({"rps": self.shares.get(client_id)})
+
+            return jsonify(self.status())
+
+
+class BudgetFollower(object):
+    """ Fetch this slave's share from the master, and pace the sequences accordingly (slave) """
+
+    def __init__(self, logger, task_sequences, master_web_port, interval=5, local_rps=0, master_web_host=None):
+        self.logger = logger
+        # The master's host, when slaves connect through an aggregator
+        self.master_web_host = master_web_host
+        self.master_web_port = master_web_port
+        # Requests/sec when running without a master
+        self.local_rps = local_rps
+        self.interval = interval
+        self.greenlet = None
+        self.rps = None
+        self.cpu_times = None
+
+        # Iterations/sec of a sequence = share * weight / sum(weight * requests per iteration)
+        requests_per_weight = sum(
+            weight * len(task_sequence.tasks) for task_sequence, weight in task_sequences.items()
+        )
+        self.schedules = [
+            (task_sequence.schedule, weight / requests_per_weight)
+            for task_sequence, weight in task_sequences.items()
+            if task_sequence.schedule is not None
+        ]
+
+    def on_report_to_master(self, client_id, data):
+        # CPU time of this process, as a fraction of the wall time since the previous report
+        times = os.times()
+        cpu_times = (times[0] + times[1], times[4])
+        if self.cpu_times is not None:
+            data["cpu"] = (cpu_times[0] - self.cpu_times[0]) / max(cpu_times[1] - self.cpu_times[1], 0.001)
+        self.cpu_times = cpu_times
+
+    def fetch(self):
+        runner = runners.locust_runner
+        url = "http://{}:{}/budget?client_id={}".format(
+            self.master_web_host or runner.master_host,
+            self.master_web_port,
+            runner.client_id
+        )
+
+        try:
+            rps = json.loads(urlopen(url, timeout=self.interval).read().decode())["rps"]
+        except Exception as e:
+            self.logger.warning("Couldn't fetch the requests/sec budget from %s: %s", url, e)
+            return
+
+        if rps is not None and rps != self.rps:
+            self.set_rps(rps)
+
+    def set_rps(self, rps):
+        self.logger.info("Requests/sec budget: %.1f", rps)
+        self.rps = rps
+        for schedule, iterations_per_request in self.schedules:
+            schedule.set_rate(rps * iterations_per_request)
+
+    def run(self):
+        while True:
+            self.fetch()
+            gevent.sleep(self.interval)
+
+    def start(self, **kwargs):
+        runner = runners.locust_runner
+        if isinstance(runner, runners.SlaveLocustRunner):
+            if self.greenlet is None:
+                self.greenlet = gevent.spawn(self.run)
+        elif not isinstance(runner, runners.MasterLocustRunner) and self.rps is None:
+            # A local run gets the whole budget
+            self.set_rps(self.local_rps)
+
+    def install(self):
+        """ Hook into Locust's events """
+
+        events.report_to_master += self.on_report_to_master
+        events.locust_start_hatching += self.start
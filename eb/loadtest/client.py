@@ -0,0 +1,276 @@
+# coding=utf-8
+
+# HTTP client backends for the Locust slaves
+#
+# * "requests": Locust's default HttpLocust, based on python-requests/urllib3
+# * "fasthttp": Locust's FastHttpLocust, based on geventhttpclient, which
+#   needs considerably less CPU per request
+#
+# Both backends are driven through the same calls (see `request()`), and
+# report successes and failures to Locust's statistics in the same way.
+
+from locust import HttpLocust
+from locust.clients import HttpSession
+
+BACKENDS = ("requests", "fasthttp")
+
+FORM_HEADERS = {"Content-Type": "application/x-www-form-urlencoded"}
+
+# Objects notified around each request, with `begin()` before it, and
+# `end(name)` once it's done (or failed with an exception): the phase timer (see `loadtest/phases.py`) and
+# the connection statistics (see `loadtest/connections.py`)
+request_hooks = []
+
+# fasthttp's response type for streamed bodies, see `streamed_response_type()`
+_streamed_response_type = None
+
+
+def locust_class(backend):
+    """ Return the Locust base class for an HTTP client backend """
+
+    if backend == "requests":
+        return HttpLocust
+
+    if backend == "fasthttp":
+        # Only import geventhttpclient when the backend is used
+        from locust.contrib.fasthttp import FastHttpLocust
+        return FastHttpLocust
+
+    raise ValueError(
+        "Unknown HTTP client backend '{}', expected one of: {}".format(
+            backend,
+            ", ".join(BACKENDS)
+        )
+    )
+
+
+def new_session(locust):
+    """ A new HTTP session for a Locust instance, as its backend's Locust class creates it """
+
+    if isinstance(locust, HttpLocust):
+        session = HttpSession(base_url=locust.host)
+        session.trust_env = locust.trust_env
+        return session
+
+    from locust.contrib.fasthttp import FastHttpSession
+    return FastHttpSession(base_url=locust.host)
+
+
+def request(client, method, url, name, data=None, headers=None, mode=None):
+    """ Send a request with either backend, and report it to Locust's statistics
+
+    `mode` is the step's ResponseMode (see `loadtest/responses.py`), None
+    downloads the whole body. Responses are reported as:
+    * success: HTTP status < 400 (after redirects)
+    * failure "HTTP <status>": HTTP status >= 400
+    * failure <exception>: connection errors, timeouts, ... (status code 0)
+    * failure <check>: the body fails the checks of the response mode
+
+    """
+
+    hooks = request_hooks
+    for hook in hooks:
+        hook.begin()
+
+    streamed = mode is not None and mode.streamed
+    fasthttp = streamed and hasattr(client, "cookiejar")
+    if fasthttp:
+        client.client.response_type = streamed_response_type()
+
+    try:
+        response = client.request(
+            method,
+            url,
+            name=name,
+            data=data,
+            headers=headers,
+            catch_response=True,
+            stream=streamed
+        )
+    finally:
+        if fasthttp:
+            # Back to LocustUserAgent's response type
+            del client.client.response_type
+
+        # Also when the client raises, so the hooks don't keep the greenlet's request
+        for hook in hooks:
+            hook.end(name)
+
+    with response:
+        status_code = response.status_code
+        error = None
+        if status_code and streamed:
+            error = mode.consume(response)
+        elif status_code and mode is not None:
+            error = mode.check(response.content)
+
+        if not status_code:
+            response.failure(response.error)
+        elif status_code >= 400:
+            response.failure("HTTP {}".format(status_code))
+        elif error is not None:
+            response.failure(error)
+        else:
+            response.success()
+
+    return response
+
+
+def streamed_response_type():
+    """ fasthttp's response type which leaves the body on the socket, for `read_body()`
+
+    Locust reads the whole body of fasthttp's responses as soon as they
+    arrive, even when streamed; this one reports an empty body instead.
+
+    """
+
+    global _streamed_response_type
+
+    if _streamed_response_type is None:
+        from locust.contrib.fasthttp import FastResponse
+
+        class StreamedResponse(FastResponse):
+            @property
+            def content(self):
+                return b""
+
+        _streamed_response_type = StreamedResponse
+
+    return _streamed_response_type
+
+
+def read_body(response, size):
+    """ Up to `size` bytes of a streamed response's body as sent (not decoded), b"" at its end, for either backend """
+
+    if hasattr(response, "raw"):
+        return response.raw.read(size, decode_content=False)
+
+    return response._response.read(size)
+
+
+def release_body(response, complete=True):
+    """ Release the connection of a streamed response, for either backend
+
+    The connection is kept alive once the body was read completely, and
+    closed otherwise.
+
+    """
+
+    if hasattr(response, "raw"):
+        if complete:
+            response.raw.release_conn()
+        else:
+            response.close()
+    else:
+        # geventhttpclient closes the connections of incomplete responses
+        response._response.release()
+
+
+def set_content(response, content):
+    """ Set the content of a streamed response (its decoded prefix), for either backend """
+
+    if hasattr(response, "raw"):
+        response._content = content
+        response._content_consumed = True
+    else:
+        response._cached_content = content
+
+
+def add_download(response, seconds, size):
+    """ Count the download of a streamed response's body in the response time and size Locust reports """
+
+    meta = response.locust_request_meta
+    meta["response_time"] += seconds * 1000
+    meta["content_size"] = size
+
+
+def cookies(client):
+    """ Return the cookie jar of a client's session, for either backend """
+
+    if hasattr(client, "cookiejar"):
+        return client.cookiejar
+
+    return client.cookies
+
+
+def new_pool(client, size, block=False):
+    """ A new connection pool for a client, with at most `size` connections per host, for either backend
+
+    With `block`, requests wait for a free connection at the limit; otherwise
+    (requests only) extra connections are opened, and closed after use.
+
+    """
+
+    if hasattr(client, "cookiejar"):
+        # fasthttp: geventhttpclient's pools per host always block at their
+        # concurrency, keep the session's other options (timeouts, TLS)
+        pool = client.client.clientpool
+        return type(pool)(**dict(pool.client_args, concurrency=size))
+
+    from requests.adapters import HTTPAdapter
+    return HTTPAdapter(pool_maxsize=size, pool_block=block)
+
+
+def use_pool(client, pool):
+    """ Send a client's requests through `pool` (see `new_pool()`), for either backend """
+
+    if hasattr(client, "cookiejar"):
+        client.client.clientpool = pool
+    else:
+        client.mount("https://", pool)
+        client.mount("http://", pool)
+
+
+def close_connections(client):
+    """ Close a client's connections, its next requests open new ones, for either backend """
+
+    if hasattr(client, "cookiejar"):
+        # A closed geventhttpclient pool can't be used again
+        pool = client.client.clientpool
+        pool.close()
+        client.client.clientpool = type(pool)(**pool.client_args)
+    else:
+        client.close()
+
+
+def pool_usage(client, seen=None):
+    """ (active, idle) connections in a client's connection pools, for either backend
+
+    Connections in use by a request are active, connections kept alive for
+    the next request are idle. Pools shared by clients (see
+    `loadtest/connections.py`) count once per `seen` set.
+
+    """
+
+    active = idle = 0
+    seen = set() if seen is None else seen
+
+    if hasattr(client, "cookiejar"):
+        # fasthttp: geventhttpclient's pool per host, a semaphore with the
+        # pool's free slots and a queue of idle sockets
+        if id(client.client.clientpool) in seen:
+            return active, idle
+        seen.add(id(client.client.clientpool))
+        for http_client in client.client.clientpool.clients.values():
+            pool = http_client._connection_pool
+            active += pool.size - pool._semaphore.counter
+            idle += pool._socket_queue.qsize()
+
+        return active, idle
+
+    # requests: urllib3's pool per host, a queue of maxsize slots which holds
+    # the idle connections, and None for the slots without a connection
+    for adapter in client.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            queue = pools[key].pool
+            if queue is None:
+                continue
+            connections = list(queue.queue)
+            active += queue.maxsize - len(connections)
+            idle += sum(1 for connection in connections if connection is not None)
+
+    return active, idle
@@ -0,0 +1,315 @@
+# coding=utf-8
+
+# Compact slave reports
+#
+# Every 3 seconds, each slave reports Locust's statistics of every request
+# name with requests since its previous report: the name and method, a dozen
+# named fields, and dicts of response times and requests per second, plus the
+# errors with their (long) names and messages. Most of these strings, and
+# all of the field names, are the same in every report. The compact format
+# (LOCUST_COMPACT_REPORTS=1) replaces them with:
+#
+# * interned request names and errors: a name or error is defined once, with
+#   a small ID which later reports refer to. The master acknowledges the
+#   definitions (a "compact_ack" message with the number of IDs it knows),
+#   and the slave sends them again in every report until it does. A master
+#   which gets an unknown ID (eg. restarted) holds the entry back, and asks
+#   for the definitions again
+# * positional fields instead of named ones, and no "Aggregated" entry (the
+#   master adds up the entries)
+# * response times and requests per second as flat lists of delta-encoded
+#   keys and counts, mostly small integers which msgpack packs into a byte
+#
+# Locust's reports are already deltas since the previous report (the slave
+# resets its statistics when reporting). On the master, the compact report is
+# expanded into Locust's format before Locust and the other listeners see it,
+# so slaves with and without the compact format can report to the same
+# master. Slaves report in Locust's format, offering the compact one, until
+# the master acknowledges it: a master without this module never does.
+
+from locust import events, runners, stats
+from locust.rpc import Message, rpc
+from locust.stats import StatsEntry
+
+VERSION = 1
+
+# Message from the master: the compact format's version, and the number of
+# name and error IDs it knows
+ACK = "compact_ack"
+
+# Fields of an entry, after its name ID
+FIELDS = (
+    "num_requests",
+    "num_none_requests",
+    "num_failures",
+    "total_response_time",
+    "max_response_time",
+    "min_response_time",
+    "total_content_length",
+    "last_request_timestamp",
+    "start_time",
+)
+
+
+def encode_counts(counts, base=0):
+    """ {key: count} as [key - base, count, key - previous key, count, ...], by key """
+
+    flat = []
+    previous = base
+    for key in sorted(counts):
+        flat.append(key - previous)
+        flat.append(counts[key])
+        previous = key
+
+    return flat
+
+
+def decode_counts(flat, base=0):
+    counts = {}
+    key = base
+    for index in range(0, len(flat), 2):
+        key += flat[index]
+        counts[key] = flat[index + 1]
+
+    return counts
+
+
+class ReportEncoder(object):
+    """ Turn a slave's reports into compact ones, interning names and errors """
+
+    def __init__(self):
+        # Whether the master reads compact reports, once it acknowledged them
+        self.accepted = False
+        # {key: ID}, and the definition of every ID
+        self.names = {}
+        self.errors = {}
+        self.name_definitions = []
+        self.error_definitions = []
+        # IDs known to the master: all IDs below
+        self.acked_names = 0
+        self.acked_errors = 0
+
+    def intern(self, table, definitions, key, definition):
+        id = table.get(key)
+        if id is None:
+            id = table[key] = len(definitions)
+            definitions.append([id] + definition)
+
+        return id
+
+    def encode(self, data):
+        """ Replace Locust's statistics in `data` with the compact report, once the master accepted it """
+
+        if not self.accepted:
+            data["compact_offer"] = VERSION
+            return
+
+        base = int(min([entry["start_time"] for entry in data["stats"]] or [0]))
+
+        entries = []
+        for entry in data["stats"]:
+            id = self.intern(
+                self.names,
+                self.name_definitions,
+                (entry["name"], entry["method"]),
+                [entry["name"], entry["method"]]
+            )
+            entries.append(
+                [id] + [entry[field] for field in FIELDS] + [
+                    encode_counts(entry["response_times"]),
+                    encode_counts(entry["num_reqs_per_sec"], base),
+                    encode_counts(entry["num_fail_per_sec"], base),
+                ]
+            )
+
+        errors = []
+        for key, error in data["errors"].items():
+            errors.append(self.intern(
+                self.errors,
+                self.error_definitions,
+                key,
+                [key, error["method"], error["name"], error["error"]]
+            ))
+            errors.append(error["occurrences"])
+
+        data["compact"] = [
+            VERSION,
+            base,
+            self.name_definitions[self.acked_names:],
+            self.error_definitions[self.acked_errors:],
+            entries,
+            errors,
+        ]
+        # Locust's format without requests
+        data["stats"] = []
+        data["stats_total"] = dict(EMPTY_TOTAL, start_time=data["stats_total"]["start_time"])
+        data["errors"] = {}
+
+    def on_ack(self, ack):
+        """ The master reads compact reports, and knows the IDs below the acknowledged ones """
+
+        if ack.get("version") != VERSION:
+            return
+
+        self.accepted = True
+        # Fewer after a restart of the master: those are sent again
+        self.acked_names = min(ack["names"], len(self.name_definitions))
+        self.acked_errors = min(ack["errors"], len(self.error_definitions))
+
+    def on_report_to_master(self, client_id, data):
+        self.encode(data)
+
+    def intercept(self):
+        """ Handle the master's acknowledgements, ahead of Locust's slave runner """
+
+        client_recv = rpc.Client.recv
+        encoder = self
+
+        def recv(socket):
+            while True:
+                msg = client_recv(socket)
+                if msg.type != ACK:
+                    return msg
+                encoder.on_ack(msg.data)
+
+        rpc.Client.recv = recv
+
+    def install(self):
+        """ Hook into Locust's events, after Locust's own statistics (slave) """
+
+        self.intercept()
+        events.report_to_master += self.on_report_to_master
+
+
+def send_ack(client_id, ack):
+    """ Send an acknowledgement to a slave (master) """
+
+    runners.locust_runner.server.send_to_client(Message(ACK, ack, client_id))
+
+
+def known(table):
+    """ Number of IDs known, from 0 up to the first missing one """
+
+    count = 0
+    while count in table:
+        count += 1
+
+    return count
+
+
+class ReportDecoder(object):
+    """ Expand compact reports into Locust's format, per slave """
+
+    def __init__(self, logger, send=send_ack):
+        self.logger = logger
+        # Sends an acknowledgement to a slave: send(client ID, ack)
+        self.send = send
+        # {client ID: (names, errors)}
+        self.tables = {}
+        # {client ID: (entries, errors)} with IDs not defined yet, held back
+        # until they are: [(base, entry)] and [(ID, occurrences)]
+        self.pending = {}
+
+    def acknowledge(self, client_id):
+        names, errors = self.tables.setdefault(client_id, ({}, {}))
+        self.send(client_id, {"version": VERSION, "names": known(names), "errors": known(errors)})
+
+    def decode(self, client_id, data):
+        """ Replace the compact report in `data` with Locust's statistics """
+
+        offer = data.pop("compact_offer", None)
+        compact = data.pop("compact", None)
+        if compact is None:
+            if offer == VERSION:
+                self.acknowledge(client_id)
+            return
+
+        version, base, name_definitions, error_definitions, entries, errors = compact
+        if version != VERSION:
+            self.logger.warning("Discarded compact report version %s from %s", version, client_id)
+            return
+
+        names, error_table = self.tables.setdefault(client_id, ({}, {}))
+        for definition in name_definitions:
+            names[definition[0]] = definition[1:]
+        for definition in error_definitions:
+            error_table[definition[0]] = definition[1:]
+
+        # Entries held back, and this report's
+        pending_entries, pending_errors = self.pending.pop(client_id, ([], []))
+        entries = pending_entries + [(base, entry) for entry in entries]
+        errors = pending_errors + [(errors[index], errors[index + 1]) for index in range(0, len(errors), 2)]
+        held_entries = []
+        held_errors = []
+
+        total = StatsEntry(None, "Aggregated", None)
+        total.start_time = data["stats_total"]["start_time"]
+        data["stats"] = []
+        # {(name, method): index in data["stats"]}, held back entries may repeat a name
+        indexes = {}
+        for base, entry in entries:
+            if entry[0] not in names:
+                held_entries.append((base, entry))
+                continue
+
+            name, method = names[entry[0]]
+            serialized = {"name": name, "method": method}
+            for index, field in enumerate(FIELDS, 1):
+                serialized[field] = entry[index]
+            serialized["response_times"] = decode_counts(entry[-3])
+            serialized["num_reqs_per_sec"] = decode_counts(entry[-2], base)
+            serialized["num_fail_per_sec"] = decode_counts(entry[-1], base)
+            total.extend(StatsEntry.unserialize(serialized))
+
+            index = indexes.get((name, method))
+            if index is None:
+                indexes[(name, method)] = len(data["stats"])
+                data["stats"].append(serialized)
+            else:
+                merged = StatsEntry.unserialize(data["stats"][index])
+                merged.extend(StatsEntry.unserialize(serialized))
+                data["stats"][index] = merged.serialize()
+
+        data["stats_total"] = total.serialize()
+
+        data["errors"] = {}
+        for id, occurrences in errors:
+            if id not in error_table:
+                held_errors.append((id, occurrences))
+                continue
+
+            key, method, name, error = error_table[id]
+            if key in data["errors"]:
+                data["errors"][key]["occurrences"] += occurrences
+            else:
+                data["errors"][key] = {"method": method, "name": name, "error": error, "occurrences": occurrences}
+
+        if held_entries or held_errors:
+            if not pending_entries and not pending_errors:
+                self.logger.info("Holding back statistics with unknown names from %s, until it defines them", client_id)
+            self.pending[client_id] = (held_entries, held_errors)
+
+        if name_definitions or error_definitions or held_entries or held_errors:
+            self.acknowledge(client_id)
+
+    def forget(self, client_id):
+        self.tables.pop(client_id, None)
+        self.pending.pop(client_id, None)
+
+    def on_slave_report(self, client_id, data):
+        self.decode(client_id, data)
+
+    def install(self):
+        """ Hook into Locust's events, ahead of Locust's own statistics (master)
+
+        Install before any other listener of slave reports.
+
+        """
+
+        events.slave_report -= stats.on_slave_report
+        events.slave_report += self.on_slave_report
+        events.slave_report += stats.on_slave_report
+
+
+# Locust's "Aggregated" entry of a report without requests
+EMPTY_TOTAL = StatsEntry(None, "Aggregated", None).serialize()
@@ -0,0 +1,270 @@
+# coding=utf-8
+
+# Connection policies, DNS cache and connection statistics of the simulated users
+#
+# How simulated users hold their connections shapes the load as much as the
+# request rate: a browser keeps its connections alive for a while, a proxy in
+# front of many users shares a few, and a fresh visitor opens new ones. With
+# LOCUST_CONNECTION_POLICY:
+#
+# * user (default): every simulated user keeps its own connections alive,
+#   Locust's behavior
+# * shared: all simulated users of a slave share one connection pool (cookies
+#   stay per user); its size caps the slave's connections per host, and
+#   requests wait for a free connection at the cap
+# * iteration: every simulated user closes its connections at the start of
+#   each iteration of its sequence, so every iteration opens new ones
+#
+# LOCUST_POOL_SIZE sets the connections per host of each pool (default: 10
+# per user, 100 for the shared pool). See `loadtest/client.py` for the pools
+# of both HTTP client backends.
+#
+# With LOCUST_IDLE_RELEASE, simulated users (but for the shared policy)
+# close their connections before waits of at least that many seconds, like
+# browsers and servers drop idle keep-alive connections, rather than holding
+# a socket and its buffers through every think time.
+#
+# With LOCUST_DNS_CACHE_TTL, name resolutions (getaddrinfo) are cached for
+# that many seconds per slave, and concurrent lookups of the same name wait
+# for the first one, instead of every new connection resolving the target
+# again. Failed lookups aren't cached.
+#
+# With LOCUST_CONNECTION_STATS=1, every slave counts, per request name, the
+# requests which opened a new connection and those which reused one
+# (through a hook on gevent's sockets' connect, see `hook()`). The counts and
+# the DNS cache's hits and misses are sent with the reports to the master
+# (through aggregators too), which serves the totals at /stats/connections
+# (JSON), and adds them to the web UI's statistics (as "connections" of
+# every row); the master merges the slaves' counts regardless.
+
+from gevent import getcurrent
+from gevent.event import AsyncResult
+from locust import events
+from loadtest import client, resets
+import gevent.socket
+import socket
+import time
+
+POLICIES = ("user", "shared", "iteration")
+
+# Connections per host of a pool, when LOCUST_POOL_SIZE isn't set
+POOL_SIZE = 10
+SHARED_POOL_SIZE = 100
+
+
+class ConnectionPolicy(object):
+    """ Set up the connection pools of the simulated users' HTTP clients """
+
+    def __init__(self, policy="user", pool_size=0, idle_release=0):
+        if policy not in POLICIES:
+            raise ValueError(
+                "Unknown connection policy '{}', expected one of: {}".format(policy, ", ".join(POLICIES))
+            )
+
+        self.policy = policy
+        self.pool_size = pool_size
+        self.idle_release = idle_release
+        # The pool of the shared policy, created with the first client
+        self.shared = None
+
+    def configure(self, http_client):
+        """ Set up a new simulated user's HTTP client """
+
+        if self.policy == "shared":
+            if self.shared is None:
+                self.shared = client.new_pool(http_client, self.pool_size or SHARED_POOL_SIZE, block=True)
+            client.use_pool(http_client, self.shared)
+        elif self.pool_size and self.pool_size != POOL_SIZE:
+            client.use_pool(http_client, client.new_pool(http_client, self.pool_size))
+
+    def next_iteration(self, http_client):
+        """ Called at the start of every iteration of a simulated user's sequence """
+
+        if self.policy == "iteration":
+            client.close_connections(http_client)
+
+    def release_idle(self, http_client, seconds):
+        """ Called before a simulated user waits `seconds`, returns whether its connections were closed """
+
+        if not self.idle_release or seconds < self.idle_release or self.policy == "shared":
+            return False
+
+        client.close_connections(http_client)
+
+        return True
+
+
+class DnsCache(object):
+    """ Cache the results of getaddrinfo() for `ttl` seconds """
+
+    def __init__(self, ttl, max_entries=1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # {getaddrinfo arguments: (expiry, result)}
+        self.entries = {}
+        # {getaddrinfo arguments: AsyncResult} of the lookups in progress
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+
+    def cached(self, getaddrinfo):
+        """ Wrap `getaddrinfo` with the cache """
+
+        def wrapper(*args, **kwargs):
+            key = (args, tuple(sorted(kwargs.items())))
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self.hits += 1
+                return entry[1]
+
+            pending = self.pending.get(key)
+            if pending is not None:
+                self.hits += 1
+                return pending.get()
+
+            self.misses += 1
+            pending = self.pending[key] = AsyncResult()
+            try:
+                result = getaddrinfo(*args, **kwargs)
+            except Exception as e:
+                pending.set_exception(e)
+                raise
+            finally:
+                del self.pending[key]
+
+            if len(self.entries) >= self.max_entries:
+                self.entries = {}
+            self.entries[key] = (time.monotonic() + self.ttl, result)
+            pending.set(result)
+
+            return result
+
+        return wrapper
+
+    def install(self):
+        """ Cache both `socket.getaddrinfo` (urllib3) and gevent's (geventhttpclient) """
+
+        gevent.socket.getaddrinfo = self.cached(gevent.socket.getaddrinfo)
+        socket.getaddrinfo = self.cached(socket.getaddrinfo)
+
+
+class ConnectionStats(object):
+    """ Requests which opened a new connection or reused one, per request name, and DNS cache hits """
+
+    def __init__(self, dns_cache=None):
+        self.dns_cache = dns_cache
+        # New connections of the requests in progress, per greenlet
+        self.active = {}
+        # {name: [opened, reused]}
+        self.requests = {}
+        # [hits, misses] of the DNS cache, and the counts already taken from it
+        self.dns = [0, 0]
+        self.dns_taken = (0, 0)
+
+    def begin(self):
+        self.active[getcurrent()] = 0
+
+    def end(self, name):
+        opened = self.active.pop(getcurrent(), None)
+        if opened is None:
+            return
+
+        counts = self.requests.get(name)
+        if counts is None:
+            counts = self.requests[name] = [0, 0]
+        counts[0 if opened else 1] += 1
+
+    def counted(self, connect):
+        """ Wrap a socket's `connect`, counting the new connections of the greenlet's request """
+
+        active = self.active
+
+        def wrapper(*args, **kwargs):
+            greenlet = getcurrent()
+            if greenlet in active:
+                active[greenlet] += 1
+
+            return connect(*args, **kwargs)
+
+        return wrapper
+
+    def take_dns(self):
+        """ Add the DNS cache's hits and misses since the last call """
+
+        if self.dns_cache is None:
+            return
+
+        hits, misses = self.dns_cache.hits, self.dns_cache.misses
+        self.dns[0] += hits - self.dns_taken[0]
+        self.dns[1] += misses - self.dns_taken[1]
+        self.dns_taken = (hits, misses)
+
+    def on_report_to_master(self, client_id, data):
+        self.take_dns()
+        if self.requests or any(self.dns):
+            data["connections"] = {"requests": self.requests, "dns": self.dns}
+        self.requests = {}
+        self.dns = [0, 0]
+
+    def on_slave_report(self, client_id, data):
+        connections = data.get("connections")
+        if connections is None:
+            return
+
+        for name, (opened, reused) in connections["requests"].items():
+            counts = self.requests.get(name)
+            if counts is None:
+                counts = self.requests[name] = [0, 0]
+            counts[0] += opened
+            counts[1] += reused
+        self.dns[0] += connections["dns"][0]
+        self.dns[1] += connections["dns"][1]
+
+    def reset(self):
+        self.take_dns()
+        self.requests = {}
+        self.dns = [0, 0]
+
+    def totals(self):
+        """ {"requests": {name: {"opened": ..., "reused": ...}}, "dns": {"hits": ..., "misses": ...}} """
+
+        self.take_dns()
+
+        return {
+            "requests": {
+                name: {"opened": opened, "reused": reused}
+                for name, (opened, reused) in sorted(self.requests.items())
+            },
+            "dns": {"hits": self.dns[0], "misses": self.dns[1]},
+        }
+
+    def annotate(self, report):
+        """ Add the connections opened and reused to the web UI's statistics (see `loadtest/snapshot.py`) """
+
+        for row in report.get("stats", []):
+            counts = self.requests.get(row["name"])
+            if counts is not None:
+                row["connections"] = {"opened": counts[0], "reused": counts[1]}
+
+    def hook(self):
+        """ Count the connections of the requests, through gevent's sockets and `loadtest.client.request()` """
+
+        gevent.socket.socket.connect = self.counted(gevent.socket.socket.connect)
+        client.request_hooks.append(self)
+
+    def install(self, snapshot=None):
+        """ Hook into Locust's events, and serve /stats/connections """
+
+        events.report_to_master += self.on_report_to_master
+        events.slave_report += self.on_slave_report
+        resets.install()
+        resets.reset_stats += self.reset
+        if snapshot is not None:
+            snapshot.extensions.append(self.annotate)
+
+        from locust.web import app
+        from flask import jsonify
+
+        @app.route("/stats/connections")
+        def connections():
+            return jsonify(self.totals())
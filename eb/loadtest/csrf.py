@@ -0,0 +1,102 @@
+# coding=utf-8
+
+# CSRF token handling for POST requests
+#
+# Web frameworks like Rails put the CSRF token in the page's <head>:
+#
+#   <meta name="csrf-param" content="authenticity_token" />
+#   <meta name="csrf-token" content="..." />
+#
+# Instead of fetching and fully parsing a page before every POST, tokens are:
+# * extracted by scanning only the <head> for these meta tags (no DOM is built)
+# * cached per simulated user, for a limited time (TTL)
+# * optionally harvested from pages the TaskSequence already fetched
+# * invalidated when the web application rejects a token (HTTP 403 or 419)
+
+from loadtest import client
+from loadtest.payload import encode
+import re
+import time
+
+# Responses indicating an invalid or expired CSRF token
+INVALID_TOKEN_STATUS_CODES = (403, 419)
+
+HEADER = "X-CSRF-Token"
+
+_head_end = re.compile(rb"</head\s*>|<body[\s>]", re.IGNORECASE)
+_meta_tag = re.compile(rb"<meta\s[^>]*csrf-[^>]*>", re.IGNORECASE)
+_name_attribute = re.compile(rb"""\bname\s*=\s*["']?csrf-(param|token)\b""", re.IGNORECASE)
+_content_attribute = re.compile(rb"""\bcontent\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>]+))""", re.IGNORECASE)
+
+
+def extract_token(html):
+    """ Extract the CSRF param and token from the <head> of an HTML page
+
+    Returns a (param, token) tuple of strings, or None when the page has no
+    csrf-param and csrf-token meta tags.
+
+    """
+
+    if not html:
+        return None
+
+    head_end = _head_end.search(html)
+    head = html[:head_end.start()] if head_end else html
+
+    values = {}
+    for tag in _meta_tag.findall(head):
+        name = _name_attribute.search(tag)
+        content = _content_attribute.search(tag)
+        if name and content:
+            values[name.group(1).lower()] = next(group for group in content.groups() if group is not None)
+
+    if b"param" not in values or b"token" not in values:
+        return None
+
+    return values[b"param"].decode(), values[b"token"].decode()
+
+
+class CsrfCache(object):
+    """ The CSRF token of a single simulated user's session """
+
+    __slots__ = ("ttl", "param", "token", "field", "headers", "expires")
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.invalidate()
+
+    def get(self):
+        """ Return the cached (param, token) tuple, or None when missing or expired """
+
+        if self.token is None or time.time() >= self.expires:
+            return None
+
+        return self.param, self.token
+
+    def update(self, response):
+        """ Cache the token found in a response, returns the (param, token) tuple or None """
+
+        csrf = extract_token(response.content)
+        if csrf is not None:
+            self.param, self.token = csrf
+            # Urlencoded form field, appended to POST bodies
+            self.field = encode(self.param) + b"=" + encode(self.token)
+            self.headers = dict(client.FORM_HEADERS, **{HEADER: self.token})
+            self.expires = time.time() + self.ttl
+
+        return csrf
+
+    def check(self, response):
+        """ Invalidate the token when a response indicates it was rejected """
+
+        if response.status_code in INVALID_TOKEN_STATUS_CODES:
+            self.invalidate()
+
+    def invalidate(self):
+        """ Drop the cached token """
+
+        self.param = None
+        self.token = None
+        self.field = None
+        self.headers = client.FORM_HEADERS
+        self.expires = 0
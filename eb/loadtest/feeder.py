@@ -0,0 +1,350 @@
+# coding=utf-8
+
+# Test data feeder: rows of a CSV or JSONL dataset for the payload templates
+#
+# With LOCUST_FEEDER_FILE set, every simulated user takes a row of the
+# dataset (or a new row every iteration, LOCUST_FEEDER_SCOPE=iteration), eg.
+# the credentials of pre-registered accounts:
+#
+#   email,password,name
+#   jane@example.org,s3cret,Jane Doe
+#
+# Columns named after a per-user template value ({user}, {email},
+# {password}, {name}, {card_number}) replace it, and every column is
+# available as {data.<column>} (see `loadtest/payload.py`). CSV files start
+# with a header of column names; JSONL files hold an object per line, with
+# the columns of the first one. Either way, a row takes a single line. The
+# scenario's {data.<column>} placeholders are checked against the columns
+# when the Locustfile loads.
+#
+# The rows are split over the slaves in blocks (LOCUST_FEEDER_BLOCK_SIZE
+# rows): each block is leased to a single slave by the master (at
+# /feeder?client_id=..., like the requests/sec budget), so no two simulated
+# users of the cluster share a row, however many slaves there are or join.
+# Policies (LOCUST_FEEDER_POLICY):
+#
+# * sequential: rows in order, the dataset starts over once it's used up
+# * random: rows in a shuffled order: the master shuffles the order of the
+#   blocks (8 bytes per block), and the slaves the rows within each block
+#   they lease; the blocks are shuffled again once the dataset is used up
+# * unique: rows in order, each used once: simulated users stop once the
+#   dataset is used up
+#
+# Rows are read on demand from memory maps of the dataset and of its line
+# index (<file>.idx, the offset of every row as 8 bytes), so neither the
+# startup time nor the memory of the slaves grows with the dataset (mapped
+# pages are shared with the page cache, and with the other slaves of an
+# instance). The index is built once per instance, by the supervisor (see
+# `loadtest/supervisor.py`) before the slaves start, or on first use; build
+# it ahead of a test with:
+#
+#   python3 -m loadtest.feeder index accounts.csv
+
+from locust import runners
+from locust.exception import StopLocust
+from loadtest.payload import USER_FIELDS, encode
+from array import array
+from urllib.request import urlopen
+import argparse
+import csv
+import gevent.lock
+import json
+import mmap
+import os
+import random
+import sys
+import time
+
+POLICIES = ("sequential", "random", "unique")
+
+SCOPES = ("user", "iteration")
+
+# Rows per block leased to a slave
+BLOCK_SIZE = 1000
+
+INDEX_SUFFIX = ".idx"
+
+# Offsets written to the index at once, while building it
+INDEX_CHUNK = 65536
+
+
+class FeederError(Exception):
+    """ Raised when a dataset can't be read, or rows can't be leased """
+
+
+def dataset_format(path):
+    """ "csv" or "jsonl", by the dataset's file extension """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".jsonl", ".ndjson"):
+        return "jsonl"
+
+    raise FeederError("Unknown dataset format '{}', expected .csv, .jsonl or .ndjson".format(path))
+
+
+def index_stale(path):
+    """ Whether the line index of a dataset is missing, or older than the dataset """
+
+    index_path = path + INDEX_SUFFIX
+
+    return not os.path.exists(index_path) or os.path.getmtime(index_path) < os.path.getmtime(path)
+
+
+def build_index(path):
+    """ Write the line index of a dataset: the offset of every row, blank lines and the CSV header left out
+
+    Written to a temporary file first, so concurrent builds never leave a
+    partial index behind. Returns the number of rows.
+
+    """
+
+    index_path = path + INDEX_SUFFIX
+    temporary = "{}.{}.tmp".format(index_path, os.getpid())
+    rows = 0
+
+    with open(path, "rb") as f, open(temporary, "wb") as out:
+        position = 0
+        if dataset_format(path) == "csv":
+            position = len(f.readline())
+
+        offsets = array("Q")
+        for line in f:
+            if line != b"\n" and line != b"\r\n":
+                offsets.append(position)
+            position += len(line)
+            if len(offsets) >= INDEX_CHUNK:
+                rows += len(offsets)
+                offsets.tofile(out)
+                del offsets[:]
+        rows += len(offsets)
+        offsets.tofile(out)
+
+    os.replace(temporary, index_path)
+
+    return rows
+
+
+def shuffled(count, rng):
+    """ The numbers from 0 up to `count`, in a shuffled order """
+
+    order = array("Q", range(count))
+    rng.shuffle(order)
+
+    return order
+
+
+class Dataset(object):
+    """ The rows of a CSV or JSONL file, read on demand through memory maps of the file and its line index """
+
+    def __init__(self, path):
+        self.path = path
+        self.format = dataset_format(path)
+
+        try:
+            if index_stale(path):
+                build_index(path)
+
+            with open(path, "rb") as f:
+                self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.rows = os.path.getsize(path + INDEX_SUFFIX) // 8
+            if not self.rows:
+                raise FeederError("Dataset '{}' has no rows".format(path))
+            with open(path + INDEX_SUFFIX, "rb") as f:
+                self.index = mmap.mmap(f.fileno(), self.rows * 8, access=mmap.ACCESS_READ)
+        except (OSError, ValueError) as e:
+            raise FeederError("Can't read dataset '{}': {}".format(path, e))
+
+        self.offsets = memoryview(self.index).cast("Q")
+
+        # Column names: the header of a CSV file, the first row's of a JSONL file
+        if self.format == "csv":
+            self.columns = next(csv.reader((self.line(0, header=True),)))
+        else:
+            self.columns = list(self.row(0))
+
+    def line(self, number, header=False):
+        """ A row's line, decoded """
+
+        start = 0 if header else self.offsets[number]
+        end = self.data.find(b"\n", start)
+        if end < 0:
+            end = len(self.data)
+
+        return self.data[start:end].rstrip(b"\r").decode("utf-8")
+
+    def row(self, number):
+        """ {column: value} of a row, all values as strings """
+
+        line = self.line(number)
+        if self.format == "csv":
+            return dict(zip(self.columns, next(csv.reader((line,)))))
+
+        return {
+            column: "" if value is None else value if isinstance(value, str) else json.dumps(value)
+            for column, value in json.loads(line).items()
+        }
+
+
+class RowLeases(object):
+    """ Blocks of the dataset's rows, each leased to a single slave (master, or a local run) """
+
+    def __init__(self, rows, policy="sequential", block_size=BLOCK_SIZE, seed=None):
+        self.rows = rows
+        self.policy = policy
+        self.block_size = block_size
+        self.blocks = (rows + block_size - 1) // block_size
+        self.rng = random.Random(seed)
+        # Order of the blocks, None in order
+        self.order = shuffled(self.blocks, self.rng) if policy == "random" else None
+        # Blocks leased, over all passes through the dataset
+        self.leased = 0
+        # {client ID: blocks leased}
+        self.slaves = {}
+
+    def lease(self, client_id=None):
+        """ [first row, rows] of the next block, None once a unique dataset is used up """
+
+        position = self.leased % self.blocks
+        if position == 0 and self.leased:
+            if self.policy == "unique":
+                return None
+            if self.policy == "random":
+                self.order = shuffled(self.blocks, self.rng)
+
+        block = position if self.order is None else self.order[position]
+        self.leased += 1
+        self.slaves[client_id] = self.slaves.get(client_id, 0) + 1
+        start = block * self.block_size
+
+        return [start, min(self.block_size, self.rows - start)]
+
+    def status(self):
+        return {
+            "policy": self.policy,
+            "rows": self.rows,
+            "blocks": self.blocks,
+            "leased": self.leased,
+            "passes": self.leased / float(self.blocks),
+            "slaves": self.slaves,
+        }
+
+
+class DataFeeder(object):
+    """ Rows of the dataset for this process' simulated users, from blocks leased from the master """
+
+    def __init__(self, logger, dataset, policy="sequential", scope="user", block_size=BLOCK_SIZE,
+                 master_web_port=9876, master_web_host=None):
+        if policy not in POLICIES:
+            raise FeederError("Unknown feeder policy '{}', expected one of: {}".format(policy, ", ".join(POLICIES)))
+        if scope not in SCOPES:
+            raise FeederError("Unknown feeder scope '{}', expected one of: {}".format(scope, ", ".join(SCOPES)))
+
+        self.logger = logger
+        self.dataset = dataset
+        self.policy = policy
+        # Whether simulated users take a new row every iteration
+        self.per_iteration = scope == "iteration"
+        self.master_web_port = master_web_port
+        # The master's host, when slaves connect through an aggregator
+        self.master_web_host = master_web_host
+        # Served by the master, used directly without one
+        self.leases = RowLeases(dataset.rows, policy, block_size)
+
+        # Current block: [first row, rows], the rows taken, and their order
+        # (None in order)
+        self.block = None
+        self.taken = 0
+        self.order = None
+        self.rng = random.Random()
+        self.exhausted = False
+        # A single lease at a time, the simulated users wait for it
+        self.lock = gevent.lock.Semaphore()
+
+    def lease(self):
+        runner = runners.locust_runner
+        if not isinstance(runner, runners.SlaveLocustRunner):
+            return self.leases.lease()
+
+        url = "http://{}:{}/feeder?client_id={}".format(
+            self.master_web_host or runner.master_host,
+            self.master_web_port,
+            runner.client_id
+        )
+        try:
+            return json.loads(urlopen(url, timeout=10).read().decode())["block"]
+        except Exception as e:
+            raise FeederError("Couldn't lease rows from {}: {}".format(url, e))
+
+    def take(self):
+        """ The next row, as urlencoded template values
+
+        Stops the simulated user once a unique dataset is used up.
+
+        """
+
+        with self.lock:
+            if self.block is None or self.taken >= self.block[1]:
+                block = None if self.exhausted else self.lease()
+                if block is None:
+                    if not self.exhausted:
+                        self.exhausted = True
+                        self.logger.warning("Dataset %s is used up, stopping the simulated users", self.dataset.path)
+                    raise StopLocust()
+                self.block = block
+                self.taken = 0
+                self.order = shuffled(block[1], self.rng) if self.policy == "random" else None
+
+            number = self.block[0] + (self.taken if self.order is None else self.order[self.taken])
+            self.taken += 1
+
+        return self.values(self.dataset.row(number))
+
+    def values(self, row):
+        """ {placeholder: urlencoded value} of a row, empty for the dataset's columns which it lacks """
+
+        values = {"data." + column: b"" for column in self.dataset.columns}
+        values.update(("data." + column, encode(value)) for column, value in row.items())
+        for field in USER_FIELDS:
+            if field in row:
+                values[field] = values["data." + field]
+
+        return values
+
+    def install(self):
+        """ Serve the blocks at /feeder of the master """
+
+        from locust.web import app
+        from flask import jsonify, request
+
+        @app.route("/feeder")
+        def feeder():
+            if "client_id" in request.args:
+                return jsonify({"block": self.leases.lease(request.args["client_id"])})
+
+            return jsonify(self.leases.status())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the line index of a test dataset")
+    parser.add_argument("command", choices=("index",))
+    parser.add_argument("dataset", help="CSV (with a header) or JSONL file")
+    parser.add_argument("--force", action="store_true", help="rebuild a current index")
+    args = parser.parse_args()
+
+    try:
+        if not args.force and not index_stale(args.dataset):
+            print("Index of {} is current".format(args.dataset))
+            return
+
+        start = time.time()
+        rows = build_index(args.dataset)
+    except (OSError, FeederError) as e:
+        sys.exit("Can't index {}: {}".format(args.dataset, e))
+
+    print("Indexed {} rows of {} in {:.1f} s".format(rows, args.dataset, time.time() - start))
+
+
+if __name__ == "__main__":
+    main()
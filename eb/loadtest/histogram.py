@@ -0,0 +1,276 @@
+# coding=utf-8
+
+# High-resolution, mergeable response time histograms
+#
+# Locust 0.13 rounds response times before counting them (to 10 ms above
+# 100 ms, to 100 ms above 1 s), which blurs the percentiles the master shows,
+# eg. p99.9 at high RPS. Instead, every Locust process also keeps an HDR-style
+# log-linear histogram per request name:
+#
+# * response times are counted in microseconds; values below 2 * HALF_BUCKET
+#   each get their own bucket, above that every power of 2 is split into
+#   HALF_BUCKET buckets, so a bucket's midpoint is within 1% of any value in it
+# * fixed memory: an array of BUCKETS counters per request name (up to ~71
+#   minutes, longer response times are counted in the last bucket)
+# * slaves ship the histograms of the last report interval with Locust's
+#   report to the master, compactly encoded per name: a flat list of
+#   (bucket index delta, count) pairs of the non-empty buckets, which msgpack
+#   packs into 1 to 3 bytes per number (Locust 0.13's messages can't carry
+#   raw bytes, they're decoded as UTF-8 on the master)
+# * the master merges them into its totals in O(buckets)
+#
+# The master's percentiles are available at /stats/percentiles (JSON) of the
+# Locust web UI, and are logged when Locust quits. They're cleared along with
+# Locust's statistics (see `loadtest/resets.py`).
+
+from array import array
+from locust import events
+from loadtest import resets
+import logging
+
+HALF_BUCKET = 64
+SUB_BUCKET_BITS = 7  # log2(2 * HALF_BUCKET)
+MAX_VALUE = 2 ** 32 - 1  # microseconds
+BUCKETS = (MAX_VALUE.bit_length() - SUB_BUCKET_BITS + 2) * HALF_BUCKET
+_EMPTY = bytes(8 * BUCKETS)
+
+# Percentiles logged when Locust quits, and served at /stats/percentiles
+PERCENTILES = (0.5, 0.9, 0.99, 0.999, 0.9999)
+
+
+def bucket_index(value):
+    """ The bucket counting `value` (an int, in microseconds) """
+
+    if value > MAX_VALUE:
+        value = MAX_VALUE
+
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    if shift <= 0:
+        return value
+
+    return shift * HALF_BUCKET + (value >> shift)
+
+
+def bucket_range(index):
+    """ The (lowest, highest) value counted in a bucket """
+
+    if index < 2 * HALF_BUCKET:
+        return index, index
+
+    shift = index // HALF_BUCKET - 1
+    lowest = (index - shift * HALF_BUCKET) << shift
+
+    return lowest, lowest + (1 << shift) - 1
+
+
+class Histogram(object):
+    """ Log-linear histogram of response times of a single request name """
+
+    __slots__ = ("counts", "count", "min", "max", "total")
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = array("Q", _EMPTY)
+        self.count = 0
+        self.min = None
+        self.max = 0
+        # Sum of the values, for the mean
+        self.total = 0
+
+    def record(self, value):
+        """ Count a response time, in microseconds """
+
+        value = int(value)
+        self.counts[bucket_index(value)] += 1
+        self.count += 1
+        self.total += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        """ Add the counts of another Histogram """
+
+        counts = self.counts
+        for index, count in enumerate(other.counts):
+            if count:
+                counts[index] += count
+        self._merge_summary(other.count, other.min, other.max, other.total)
+
+    def _merge_summary(self, count, minimum, maximum, total):
+        self.count += count
+        self.total += total
+        if minimum is not None and (self.min is None or minimum < self.min):
+            self.min = minimum
+        if maximum > self.max:
+            self.max = maximum
+
+    def percentile(self, fraction):
+        """ The response time (in microseconds) below which `fraction` of the values fall """
+
+        if not self.count:
+            return 0
+
+        rank = max(1, int(round(fraction * self.count)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                lowest, highest = bucket_range(index)
+                # The bucket's midpoint, within the values actually seen
+                return min(max((lowest + highest) // 2, self.min), self.max)
+
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+    def encode(self):
+        """ Serialize to a flat list of ints, see `merge_encoded()` """
+
+        encoded = [self.count, self.min or 0, self.max, self.total]
+
+        previous = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                encoded.append(index - previous)
+                encoded.append(count)
+                previous = index
+
+        return encoded
+
+    def merge_encoded(self, encoded):
+        """ Add the counts of a list created by `encode()`, without decoding it into a Histogram """
+
+        count, minimum, maximum, total = encoded[:4]
+        self._merge_summary(count, minimum if count else None, maximum, total)
+
+        counts = self.counts
+        index = 0
+        for position in range(4, len(encoded), 2):
+            index += encoded[position]
+            counts[index] += encoded[position + 1]
+
+    @classmethod
+    def decode(cls, encoded):
+        histogram = cls()
+        histogram.merge_encoded(encoded)
+        return histogram
+
+
+class HistogramSet(object):
+    """ A Histogram per request name, hooked into Locust's events
+
+    Locust processes which run simulated users (slaves, or a local run) count
+    their response times; slaves send and reset them with every report. The
+    master merges the reports of its slaves.
+
+    """
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.histograms = {}
+
+    def get(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            histogram = self.histograms[name] = Histogram()
+
+        return histogram
+
+    def record(self, name, response_time):
+        """ Count a response time (in milliseconds, as reported by Locust, None for a request without one) """
+
+        if response_time is None:
+            return
+
+        self.get(name).record(response_time * 1000)
+
+    def on_request(self, request_type, name, response_time, response_length, **kwargs):
+        self.record(name, response_time)
+
+    def on_report_to_master(self, client_id, data):
+        data["histograms"] = {
+            name: histogram.encode()
+            for name, histogram in self.histograms.items()
+            if histogram.count
+        }
+        for histogram in self.histograms.values():
+            if histogram.count:
+                histogram.reset()
+
+    def on_slave_report(self, client_id, data):
+        for name, encoded in data.get("histograms", {}).items():
+            self.get(name).merge_encoded(encoded)
+
+    def reset(self):
+        self.histograms = {}
+
+    def total(self):
+        """ All request names merged into a single Histogram """
+
+        total = Histogram()
+        for histogram in self.histograms.values():
+            total.merge(histogram)
+
+        return total
+
+    def percentiles(self, fractions=PERCENTILES):
+        """ {name: {"count": ..., "min": ..., "p50": ..., ...}}, response times in milliseconds """
+
+        histograms = dict(self.histograms)
+        if histograms:
+            histograms["Aggregated"] = self.total()
+
+        return {
+            name: dict(
+                {
+                    "count": histogram.count,
+                    "min": (histogram.min or 0) / 1000,
+                    "max": histogram.max / 1000,
+                    "mean": histogram.mean() / 1000,
+                },
+                **{
+                    "p{:g}".format(fraction * 100): histogram.percentile(fraction) / 1000
+                    for fraction in fractions
+                }
+            )
+            for name, histogram in sorted(histograms.items())
+            if histogram.count
+        }
+
+    def log_percentiles(self):
+        if not self.logger.isEnabledFor(logging.INFO):
+            return
+
+        for name, values in sorted(self.percentiles().items()):
+            self.logger.info(
+                "%s: %s requests, %s",
+                name,
+                values["count"],
+                ", ".join(
+                    "p{:g} {:.1f} ms".format(fraction * 100, values["p{:g}".format(fraction * 100)])
+                    for fraction in PERCENTILES
+                )
+            )
+
+    def install(self):
+        """ Hook into Locust's request, report, reset and quit events, and the web UI """
+
+        events.request_success += self.on_request
+        events.request_failure += self.on_request
+        events.report_to_master += self.on_report_to_master
+        events.slave_report += self.on_slave_report
+        events.quitting += self.log_percentiles
+        resets.install()
+        resets.reset_stats += self.reset
+
+        from locust.web import app
+        from flask import jsonify
+
+        @app.route("/stats/percentiles")
+        def percentiles():
+            return jsonify(self.percentiles())
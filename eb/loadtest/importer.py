@@ -0,0 +1,664 @@
+# coding=utf-8
+
+# Scenario importer: sequences and weights from access logs or HAR files
+#
+# Instead of recording the sequences of the scenario file by hand, this tool
+# reads production traffic and writes a scenario file (see
+# `loadtest/scenario.py`):
+#
+# * nginx access logs in the "main" log_format (see
+#   `.ebextensions/nginx/nginx.conf`), plain or gzip-compressed
+# * HAR files, as saved by a browser's developer tools (one session each)
+#
+# Requests for static assets and failed requests (HTTP >= 400) are skipped.
+# The other requests are grouped into sessions per client (the first
+# X-Forwarded-For address, or the remote address, and the user agent), which
+# end after `--session-timeout` seconds without requests. Identical sessions
+# (the same requests in the same order, with IDs in the paths and query
+# values ignored) count as one sequence; the most common sequences are
+# written, with weights in proportion to their sessions.
+#
+# Repeated per-user values are parameterized (see `loadtest/payload.py`):
+# the form bodies of HAR files get {email}, {password}, {name}, {user} and
+# {card_number} placeholders, and CSRF tokens are dropped (see
+# `loadtest/csrf.py`). Access logs have no request bodies. IDs in the URLs
+# become {data.<column>} placeholders, named after the path segment ahead
+# of them (eg. /flights/42 is /flights/{data.flights_id}) or the query
+# field, so every simulated user requests its own resources; `--dataset`
+# writes the IDs seen, as a dataset for the feeder (see `loadtest/feeder.py`).
+#
+# Everything is streamed through generators: memory doesn't grow with the
+# size of the logs, but with the number of clients active at once, and the
+# distinct sequences and endpoints (both counted in bounded summaries,
+# `--capacity`). Plain access logs are split into chunks for `--processes`
+# worker processes; sessions which span chunks are cut in two there.
+#
+# The weights are the sessions' shares, ie. the iteration mix: as is for
+# arrival-rate mode (see `loadtest/arrival.py`); for the closed model, solve
+# the weights with the endpoint counts of `--target` (see `loadtest/mix.py`).
+# For example:
+#
+#   python3 -m loadtest.importer access.log.1 access.log.2.gz --processes 4 \
+#       --output scenarios-imported.json --target target-imported.json \
+#       --dataset data-imported.csv
+
+from urllib.parse import parse_qsl, quote_plus, unquote_plus, urlsplit
+import argparse
+import calendar
+import collections
+import csv
+import gzip
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+
+# $remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent
+# "$http_referer" "$http_user_agent" "$http_x_forwarded_for"
+# (nginx escapes the quotes in the values as \x22)
+NGINX_MAIN = re.compile(
+    rb'^(\S+) - \S+ \[([^\]]+)\] "(\S+) (\S+)[^"]*" (\d{3}) \S+ "[^"]*" "([^"]*)" "([^"]*)"'
+)
+
+MONTHS = {
+    name: number + 1
+    for number, name in enumerate((b"Jan", b"Feb", b"Mar", b"Apr", b"May", b"Jun", b"Jul", b"Aug", b"Sep", b"Oct", b"Nov", b"Dec"))
+}
+
+STATIC_EXTENSIONS = (
+    ".css", ".js", ".map", ".png", ".jpg", ".jpeg", ".gif", ".svg", ".ico", ".webp",
+    ".woff", ".woff2", ".ttf", ".eot", ".otf", ".mp4", ".webm", ".txt", ".xml",
+)
+
+# Methods of the scenario file's steps (see `loadtest/scenario.py`, which
+# isn't imported: Locust monkey-patches the worker processes with gevent)
+METHODS = ("GET", "POST")
+
+# Form fields of CSRF tokens, added by the Locustfile itself
+CSRF_FIELDS = ("_token", "authenticity_token", "csrf_token", "csrfmiddlewaretoken", "_csrf")
+
+_identifier = re.compile(r"^(?:[0-9a-fA-F]{16,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$")
+_email = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_digits = re.compile(r"^\d{13,19}$")
+_column = re.compile(r"[^0-9a-z]+")
+
+# URLs whose patterns are remembered
+PATTERN_CACHE_SIZE = 100000
+
+# Prefix of the placeholders of a dataset's columns (see `loadtest/payload.py`)
+DATA_PREFIX = "data."
+
+# A placeholder of a URL template, not preceded by an escaped brace
+_placeholder = re.compile(r"(?<!\{)\{([^{}]+)\}")
+
+
+class LogImportError(Exception):
+    """ Raised when an input can't be imported """
+
+
+def parse_time(value, cache={}):
+    """ Seconds since the epoch of an nginx $time_local, eg. b"10/Oct/2000:13:55:36 -0700" """
+
+    seconds = cache.get(value)
+    if seconds is None:
+        if len(cache) > 10000:
+            cache.clear()
+        offset = (int(value[22:24]) * 3600 + int(value[24:26]) * 60) * (-1 if value[21:22] == b"-" else 1)
+        seconds = cache[value] = calendar.timegm((
+            int(value[7:11]), MONTHS[value[3:6]], int(value[0:2]), int(value[12:14]), int(value[15:17]), int(value[18:20])
+        )) - offset
+
+    return seconds
+
+
+def read_lines(path, start=0, end=None):
+    """ The lines of a (gzip-compressed) file, or of its bytes from `start` up to the line which spans `end` """
+
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as f:
+            for line in f:
+                yield line
+        return
+
+    with open(path, "rb") as f:
+        if start:
+            # The previous chunk reads the line which spans its end
+            f.seek(start - 1)
+            f.readline()
+        position = f.tell()
+        for line in f:
+            if end is not None and position >= end:
+                break
+            position += len(line)
+            yield line
+
+
+def parse_nginx(lines, counter):
+    """ (client, time, method, url, status, body) of each access log line, counting the lines """
+
+    match = NGINX_MAIN.match
+    for line in lines:
+        counter[0] += 1
+        found = match(line)
+        if found is None:
+            continue
+        remote_addr, time_local, method, url, status, user_agent, forwarded_for = found.groups()
+        if forwarded_for and forwarded_for != b"-":
+            remote_addr = forwarded_for.split(b",", 1)[0].strip()
+        yield (
+            remote_addr + b" " + user_agent,
+            parse_time(time_local),
+            method.decode("ascii", "replace"),
+            url.decode("utf-8", "replace"),
+            int(status),
+            None,
+        )
+
+
+def har_entries(f, chunk_size=1 << 20):
+    """ The entries of a HAR file, decoded one at a time """
+
+    decoder = json.JSONDecoder()
+    buffer = ""
+    # Find the start of the entries array
+    while True:
+        chunk = f.read(chunk_size)
+        buffer += chunk
+        found = re.search(r'"entries"\s*:\s*\[', buffer)
+        if found is not None:
+            buffer = buffer[found.end():]
+            break
+        if not chunk:
+            return
+        # Keep enough for a key split between chunks
+        buffer = buffer[-32:]
+
+    while True:
+        buffer = buffer.lstrip(" \t\r\n,")
+        if buffer.startswith("]"):
+            return
+        try:
+            entry, end = decoder.raw_decode(buffer)
+        except ValueError:
+            # Read as much again, so large entries (eg. with response bodies) parse in linear time
+            chunk = f.read(max(chunk_size, len(buffer)))
+            if not chunk:
+                raise LogImportError("Invalid or truncated HAR file")
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield entry
+
+
+def parse_har(path, counter):
+    """ (client, time, method, url, status, body) of each entry of a HAR file: a single session """
+
+    with open(path, encoding="utf-8") as f:
+        for index, entry in enumerate(har_entries(f)):
+            counter[0] += 1
+            request = entry.get("request", {})
+            url = urlsplit(request.get("url", ""))
+            post_data = request.get("postData") or {}
+            body = None
+            if post_data.get("text"):
+                body = (post_data.get("mimeType", ""), post_data["text"])
+            yield (
+                path,
+                index,
+                request.get("method", "GET").upper(),
+                url.path + ("?" + url.query if url.query else ""),
+                entry.get("response", {}).get("status", 0),
+                body,
+            )
+
+
+def keep(requests):
+    """ Skip static assets, failed requests, and methods the scenario file doesn't support """
+
+    for request in requests:
+        method, url, status = request[2], request[3], request[4]
+        if method not in METHODS or not 0 < status < 400:
+            continue
+        path = url.split("?", 1)[0].lower()
+        if path.endswith(STATIC_EXTENSIONS):
+            continue
+        yield request
+
+
+def sessionize(requests, timeout, max_steps):
+    """ Group time-ordered requests into sessions per client, yields each session's (method, URL, body) once it ends """
+
+    # {client: [time of the last request, (method, URL, body) of its requests]}, least recently active first
+    sessions = collections.OrderedDict()
+
+    for request in requests:
+        client, now = request[0], request[1]
+
+        # End the sessions idle for longer than the timeout
+        while sessions:
+            oldest = next(iter(sessions.values()))
+            if now - oldest[0] <= timeout:
+                break
+            yield sessions.popitem(last=False)[1][1]
+
+        session = sessions.get(client)
+        if session is None:
+            session = sessions[client] = [now, []]
+        else:
+            sessions.move_to_end(client)
+        session[0] = now
+        if len(session[1]) < max_steps:
+            session[1].append((request[2], request[3], request[5]))
+
+    for session in sessions.values():
+        yield session[1]
+
+
+def is_id(value):
+    """ Whether a path segment or query value is an ID: a number, a long hex string or a UUID """
+
+    return value.isdigit() or len(value) >= 16 and _identifier.match(value) is not None
+
+
+def pattern(url, cache={}):
+    """ A URL with its IDs and query values left out, eg. "/flights/{n}?from=" for "/flights/42?from=BOS" """
+
+    result = cache.get(url)
+    if result is not None:
+        return result
+
+    path, _, query = url.partition("?")
+    result = "/".join(
+        "{n}" if segment.isdigit() else "{id}" if is_id(segment) else segment
+        for segment in path.split("/")
+    )
+    if query:
+        result += "?" + "&".join(sorted(field.partition("=")[0] + "=" for field in query.split("&") if field))
+
+    if len(cache) >= PATTERN_CACHE_SIZE:
+        cache.clear()
+    cache[url] = result
+
+    return result
+
+
+def luhn(digits):
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        digit = int(digit)
+        if position % 2 == 1:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+
+    return total % 10 == 0
+
+
+def placeholder(key, value):
+    """ The payload placeholder of a form field's value, None to keep the value """
+
+    key = key.lower()
+    if "password" in key:
+        return "{password}"
+    if _email.match(value):
+        return "{email}"
+    if _digits.match(value) and luhn(value):
+        return "{card_number}"
+    if key in ("name", "fullname", "full_name"):
+        return "{name}"
+    if key in ("user", "username", "login"):
+        return "{user}"
+
+    return None
+
+
+def escape(text):
+    """ Escape the braces of a literal template part """
+
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def column(name, columns):
+    """ A dataset column name for `name`, unique among `columns` (which it's added to) """
+
+    base = _column.sub("_", name.lower()).strip("_") or "id"
+    result = base
+    number = 1
+    while result in columns:
+        number += 1
+        result = "{}_{}".format(base, number)
+    columns.add(result)
+
+    return result
+
+
+def parameterize_url(url):
+    """ A URL template of a request's URL, and the (column, value) of its {data.<column>} placeholders
+
+    Eg. ("/flights/{data.flights_id}?from=BOS", (("flights_id", "42"),)) for
+    "/flights/42?from=BOS"; per-user values in the query get their own
+    placeholders (see `placeholder()`).
+
+    """
+
+    path, _, query = url.partition("?")
+    columns = set()
+    values = []
+    segments = []
+    previous = ""
+    for segment in path.split("/"):
+        if segment and is_id(segment):
+            name = column(previous + "_id", columns)
+            segments.append("{" + DATA_PREFIX + name + "}")
+            values.append((name, segment))
+        else:
+            segments.append(escape(segment))
+            previous = segment
+    template = "/".join(segments)
+
+    if query:
+        fields = []
+        for field in query.split("&"):
+            key, equals, value = field.partition("=")
+            value = unquote_plus(value)
+            replacement = placeholder(unquote_plus(key), value) if equals else None
+            if replacement is None and equals and is_id(value):
+                name = column(unquote_plus(key), columns)
+                replacement = "{" + DATA_PREFIX + name + "}"
+                values.append((name, value))
+            fields.append(escape(key) + "=" + replacement if replacement is not None else escape(field))
+        template += "?" + "&".join(fields)
+
+    return template, tuple(values)
+
+
+def parameterize(body):
+    """ A payload template (see `loadtest/payload.py`) of a HAR request body """
+
+    if body is None:
+        return None
+
+    mime_type, text = body
+    if not mime_type.startswith("application/x-www-form-urlencoded"):
+        # Kept as is, braces escaped for the template
+        return escape(text)
+
+    fields = []
+    for key, value in parse_qsl(text, keep_blank_values=True):
+        if key in CSRF_FIELDS:
+            continue
+        fields.append("{}={}".format(quote_plus(key), placeholder(key, value) or quote_plus(value)))
+
+    return "&".join(fields)
+
+
+class Summary(object):
+    """ Counts of the most common items, in bounded memory (Misra-Gries)
+
+    Keeps at most `capacity` items; counts are exact for the items which
+    were never evicted, lower bounds otherwise.
+
+    """
+
+    def __init__(self, capacity=10000):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, item, count=1):
+        counts = self.counts
+        if item in counts or len(counts) < self.capacity:
+            counts[item] = counts.get(item, 0) + count
+            return
+
+        # Make room: take the smallest count (at most `count`) off every item
+        decrement = min(count, min(counts.values()))
+        for key in list(counts):
+            counts[key] -= decrement
+            if counts[key] <= 0:
+                del counts[key]
+        if count > decrement:
+            counts[item] = count - decrement
+
+    def merge(self, other):
+        for item, count in other.counts.items():
+            self.add(item, count)
+
+    def most_common(self, limit=None):
+        return sorted(self.counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+
+class Import(object):
+    """ Sessions and endpoints of the imported requests, mergeable across worker processes """
+
+    def __init__(self, capacity=10000, dataset_rows=1000):
+        self.lines = 0
+        self.requests = 0
+        self.sessions = 0
+        # (endpoint, ...) of each sequence, "METHOD pattern" of each request
+        self.sequences = Summary(capacity)
+        self.endpoints = Summary(capacity)
+        # {endpoint: (method, URL template, body)} of the first request of each endpoint
+        self.examples = {}
+        # {column: {value: None}}, the first distinct IDs of the URLs' placeholders
+        self.values = {}
+        # Endpoints whose example is set and columns are full, whose URLs aren't parameterized again
+        self.complete = set()
+        self.capacity = capacity
+        self.dataset_rows = dataset_rows
+
+    def add_value(self, name, value):
+        values = self.values.get(name)
+        if values is None:
+            if len(self.values) >= self.capacity:
+                return
+            values = self.values[name] = {}
+        if len(values) < self.dataset_rows:
+            values[value] = None
+
+    def add_example(self, endpoint, method, url, body):
+        template, values = parameterize_url(url)
+        if endpoint not in self.examples and len(self.examples) < self.capacity:
+            self.examples[endpoint] = (method, template, parameterize(body))
+        for name, value in values:
+            self.add_value(name, value)
+
+        if endpoint in self.examples and all(len(self.values.get(name, ())) >= self.dataset_rows for name, _ in values):
+            self.complete.add(endpoint)
+
+    def add(self, session):
+        sequence = []
+        for method, url, body in session:
+            endpoint = "{} {}".format(method, pattern(url))
+            if endpoint not in self.complete:
+                self.add_example(endpoint, method, url, body)
+            self.endpoints.add(endpoint)
+            sequence.append(endpoint)
+        self.sequences.add(tuple(sequence))
+        self.requests += len(sequence)
+        self.sessions += 1
+
+    def merge(self, other):
+        self.lines += other.lines
+        self.requests += other.requests
+        self.sessions += other.sessions
+        self.sequences.merge(other.sequences)
+        self.endpoints.merge(other.endpoints)
+        for endpoint, example in other.examples.items():
+            if endpoint not in self.examples and len(self.examples) < self.capacity:
+                self.examples[endpoint] = example
+        for name, values in other.values.items():
+            for value in values:
+                self.add_value(name, value)
+
+    def scenario(self, limit, min_sessions=1, prefix="Imported"):
+        """ The scenario file of the `limit` most common sequences """
+
+        sequences = []
+        kept = [
+            (sequence, count)
+            for sequence, count in self.sequences.most_common(limit)
+            if count >= min_sessions and all(endpoint in self.examples for endpoint in sequence)
+        ]
+        total = float(sum(count for _, count in kept)) or 1
+        for number, (sequence, count) in enumerate(kept):
+            name = "{}{:02d}".format(prefix, number + 1)
+            base = 1000 + 100 * number
+            steps = []
+            for index, endpoint in enumerate(sequence):
+                method, url, body = self.examples[endpoint]
+                steps.append({
+                    "id": str(base + index),
+                    "description": "({}) {} {}".format(name, method, url),
+                    "method": method,
+                    "url": url,
+                    "body": body,
+                    "weight": 1,
+                    "order": base + index,
+                })
+            sequences.append({
+                "name": name,
+                # Iteration share of the sequence, in 1/1000
+                "weight": max(int(round(1000 * count / total)), 1),
+                "steps": steps,
+            })
+
+        return {"sequences": sequences}
+
+    def dataset(self, scenario):
+        """ (columns, rows) of the IDs of the scenario's URL placeholders, for the feeder
+
+        Columns with fewer distinct IDs than others start over.
+
+        """
+
+        columns = sorted(set(
+            field[len(DATA_PREFIX):]
+            for sequence in scenario["sequences"]
+            for step in sequence["steps"]
+            for field in _placeholder.findall(step["url"])
+            if field.startswith(DATA_PREFIX)
+        ))
+        values = [list(self.values.get(name, ())) or [""] for name in columns]
+        count = max([len(column_values) for column_values in values] or [0])
+
+        return columns, [[column_values[row % len(column_values)] for column_values in values] for row in range(count)]
+
+    def target(self):
+        """ Endpoint counts, as a target mix for `loadtest/mix.py` """
+
+        return {
+            "endpoints": {
+                "{} {}".format(self.examples[endpoint][0], self.examples[endpoint][1]): count
+                for endpoint, count in self.endpoints.most_common()
+                if endpoint in self.examples
+            }
+        }
+
+
+def import_requests(requests, counter, args):
+    """ Run requests through the pipeline, into an Import """
+
+    result = Import(args.capacity, args.dataset_rows)
+    for session in sessionize(keep(requests), args.session_timeout, args.max_steps):
+        result.add(session)
+    result.lines = counter[0]
+
+    return result
+
+
+def import_chunk(job):
+    """ Import a chunk of an access log (worker process) """
+
+    path, start, end, args = job
+    counter = [0]
+
+    return import_requests(parse_nginx(read_lines(path, start, end), counter), counter, args)
+
+
+def import_file(path, args):
+    """ Import an access log or a HAR file, in chunks over worker processes where possible """
+
+    if path.endswith(".har"):
+        counter = [0]
+        return import_requests(parse_har(path, counter), counter, args)
+
+    size = os.path.getsize(path)
+    if args.processes <= 1 or path.endswith(".gz") or size < 2 * args.chunk_size:
+        return import_chunk((path, 0, None, args))
+
+    bounds = list(range(0, size, args.chunk_size)) + [size]
+    jobs = [(path, start, end, args) for start, end in zip(bounds, bounds[1:])]
+    result = Import(args.capacity, args.dataset_rows)
+    pool = multiprocessing.Pool(args.processes)
+    try:
+        for chunk in pool.imap_unordered(import_chunk, jobs):
+            result.merge(chunk)
+    finally:
+        pool.close()
+        pool.join()
+
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a scenario file from access logs or HAR files")
+    parser.add_argument("inputs", nargs="+", help="nginx access logs (main log_format, .gz too) or .har files")
+    parser.add_argument("--output", default="scenarios-imported.json", help="scenario file to write")
+    parser.add_argument("--target", help="also write the endpoint counts here, as a target mix for loadtest.mix")
+    parser.add_argument("--dataset", help="also write the IDs of the URLs' placeholders here, as a CSV dataset for the feeder")
+    parser.add_argument("--dataset-rows", type=int, default=1000, help="distinct IDs per column kept for --dataset")
+    parser.add_argument("--sequences", type=int, default=10, help="most common sequences to write")
+    parser.add_argument("--min-sessions", type=int, default=1, help="sessions of a sequence to write it")
+    parser.add_argument("--session-timeout", type=float, default=1800, help="seconds without requests which end a session")
+    parser.add_argument("--max-steps", type=int, default=30, help="requests per session, the rest is left out")
+    parser.add_argument("--capacity", type=int, default=10000, help="distinct sequences and endpoints counted")
+    parser.add_argument("--processes", type=int, default=1, help="worker processes for plain access logs")
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024 * 1024, help="bytes of an access log per worker job")
+    parser.add_argument("--prefix", default="Imported", help="prefix of the sequence names")
+    args = parser.parse_args()
+
+    start = time.time()
+    result = Import(args.capacity, args.dataset_rows)
+    for path in args.inputs:
+        try:
+            result.merge(import_file(path, args))
+        except (OSError, ValueError, LogImportError) as e:
+            sys.exit("Can't import {}: {}".format(path, e))
+    elapsed = max(time.time() - start, 0.001)
+
+    scenario = result.scenario(args.sequences, args.min_sessions, args.prefix)
+    with open(args.output, "w") as f:
+        json.dump(scenario, f, indent=2)
+        f.write("\n")
+    if args.target:
+        with open(args.target, "w") as f:
+            json.dump(result.target(), f, indent=2)
+            f.write("\n")
+    columns, rows = result.dataset(scenario)
+    if args.dataset and columns:
+        with open(args.dataset, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            writer.writerows(rows)
+
+    print("Read {} lines in {:.1f} s ({:.0f} lines/sec): {} requests in {} sessions".format(
+        result.lines, elapsed, result.lines / elapsed, result.requests, result.sessions
+    ))
+    for sequence in scenario["sequences"]:
+        print("{:<12} {:>5} {}".format(
+            sequence["name"], sequence["weight"], " > ".join(step["description"].split(") ", 1)[1] for step in sequence["steps"])
+        ))
+    print("Scenario file: {}".format(args.output))
+    if columns:
+        print("Dataset columns of the URLs (LOCUST_FEEDER_FILE): {}{}".format(
+            ", ".join(columns), "" if args.dataset else ", see --dataset"
+        ))
+        if args.dataset:
+            print("Dataset: {} ({} rows)".format(args.dataset, len(rows)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# coding=utf-8
+
+# Event loop lag of a Locust process
+#
+# All simulated users of a Locust process share a single gevent loop. When
+# the process is CPU bound, greenlets which are ready to run (eg. a response
+# has arrived) wait for their turn, and that wait ends up in the reported
+# response times. A greenlet which sleeps `interval` seconds, and measures
+# how late it wakes up, measures that wait: the event loop lag.
+
+from collections import deque
+import gevent
+import time
+
+
+class LoopLag(object):
+    """ Measure the event loop lag continuously, in a background greenlet """
+
+    def __init__(self, interval=0.1, window=50):
+        self.interval = interval
+        # Recent lags, for the maximum of the last `window` samples
+        self.recent = deque(maxlen=window)
+        self.last = 0
+        self.total = 0
+        self.count = 0
+        self.greenlet = None
+
+    def record(self, lag):
+        self.last = lag
+        self.recent.append(lag)
+        self.total += lag
+        self.count += 1
+
+    def max(self):
+        """ Maximum lag of the recent samples, in seconds """
+
+        return max(self.recent) if self.recent else 0
+
+    def run(self):
+        while True:
+            start = time.monotonic()
+            gevent.sleep(self.interval)
+            self.record(max(0, time.monotonic() - start - self.interval))
+
+    def start(self):
+        if self.greenlet is None:
+            self.greenlet = gevent.spawn(self.run)
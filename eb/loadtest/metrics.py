@@ -0,0 +1,292 @@
+# coding=utf-8
+
+# OpenMetrics (Prometheus) endpoints
+#
+# The master serves /metrics on its web UI (port 9876, and port 80 through
+# nginx) with, per request name (the "#<id>: <description>" names of the
+# scenario's steps, see `loadtest/scenario.py`) and method:
+#
+# * locust_requests_total, locust_request_failures_total: counters
+# * locust_response_time_seconds: a histogram with fixed buckets (BUCKETS),
+#   of the requests with a response time (Locust counts requests without
+#   one, eg. reported with response_time=None, in the requests only)
+#
+# plus the user count, and the state and user count of each slave. The
+# counters are kept per request name as the slaves' reports arrive (or as
+# requests finish, in a local run), so a scrape only formats them, and never
+# walks Locust's statistics. They only grow: Locust's "Reset stats" doesn't
+# reset them, as Prometheus expects from counters.
+#
+# With LOCUST_SLAVE_METRICS_PORT, each slave also serves /metrics on its own
+# port (the supervisor gives the N-th slave of an instance the port + N) with
+# its CPU time, event loop lag (see `loadtest/loop.py`), user count and
+# connection pool usage.
+
+from bisect import bisect_left
+from locust import events, runners
+from loadtest import client
+import gevent
+import os
+import weakref
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# Upper bounds of the response time histogram's buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+_BUCKETS_MS = tuple(bound * 1000 for bound in BUCKETS)
+
+SLAVE_STATES = (
+    runners.STATE_INIT,
+    runners.STATE_HATCHING,
+    runners.STATE_RUNNING,
+    runners.STATE_CLEANUP,
+    runners.STATE_STOPPING,
+    runners.STATE_STOPPED,
+    runners.STATE_MISSING,
+)
+
+
+def escape(value):
+    """ A label value, escaped for the text format """
+
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def labels(**values):
+    return "{" + ",".join(
+        "{}=\"{}\"".format(name, escape(value)) for name, value in sorted(values.items())
+    ) + "}"
+
+
+class Counters(object):
+    """ Pre-aggregated counters of a request name """
+
+    __slots__ = ("labels", "requests", "failures", "buckets", "observed", "total")
+
+    def __init__(self, method, name):
+        self.labels = labels(method=method, name=name)
+        self.requests = 0
+        self.failures = 0
+        # Requests per bucket (not cumulative), the last one is +Inf
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        # Requests with a response time, and the sum of their response times, in milliseconds
+        self.observed = 0
+        self.total = 0
+
+    def record(self, response_time):
+        """ Count a request, response time in milliseconds (None: without one) """
+
+        self.requests += 1
+        if response_time is None:
+            return
+        self.buckets[bisect_left(_BUCKETS_MS, response_time)] += 1
+        self.observed += 1
+        self.total += response_time
+
+    def add(self, entry):
+        """ Add a serialized StatsEntry of a slave report """
+
+        self.requests += entry["num_requests"]
+        self.failures += entry["num_failures"]
+        self.total += entry["total_response_time"]
+        buckets = self.buckets
+        for response_time, count in entry["response_times"].items():
+            buckets[bisect_left(_BUCKETS_MS, response_time)] += count
+            self.observed += count
+
+
+class MasterMetrics(object):
+    """ Request counters of the whole cluster, served at /metrics by the master """
+
+    def __init__(self):
+        # {(method, name): Counters}
+        self.counters = {}
+        self.local = False
+
+    def get(self, method, name):
+        counters = self.counters.get((method, name))
+        if counters is None:
+            counters = self.counters[(method, name)] = Counters(method, name)
+
+        return counters
+
+    def on_slave_report(self, client_id, data):
+        for entry in data["stats"]:
+            self.get(entry["method"], entry["name"]).add(entry)
+
+    def on_request_success(self, request_type, name, response_time, response_length, **kwargs):
+        self.get(request_type, name).record(response_time)
+
+    def on_request_failure(self, request_type, name, response_time, response_length, exception, **kwargs):
+        counters = self.get(request_type, name)
+        counters.record(response_time)
+        counters.failures += 1
+
+    def on_start_hatching(self, **kwargs):
+        # Only a local run counts its own requests, slaves report theirs
+        runner = runners.locust_runner
+        if self.local or isinstance(runner, (runners.MasterLocustRunner, runners.SlaveLocustRunner)):
+            return
+
+        self.local = True
+        events.request_success += self.on_request_success
+        events.request_failure += self.on_request_failure
+
+    def render(self):
+        """ The metrics, in the OpenMetrics text format """
+
+        counters = [self.counters[key] for key in sorted(self.counters)]
+        lines = [
+            "# TYPE locust_requests counter",
+            "# HELP locust_requests Requests, by request name",
+        ]
+        lines += ["locust_requests_total{} {}".format(c.labels, c.requests) for c in counters]
+
+        lines += [
+            "# TYPE locust_request_failures counter",
+            "# HELP locust_request_failures Failed requests, by request name",
+        ]
+        lines += ["locust_request_failures_total{} {}".format(c.labels, c.failures) for c in counters]
+
+        lines += [
+            "# TYPE locust_response_time_seconds histogram",
+            "# UNIT locust_response_time_seconds seconds",
+            "# HELP locust_response_time_seconds Response times, by request name",
+        ]
+        for c in counters:
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), c.buckets):
+                cumulative += count
+                lines.append("locust_response_time_seconds_bucket{},le=\"{}\"}} {}".format(
+                    c.labels[:-1], bound, cumulative
+                ))
+            lines.append("locust_response_time_seconds_sum{} {}".format(c.labels, c.total / 1000))
+            lines.append("locust_response_time_seconds_count{} {}".format(c.labels, c.observed))
+
+        runner = runners.locust_runner
+        lines += [
+            "# TYPE locust_users gauge",
+            "# HELP locust_users Simulated users",
+            "locust_users {}".format(runner.user_count if runner else 0),
+        ]
+
+        if isinstance(runner, runners.MasterLocustRunner):
+            slaves = sorted(runner.clients.values(), key=lambda slave: slave.id)
+            lines += [
+                "# TYPE locust_slave_users gauge",
+                "# HELP locust_slave_users Simulated users, by slave",
+            ]
+            lines += ["locust_slave_users{} {}".format(labels(slave=slave.id), slave.user_count) for slave in slaves]
+            lines += [
+                "# TYPE locust_slave_state stateset",
+                "# HELP locust_slave_state State, by slave",
+            ]
+            lines += [
+                "locust_slave_state{} {}".format(
+                    labels(slave=slave.id, locust_slave_state=state),
+                    1 if slave.state == state else 0
+                )
+                for slave in slaves
+                for state in SLAVE_STATES
+            ]
+
+        lines.append("# EOF\n")
+
+        return "\n".join(lines)
+
+    def install(self):
+        """ Hook into Locust's events, and serve /metrics """
+
+        events.slave_report += self.on_slave_report
+        events.locust_start_hatching += self.on_start_hatching
+
+        from locust.web import app
+        from flask import Response
+
+        @app.route("/metrics")
+        def metrics():
+            return Response(self.render(), content_type=CONTENT_TYPE)
+
+
+class SlaveMetrics(object):
+    """ A slave's own resource usage, served at /metrics on its own port """
+
+    def __init__(self, port, loop_lag):
+        self.port = port
+        # LoopLag, see `loadtest/loop.py`
+        self.loop_lag = loop_lag
+        # HTTP clients of the simulated users, see `track()`
+        self.clients = weakref.WeakSet()
+        self.server = None
+
+    def track(self, http_client):
+        """ Include an HTTP client (a simulated user's `self.client`) in the connection pool usage """
+
+        self.clients.add(http_client)
+
+    def render(self):
+        times = os.times()
+        runner = runners.locust_runner
+        active = idle = 0
+        seen = set()
+        for http_client in list(self.clients):
+            client_active, client_idle = client.pool_usage(http_client, seen)
+            active += client_active
+            idle += client_idle
+
+        lines = [
+            "# TYPE process_cpu_seconds counter",
+            "# UNIT process_cpu_seconds seconds",
+            "# HELP process_cpu_seconds User and system CPU time",
+            "process_cpu_seconds_total {}".format(times[0] + times[1]),
+            "# TYPE locust_event_loop_lag_seconds gauge",
+            "# UNIT locust_event_loop_lag_seconds seconds",
+            "# HELP locust_event_loop_lag_seconds Event loop lag, last and maximum of the recent samples",
+            "locust_event_loop_lag_seconds{{window=\"last\"}} {}".format(self.loop_lag.last),
+            "locust_event_loop_lag_seconds{{window=\"max\"}} {}".format(self.loop_lag.max()),
+            "# TYPE locust_event_loop_lag_samples_seconds summary",
+            "# UNIT locust_event_loop_lag_samples_seconds seconds",
+            "# HELP locust_event_loop_lag_samples_seconds All event loop lag samples",
+            "locust_event_loop_lag_samples_seconds_sum {}".format(self.loop_lag.total),
+            "locust_event_loop_lag_samples_seconds_count {}".format(self.loop_lag.count),
+            "# TYPE locust_users gauge",
+            "# HELP locust_users Simulated users",
+            "locust_users {}".format(runner.user_count if runner else 0),
+            "# TYPE locust_http_clients gauge",
+            "# HELP locust_http_clients HTTP clients (simulated users' sessions)",
+            "locust_http_clients {}".format(len(self.clients)),
+            "# TYPE locust_connections gauge",
+            "# HELP locust_connections Connections in the HTTP clients' pools, by state",
+            "locust_connections{{state=\"active\"}} {}".format(active),
+            "locust_connections{{state=\"idle\"}} {}".format(idle),
+            "# EOF\n",
+        ]
+
+        return "\n".join(lines)
+
+    def application(self, environ, start_response):
+        if environ["PATH_INFO"] != "/metrics":
+            start_response("404 Not Found", [("Content-Type", "text/plain")])
+            return [b"Not Found\n"]
+
+        start_response("200 OK", [("Content-Type", CONTENT_TYPE)])
+        return [self.render().encode("utf-8")]
+
+    def run(self):
+        # The runner exists once Locust has loaded the locustfile; only slaves
+        # serve (LOCUST_SLAVE_METRICS_PORT may be set for the master too)
+        while runners.locust_runner is None:
+            gevent.sleep(0.1)
+        if not isinstance(runners.locust_runner, runners.SlaveLocustRunner):
+            return
+
+        from gevent.pywsgi import WSGIServer
+
+        self.loop_lag.start()
+        self.server = WSGIServer(("", self.port), self.application, log=None)
+        self.server.serve_forever()
+
+    def install(self):
+        """ Measure the event loop lag, and serve /metrics, on slaves """
+
+        gevent.spawn(self.run)
@@ -0,0 +1,411 @@
+# coding=utf-8
+
+# Transaction-mix solver: sequence weights and wait times for a target mix
+#
+# In Locust 0.13, a simulated user picks one of UserBehavior's sequences by
+# weight, and runs it for the rest of the test. With the same weight for
+# sequences of 2 and 4 Steps, the users of the shorter sequences finish
+# twice as many iterations, and "GET /" (in every sequence) dominates: the
+# weights don't say what the web application gets. This tool:
+#
+# * solves for the sequence weights which come closest to a target mix, per
+#   endpoint ("METHOD /url", eg. counted in production access logs) or per
+#   transaction (sequence name), with non-negative least squares
+# * solves for the wait times which give a target requests/sec per user
+# * simulates millions of virtual iterations (think times, and log-normal
+#   response times) and user assignments to predict the resulting mix, its
+#   spread for a given number of users, and the requests/sec per user, before
+#   any cluster time is spent
+#
+# Both the closed model (wait_time, the default) and arrival-rate mode (see
+# `loadtest/arrival.py`, where iterations start at rates split by weight)
+# are supported.
+#
+# Target file format (JSON; counts, or shares in any unit):
+#
+#   {
+#     "endpoints": {"GET /": 5200, "POST /login": 310, ...},
+#     "response_times": {"GET /": 80, ...}  (optional, mean in ms)
+#   }
+#
+# or, per transaction: {"transactions": {"UserLogin": 30, "BookFlight": 5, ...}}
+#
+# Requires numpy (pip install numpy). For example:
+#
+#   python3 -m loadtest.mix target.json --rps-per-user 0.5 --output scenarios-mix.json
+
+from loadtest import settings
+from loadtest.scenario import ScenarioError, load_steps, read_scenario_file
+import argparse
+import json
+import sys
+
+# Iteration mix of each sequence's users
+CLOSED = "closed"
+ARRIVAL = "arrival"
+
+# Sum of the solved weights, per sequence (the default weight)
+WEIGHT_PER_SEQUENCE = 100
+
+
+class Sequence(object):
+    """ A sequence of the scenario file, as far as the mix is concerned """
+
+    def __init__(self, definition):
+        self.name = definition["name"]
+        self.weight = definition.get("weight", 100)
+        # Endpoint of each request of an iteration (a Step with weight N runs N times)
+        self.endpoints = [
+            "{} {}".format(step.method, step.url)
+            for step in load_steps(definition)
+            for _ in range(step.locust_task_weight)
+        ]
+
+
+def endpoint_matrix(sequences, endpoints):
+    """ Requests per iteration, of each endpoint (rows) by each sequence (columns) """
+
+    import numpy
+
+    matrix = numpy.zeros((len(endpoints), len(sequences)))
+    index = {endpoint: row for row, endpoint in enumerate(endpoints)}
+    for column, sequence in enumerate(sequences):
+        for endpoint in sequence.endpoints:
+            matrix[index[endpoint], column] += 1
+
+    return matrix
+
+
+def nnls(a, b, max_iterations=None):
+    """ Non-negative least squares (Lawson-Hanson): argmin ||a x - b||, x >= 0 """
+
+    import numpy
+
+    rows, columns = a.shape
+    x = numpy.zeros(columns)
+    passive = numpy.zeros(columns, dtype=bool)
+    tolerance = 1e-10 * max(rows, columns) * max(numpy.abs(a).max(), 1)
+
+    for _ in range(max_iterations or 3 * columns):
+        gradient = a.T.dot(b - a.dot(x))
+        if passive.all() or gradient[~passive].max() <= tolerance:
+            break
+
+        passive[numpy.argmax(numpy.where(passive, -numpy.inf, gradient))] = True
+
+        while True:
+            z = numpy.zeros(columns)
+            z[passive] = numpy.linalg.lstsq(a[:, passive], b, rcond=None)[0]
+            if (z[passive] > tolerance).all():
+                x = z
+                break
+
+            # Step back towards x until a passive coefficient hits zero
+            shrinking = passive & (z <= tolerance)
+            alpha = (x[shrinking] / (x[shrinking] - z[shrinking])).min()
+            x = x + alpha * (z - x)
+            passive &= x > tolerance
+            x[~passive] = 0
+
+    return x
+
+
+def solve_request_shares(sequences, endpoints, target):
+    """ Share of the requests to come from each sequence, for a target endpoint mix """
+
+    matrix = endpoint_matrix(sequences, endpoints)
+    # Each column: the endpoint mix of a sequence's iterations
+    matrix /= matrix.sum(axis=0)
+    shares = nnls(matrix, target)
+
+    return shares / shares.sum()
+
+
+def weights_for(sequences, iteration_shares, mode, mean_durations):
+    """ Sequence weights which give the iteration shares, scaled to WEIGHT_PER_SEQUENCE """
+
+    import numpy
+
+    if mode == CLOSED:
+        # Users of a sequence run iterations at 1 / (mean duration) each
+        weights = iteration_shares * mean_durations
+    else:
+        # Iterations start at rates split by weight
+        weights = numpy.array(iteration_shares, dtype=float)
+
+    weights = weights / weights.sum() * WEIGHT_PER_SEQUENCE * len(sequences)
+
+    return [int(round(weight)) for weight in weights]
+
+
+def solve_weights(sequences, endpoints, target, mode, wait_mean, response_times):
+    """ Sequence weights for the mix of a target file, per endpoint or per transaction """
+
+    import numpy
+
+    durations = mean_durations(sequences, wait_mean, response_times)
+    if mode == ARRIVAL:
+        # The iteration's last wait is the wait for the next slot
+        durations = durations - wait_mean
+
+    if "transactions" in target:
+        names = [sequence.name for sequence in sequences]
+        iteration_shares = numpy.array(normalize(target["transactions"], names, "transactions"))
+    else:
+        request_shares = solve_request_shares(
+            sequences,
+            endpoints,
+            normalize(target["endpoints"], endpoints, "endpoints")
+        )
+        iteration_shares = request_shares / [len(sequence.endpoints) for sequence in sequences]
+
+    return weights_for(sequences, iteration_shares, mode, durations)
+
+
+def mean_durations(sequences, wait_mean, response_times):
+    """ Mean duration of an iteration of each sequence, in seconds (analytic) """
+
+    import numpy
+
+    return numpy.array([
+        len(sequence.endpoints) * wait_mean + sum(response_times[endpoint] for endpoint in sequence.endpoints)
+        for sequence in sequences
+    ])
+
+
+def solve_wait_mean(sequences, weights, response_times, rps_per_user):
+    """ Mean wait time which gives `rps_per_user` in the closed model (bisection) """
+
+    total = float(sum(weights))
+
+    def rps(wait_mean):
+        durations = mean_durations(sequences, wait_mean, response_times)
+        return sum(
+            weight / total * len(sequence.endpoints) / duration
+            for sequence, weight, duration in zip(sequences, weights, durations)
+        )
+
+    if rps(0) < rps_per_user:
+        raise ScenarioError(
+            "Response times alone limit a user to {:.2f} requests/sec".format(rps(0))
+        )
+
+    low, high = 0.0, 1.0
+    while rps(high) > rps_per_user:
+        high *= 2
+
+    for _ in range(60):
+        middle = (low + high) / 2
+        if rps(middle) > rps_per_user:
+            low = middle
+        else:
+            high = middle
+
+    return (low + high) / 2
+
+
+def simulate_durations(sequences, wait_min, wait_max, response_times, sigma, mode, iterations, rng):
+    """ Simulate iterations of each sequence, returns their mean and p99 duration (s) """
+
+    import numpy
+
+    means = numpy.zeros(len(sequences))
+    p99s = numpy.zeros(len(sequences))
+    per_sequence = max(iterations // len(sequences), 1)
+    # Bound the memory of a chunk to ~10M random values
+    chunk = max(10000000 // max(len(sequence.endpoints) for sequence in sequences), 1)
+
+    for index, sequence in enumerate(sequences):
+        steps = len(sequence.endpoints)
+        # Log-normal response times with the given means
+        mu = numpy.log([response_times[endpoint] for endpoint in sequence.endpoints]) - sigma ** 2 / 2
+        # In arrival-rate mode, the wait after the last Step is the wait for the next slot
+        waits = steps if mode == CLOSED else steps - 1
+        durations = []
+
+        for start in range(0, per_sequence, chunk):
+            size = min(chunk, per_sequence - start)
+            duration = rng.lognormal(mu, sigma, (size, steps)).sum(axis=1)
+            if waits:
+                duration += rng.uniform(wait_min, wait_max, (size, waits)).sum(axis=1)
+            durations.append(duration)
+
+        durations = numpy.concatenate(durations)
+        means[index] = durations.mean()
+        p99s[index] = numpy.percentile(durations, 99)
+
+    return means, p99s
+
+
+def predict(sequences, endpoints, weights, durations, mode, users, runs, rng):
+    """ Predict the endpoint mix, its spread over `runs` swarms of `users`, and requests/sec per user
+
+    Returns (endpoint mix, its standard deviation, iteration mix, requests/sec
+    per user); in arrival-rate mode, the requests/sec per user is for
+    `users` users which sustain the rate.
+
+    """
+
+    import numpy
+
+    matrix = endpoint_matrix(sequences, endpoints)
+    probabilities = numpy.array(weights, dtype=float) / sum(weights)
+
+    if mode == CLOSED:
+        # Users picking sequences by weight, each running 1 / duration iterations/sec
+        assigned = rng.multinomial(users, probabilities, size=runs)
+        iterations = assigned / durations
+        expected = probabilities / durations
+    else:
+        iterations = numpy.tile(probabilities, (runs, 1))
+        expected = probabilities
+
+    requests = iterations.dot(matrix.T)
+    mix = requests / requests.sum(axis=1, keepdims=True)
+    expected_requests = matrix.dot(expected)
+
+    if mode == CLOSED:
+        rps_per_user = expected_requests.sum()
+    else:
+        # Users needed to sustain an iteration/sec of the whole mix (Little's law), by sequence
+        rps_per_user = expected_requests.sum() / (expected * durations).sum()
+
+    return (
+        expected_requests / expected_requests.sum(),
+        mix.std(axis=0),
+        expected / expected.sum(),
+        rps_per_user,
+    )
+
+
+def normalize(values, names, kind):
+    """ Target shares (summing to 1) for `names`, from counts or shares in `values` """
+
+    unknown = sorted(set(values) - set(names))
+    if unknown:
+        raise ScenarioError("Unknown {} in the target mix: {}".format(kind, ", ".join(unknown)))
+
+    total = float(sum(values.values()))
+    if total <= 0:
+        raise ScenarioError("Empty target mix")
+
+    return [values.get(name, 0) / total for name in names]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Solve sequence weights and wait times for a target request mix")
+    parser.add_argument("target", help="target mix (JSON), see loadtest/mix.py")
+    parser.add_argument("--scenario", default=settings.SCENARIO_FILE, help="scenario file (default: LOCUST_SCENARIO_FILE)")
+    parser.add_argument("--mode", choices=(CLOSED, ARRIVAL), default=ARRIVAL if settings.ARRIVAL_RATE or settings.TARGET_RPS else CLOSED)
+    parser.add_argument("--response-time", type=float, default=100, help="mean response time (ms) of endpoints without one in the target file")
+    parser.add_argument("--sigma", type=float, default=0.5, help="shape of the log-normal response times")
+    parser.add_argument("--wait-min", type=float, default=settings.WAIT_TIME_MIN)
+    parser.add_argument("--wait-max", type=float, default=settings.WAIT_TIME_MAX)
+    parser.add_argument("--rps-per-user", type=float, help="solve the wait times for this requests/sec per user (closed model)")
+    parser.add_argument("--users", type=int, default=100, help="users per swarm, for the spread of the mix")
+    parser.add_argument("--iterations", type=int, default=1000000, help="virtual iterations to simulate")
+    parser.add_argument("--runs", type=int, default=10000, help="simulated swarms, for the spread of the mix")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--output", help="write the scenario file with the solved weights here")
+    args = parser.parse_args()
+
+    try:
+        import numpy
+    except ImportError:
+        sys.exit("The mix solver requires numpy: pip install numpy")
+
+    rng = numpy.random.RandomState(args.seed)
+    scenario = read_scenario_file(args.scenario)
+    sequences = [Sequence(definition) for definition in scenario.get("sequences", [])]
+    endpoints = sorted(set(endpoint for sequence in sequences for endpoint in sequence.endpoints))
+    names = [sequence.name for sequence in sequences]
+
+    with open(args.target) as f:
+        target = json.load(f)
+
+    response_times = {endpoint: args.response_time / 1000 for endpoint in endpoints}
+    for endpoint, response_time in target.get("response_times", {}).items():
+        if endpoint in response_times:
+            response_times[endpoint] = response_time / 1000
+
+    wait_mean = (args.wait_min + args.wait_max) / 2
+    # Relative spread of the wait times, kept when solving for their mean
+    spread = (args.wait_max - args.wait_min) / (args.wait_max + args.wait_min) if wait_mean else 0
+
+    try:
+        weights = solve_weights(sequences, endpoints, target, args.mode, wait_mean, response_times)
+        if args.rps_per_user and args.mode == CLOSED:
+            # The weights depend on the wait times, and vice versa
+            for _ in range(10):
+                wait_mean = solve_wait_mean(sequences, weights, response_times, args.rps_per_user)
+                solved = solve_weights(sequences, endpoints, target, args.mode, wait_mean, response_times)
+                if solved == weights:
+                    break
+                weights = solved
+    except ScenarioError as e:
+        sys.exit(str(e))
+
+    wait_min = wait_mean * (1 - spread)
+    wait_max = wait_mean * (1 + spread)
+
+    durations, p99s = simulate_durations(
+        sequences, wait_min, wait_max, response_times, args.sigma, args.mode, args.iterations, rng
+    )
+    mix, deviation, iteration_mix, rps_per_user = predict(
+        sequences, endpoints, weights, durations, args.mode, args.users, args.runs, rng
+    )
+
+    if "transactions" in target:
+        target_iterations = normalize(target["transactions"], names, "transactions")
+        target_endpoints = [None] * len(endpoints)
+    else:
+        target_iterations = [None] * len(sequences)
+        target_endpoints = normalize(target["endpoints"], endpoints, "endpoints")
+
+    def percent(value):
+        return "{:>7.2f}%".format(value * 100) if value is not None else "{:>8}".format("-")
+
+    print("{:<24} {:>7} {:>7} {:>8} {:>8} {:>10} {:>10}".format(
+        "sequence", "weight", "solved", "target", "mix", "mean (s)", "p99 (s)"
+    ))
+    for index, sequence in enumerate(sequences):
+        print("{:<24} {:>7} {:>7} {} {} {:>10.2f} {:>10.2f}".format(
+            sequence.name,
+            sequence.weight,
+            weights[index],
+            percent(target_iterations[index]),
+            percent(iteration_mix[index]),
+            durations[index],
+            p99s[index]
+        ))
+
+    print()
+    print("{:<32} {:>8} {:>8} {:>8}".format("endpoint", "target", "mix", "+/-"))
+    for index, endpoint in enumerate(endpoints):
+        print("{:<32} {} {} {}".format(
+            endpoint,
+            percent(target_endpoints[index]),
+            percent(mix[index]),
+            percent(deviation[index]) if args.mode == CLOSED else percent(None)
+        ))
+
+    print()
+    print("Wait time: {:.2f} to {:.2f} s (LOCUST_WAIT_TIME_MIN, LOCUST_WAIT_TIME_MAX)".format(wait_min, wait_max))
+    print("Requests/sec per user: {:.3f} ({} mode, {} virtual iterations{})".format(
+        rps_per_user,
+        args.mode,
+        args.iterations,
+        ", +/- for {} users".format(args.users) if args.mode == CLOSED else ""
+    ))
+
+    if args.output:
+        for definition, weight in zip(scenario.get("sequences", []), weights):
+            definition["weight"] = weight
+        with open(args.output, "w") as f:
+            json.dump(scenario, f, indent=2)
+            f.write("\n")
+        print("Scenario with the solved weights: {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
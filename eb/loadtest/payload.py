@@ -0,0 +1,202 @@
+# coding=utf-8
+
+# Templated request payloads, with per-user and per-iteration values
+#
+# A step's body in the scenario file may contain {placeholders}, eg.:
+#
+#   "body": "email={email}&password={password}"
+#
+# Templates are parsed once, at import, into precompiled segments: static
+# parts are stored as (already urlencoded) bytes, placeholders as slots.
+# Rendering fills the slots with values which are urlencoded once per user
+# or once per iteration, never per request. Use {{ and }} for literal braces.
+#
+# Per-user values (see UserData):
+#   {user}           Unique ID of the simulated user, eg. "3f2a9c1e-17"
+#   {email}          test+<user>@example.org
+#   {password}       pw-<user>
+#   {name}           Test User <user>
+#   {card_number}    16 digit, Luhn-valid test VISA number
+#
+# Per-iteration values (updated each time a TaskSequence starts over):
+#   {iteration}        Iteration count of the user's TaskSequence
+#   {iteration_email}  test+<user>.<iteration>@example.org
+#
+# With a dataset (LOCUST_FEEDER_FILE, see `loadtest/feeder.py`), per user or
+# per iteration:
+#   {data.<column>}    Value of the column in the user's row; columns named
+#                      after a per-user value replace it
+
+from string import Formatter
+from urllib.parse import quote_plus
+import hashlib
+import itertools
+import os
+import socket
+
+# Unique prefix for the user IDs of this Locust process
+PROCESS_ID = hashlib.md5(
+    "{}-{}".format(socket.gethostname(), os.getpid()).encode()
+).hexdigest()[:8]
+
+_user_counter = itertools.count(1)
+
+USER_FIELDS = ("user", "email", "password", "name", "card_number")
+ITERATION_FIELDS = ("iteration", "iteration_email")
+FIELDS = USER_FIELDS + ITERATION_FIELDS
+
+# Prefix of the placeholders of a dataset's columns
+DATA_PREFIX = "data."
+
+
+class TemplateError(Exception):
+    """ Raised when a payload template is invalid """
+
+
+def encode(value):
+    """ Urlencode a single form value """
+
+    return quote_plus(str(value)).encode()
+
+
+def card_number(seed):
+    """ Derive a 16 digit, Luhn-valid test VISA number from `seed` """
+
+    digits = "4000" + str(int(hashlib.md5(seed.encode()).hexdigest(), 16))[-11:].zfill(11)
+
+    total = 0
+    for position, digit in enumerate(reversed(digits)):
+        digit = int(digit)
+        if position % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+
+    return digits + str((10 - total % 10) % 10)
+
+
+class UserData(object):
+    """ Urlencoded template values of a single simulated user
+
+    The values are only built once a template needs them, users whose
+    sequences send no payloads never do.
+
+    """
+
+    __slots__ = ("user", "iteration", "feeder", "_values")
+
+    def __init__(self, user=None, feeder=None):
+        self.user = user or "{}-{}".format(PROCESS_ID, next(_user_counter))
+        self.iteration = 0
+        # DataFeeder of the dataset's rows, if any
+        self.feeder = feeder
+        self._values = None
+
+    @property
+    def values(self):
+        """ {field: urlencoded value} """
+
+        if self._values is None:
+            self._values = {
+                "user": encode(self.user),
+                "email": encode("test+{}@example.org".format(self.user)),
+                "password": encode("pw-{}".format(self.user)),
+                "name": encode("Test User {}".format(self.user)),
+                "card_number": encode(card_number(self.user)),
+            }
+            if self.feeder is not None and not self.feeder.per_iteration:
+                self._values.update(self.feeder.take())
+            self.update_iteration_values()
+
+        return self._values
+
+    def next_iteration(self):
+        """ Start a new iteration of the user's TaskSequence """
+
+        self.iteration += 1
+        if self._values is not None:
+            self.update_iteration_values()
+
+    def update_iteration_values(self):
+        """ Urlencode the per-iteration values """
+
+        self._values["iteration"] = encode(self.iteration)
+        self._values["iteration_email"] = encode(
+            "test+{}.{}@example.org".format(self.user, self.iteration)
+        )
+        if self.feeder is not None and self.feeder.per_iteration:
+            self._values.update(self.feeder.take())
+
+
+class Template(object):
+    """ A payload template, precompiled into static segments and value slots """
+
+    __slots__ = ("text", "segments", "slots")
+
+    def __init__(self, text):
+        self.text = text
+        self.segments = []
+        # (index in segments, field name)
+        self.slots = []
+
+        try:
+            parsed = list(Formatter().parse(text))
+        except ValueError as e:
+            raise TemplateError("Invalid template '{}': {}".format(text, e))
+
+        for literal, field, format_spec, conversion in parsed:
+            if literal:
+                self.segments.append(literal.encode())
+            if field is None:
+                continue
+            known = field in FIELDS or (field.startswith(DATA_PREFIX) and len(field) > len(DATA_PREFIX))
+            if not known or format_spec or conversion:
+                raise TemplateError(
+                    "Unknown placeholder '{{{}}}' in '{}', expected one of: {}".format(
+                        field,
+                        text,
+                        ", ".join(FIELDS + (DATA_PREFIX + "<column>",))
+                    )
+                )
+            self.slots.append((len(self.segments), field))
+            self.segments.append(None)
+
+        # Templates without placeholders render to a constant
+        if not self.slots:
+            self.segments = [b"".join(self.segments)]
+
+    def check_columns(self, columns):
+        """ Raise a TemplateError unless the dataset has the columns of the {data.<column>} placeholders
+
+        `columns` is None without a dataset.
+
+        """
+
+        for _, field in self.slots:
+            if not field.startswith(DATA_PREFIX):
+                continue
+            if columns is None:
+                raise TemplateError(
+                    "Placeholder '{{{}}}' in '{}' needs a dataset (LOCUST_FEEDER_FILE)".format(field, self.text)
+                )
+            if field[len(DATA_PREFIX):] not in columns:
+                raise TemplateError(
+                    "Unknown column in '{{{}}}' of '{}', the dataset has: {}".format(field, self.text, ", ".join(columns))
+                )
+
+    def render(self, user_data):
+        """ Fill in the values of `user_data`, returns the payload as bytes """
+
+        if not self.slots:
+            return self.segments[0]
+
+        segments = self.segments[:]
+        values = user_data.values
+        for index, field in self.slots:
+            segments[index] = values[field]
+
+        return b"".join(segments)
+
+    def __repr__(self):
+        return "<Template {}>".format(self.text)
@@ -0,0 +1,262 @@
+# coding=utf-8
+
+# Per-phase timing of requests: DNS, connect, TLS, TTFB, download
+#
+# Locust only reports the total response time of a request. With
+# LOCUST_PHASE_TIMING=1, every request sent through `loadtest.client.request()`
+# is also split into:
+#
+# * dns: name resolution (getaddrinfo), when a new connection is made
+# * connect: TCP connect, when a new connection is made
+# * tls: TLS handshake, when a new HTTPS connection is made
+# * ttfb: from sending the request until the first byte of the response
+#   (after the above), ie. the target's processing time plus the network
+# * download: from the first byte until the whole response was read
+#
+# The phases are captured through hooks on gevent's sockets, which both HTTP
+# client backends use (see `loadtest/client.py`): getaddrinfo, the sockets'
+# connect and TLS handshake, and the first read of the response. Hooks only
+# look up the running greenlet's request, and the phases are counted once
+# the request is done: a few microseconds per request (see `bench/phases.py`).
+#
+# Like the response times (see `loadtest/histogram.py`), each phase is
+# counted per request name in a mergeable histogram, which slaves send with
+# their report to the master (through aggregators too). The master serves
+# the percentiles per phase at /stats/phases (JSON), adds the mean of each
+# phase to the web UI's statistics (as "phases" of every row), and to the
+# time-series export (see `loadtest/timeseries.py`).
+
+from gevent import getcurrent
+from locust import events
+from loadtest import client, resets
+from loadtest.histogram import Histogram
+import gevent.socket
+import gevent.ssl
+import socket
+import time
+
+PHASES = ("dns", "connect", "tls", "ttfb", "download")
+
+# Percentiles served at /stats/phases
+PERCENTILES = (0.5, 0.9, 0.99)
+
+_MISSING = object()
+
+
+class Timing(object):
+    """ Phases of the current request of a greenlet, in seconds """
+
+    __slots__ = ("start", "dns", "connect", "tls", "first_byte")
+
+    def __init__(self, start):
+        self.start = start
+        self.dns = None
+        self.connect = None
+        self.tls = None
+        # Time of the first byte of the response
+        self.first_byte = None
+
+
+class PhaseHistograms(object):
+    """ A Histogram per request name and phase, hooked into Locust's events
+
+    Like `loadtest.histogram.HistogramSet`: slaves send and reset theirs with
+    every report, the master merges them.
+
+    """
+
+    def __init__(self):
+        # {name: {phase: Histogram}}
+        self.histograms = {}
+
+    def phases(self, name):
+        """ {phase: Histogram} of a request name """
+
+        phases = self.histograms.get(name)
+        if phases is None:
+            phases = self.histograms[name] = {phase: Histogram() for phase in PHASES}
+
+        return phases
+
+    def on_report_to_master(self, client_id, data):
+        phases = {}
+        for name, histograms in self.histograms.items():
+            encoded = {phase: histogram.encode() for phase, histogram in histograms.items() if histogram.count}
+            if encoded:
+                phases[name] = encoded
+        if phases:
+            data["phases"] = phases
+        # Only names with requests in the next interval are kept
+        self.histograms = {}
+
+    def on_slave_report(self, client_id, data):
+        for name, phases in data.get("phases", {}).items():
+            for phase, encoded in phases.items():
+                self.phases(name)[phase].merge_encoded(encoded)
+
+    def reset(self):
+        self.histograms = {}
+
+    def totals(self):
+        """ {name: {phase: (count, total in microseconds)}} """
+
+        return {
+            name: {phase: (histogram.count, histogram.total) for phase, histogram in phases.items()}
+            for name, phases in self.histograms.items()
+        }
+
+    def percentiles(self, fractions=PERCENTILES):
+        """ {name: {phase: {"count": ..., "mean": ..., "p50": ..., ...}}}, in milliseconds """
+
+        result = {}
+        for name, phases in sorted(self.histograms.items()):
+            result[name] = {
+                phase: dict(
+                    {
+                        "count": histogram.count,
+                        "mean": histogram.mean() / 1000,
+                        "max": histogram.max / 1000,
+                    },
+                    **{
+                        "p{:g}".format(fraction * 100): histogram.percentile(fraction) / 1000
+                        for fraction in fractions
+                    }
+                )
+                for phase, histogram in phases.items()
+                if histogram.count
+            }
+
+        return result
+
+    def annotate(self, report):
+        """ Add the mean of each phase (milliseconds) to the web UI's statistics (see `loadtest/snapshot.py`) """
+
+        for row in report.get("stats", []):
+            phases = self.histograms.get(row["name"])
+            if phases:
+                row["phases"] = {
+                    phase: round(histogram.mean() / 1000, 2)
+                    for phase, histogram in phases.items()
+                    if histogram.count
+                }
+
+    def install(self, snapshot=None):
+        """ Hook into Locust's report and reset events, the web UI's statistics, and serve /stats/phases """
+
+        events.report_to_master += self.on_report_to_master
+        events.slave_report += self.on_slave_report
+        resets.install()
+        resets.reset_stats += self.reset
+        if snapshot is not None:
+            snapshot.extensions.append(self.annotate)
+
+        from locust.web import app
+        from flask import jsonify
+
+        @app.route("/stats/phases")
+        def phases():
+            return jsonify(self.percentiles())
+
+
+class PhaseTimer(object):
+    """ Time the phases of the requests of each greenlet, through hooks on gevent's sockets """
+
+    def __init__(self, histograms):
+        self.histograms = histograms
+        # {greenlet: Timing} of the requests in progress
+        self.active = {}
+        self.clock = time.perf_counter
+        # (module or class, attribute, original value) of the installed hooks
+        self.hooks = []
+
+    def begin(self):
+        self.active[getcurrent()] = Timing(self.clock())
+
+    def end(self, name):
+        timing = self.active.pop(getcurrent(), None)
+        if timing is None:
+            return
+
+        end = self.clock()
+        histograms = self.histograms.phases(name)
+        setup = 0
+        if timing.dns is not None:
+            histograms["dns"].record(timing.dns * 1000000)
+            setup += timing.dns
+        if timing.connect is not None:
+            histograms["connect"].record(timing.connect * 1000000)
+            setup += timing.connect
+        if timing.tls is not None:
+            histograms["tls"].record(timing.tls * 1000000)
+            setup += timing.tls
+        if timing.first_byte is not None:
+            histograms["ttfb"].record(max(timing.first_byte - timing.start - setup, 0) * 1000000)
+            histograms["download"].record((end - timing.first_byte) * 1000000)
+
+    def timed(self, function, phase):
+        """ Wrap `function`, adding its duration to `phase` of the greenlet's request """
+
+        active = self.active
+        clock = self.clock
+
+        def wrapper(*args, **kwargs):
+            timing = active.get(getcurrent())
+            if timing is None:
+                return function(*args, **kwargs)
+
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                setattr(timing, phase, (getattr(timing, phase) or 0) + clock() - start)
+
+        return wrapper
+
+    def first_read(self, function):
+        """ Wrap a socket's read `function`, noting the first byte of the greenlet's response """
+
+        active = self.active
+        clock = self.clock
+
+        def wrapper(*args, **kwargs):
+            result = function(*args, **kwargs)
+            timing = active.get(getcurrent())
+            if timing is not None and timing.first_byte is None and result:
+                timing.first_byte = clock()
+
+            return result
+
+        return wrapper
+
+    def hook(self, target, name, wrap, *args):
+        """ Replace `target.name` (of a module or class) with its wrapped version """
+
+        self.hooks.append((target, name, target.__dict__.get(name, _MISSING)))
+        setattr(target, name, wrap(getattr(target, name), *args))
+
+    def install(self):
+        """ Hook into gevent's sockets, and `loadtest.client.request()` """
+
+        # Both `socket.getaddrinfo` (urllib3) and gevent's (geventhttpclient)
+        self.hook(gevent.socket, "getaddrinfo", self.timed, "dns")
+        self.hook(socket, "getaddrinfo", self.timed, "dns")
+
+        self.hook(gevent.socket.socket, "connect", self.timed, "connect")
+        self.hook(gevent.ssl.SSLSocket, "do_handshake", self.timed, "tls")
+        for name in ("recv", "recv_into"):
+            self.hook(gevent.socket.socket, name, self.first_read)
+        for name in ("read", "recv", "recv_into"):
+            self.hook(gevent.ssl.SSLSocket, name, self.first_read)
+
+        client.request_hooks.append(self)
+
+    def uninstall(self):
+        """ Remove the hooks (see `bench/phases.py`) """
+
+        client.request_hooks.remove(self)
+        for target, name, original in reversed(self.hooks):
+            if original is _MISSING:
+                delattr(target, name)
+            else:
+                setattr(target, name, original)
+        self.hooks = []
@@ -0,0 +1,241 @@
+# coding=utf-8
+
+# On-demand sampling profiler of the load generators
+#
+# GET /profile?seconds=10 on the master's web UI profiles all slaves for 10
+# seconds (at most MAX_SECONDS), and returns their merged stack samples as
+# "folded" stacks, one line per stack with its sample count:
+#
+#   run (locust/core.py:358);execute_task (locust/core.py:412);... 52
+#
+# which flamegraph.pl (https://github.com/brendangregg/FlameGraph) and
+# speedscope read as is. Options:
+#
+# * slave=<client ID>: profile a single slave ("master": the master itself)
+# * interval=<seconds>: CPU time between samples (default 0.005)
+# * by_slave=1: start every stack with the slave's ID
+#
+# Installed with LOCUST_PROFILER=1, on the master and the slaves. A local
+# run profiles itself. Each slave samples the Python stack of the
+# running greenlet on a SIGPROF timer, so only CPU time is sampled (not
+# greenlets waiting for the network), and sends the stacks back to the
+# master. Locust's runners ignore messages they don't know, so the profile
+# messages are handled ahead of them, when they're received (see
+# `intercept()`); aggregators (see `loadtest/aggregator.py`) relay them as is.
+
+from locust import runners
+from locust.rpc import Message, rpc
+import gevent
+import gevent.event
+import os
+import signal
+import uuid
+
+# Message types: a profile request (master to slave), and its result
+PROFILE = "profile"
+PROFILE_RESULT = "profile_result"
+
+# Longest profile, in seconds (nginx times out requests after 60 seconds)
+MAX_SECONDS = 30
+
+# Seconds the master waits for the results, after the profile's duration
+GRACE = 5
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def short_path(filename):
+    """ A source file's path, relative to site-packages or this project """
+
+    if "site-packages" + os.sep in filename:
+        return filename.rsplit("site-packages" + os.sep, 1)[1]
+    if filename.startswith(BASE_DIR + os.sep):
+        return filename[len(BASE_DIR) + 1:]
+
+    return filename
+
+
+class Sampler(object):
+    """ Sample the running Python stack on a SIGPROF timer, into folded stacks """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        # {"frame;frame;...": samples}, outermost frame first
+        self.stacks = {}
+        self.samples = 0
+        self.labels = {}
+        self.previous_handler = None
+
+    def label(self, code):
+        label = self.labels.get(code)
+        if label is None:
+            label = self.labels[code] = "{} ({}:{})".format(
+                code.co_name, short_path(code.co_filename), code.co_firstlineno
+            )
+
+        return label
+
+    def on_signal(self, signum, frame):
+        stack = []
+        while frame is not None:
+            stack.append(self.label(frame.f_code))
+            frame = frame.f_back
+
+        key = ";".join(reversed(stack))
+        self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def start(self):
+        self.previous_handler = signal.signal(signal.SIGPROF, self.on_signal)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0)
+        signal.signal(signal.SIGPROF, self.previous_handler or signal.SIG_DFL)
+
+
+def folded(stacks, prefix=None):
+    """ Folded stacks as text, optionally under a common root frame """
+
+    return "".join(
+        "{}{} {}\n".format(prefix + ";" if prefix else "", stack, count)
+        for stack, count in sorted(stacks.items())
+    )
+
+
+class Profiler(object):
+    """ Time-boxed profiles of the slaves, on request of the master """
+
+    def __init__(self, logger, max_seconds=MAX_SECONDS):
+        self.logger = logger
+        self.max_seconds = max_seconds
+        self.sampling = False
+        # Profiles the master is waiting for: {profile ID: {"pending": ..., "stacks": ..., "done": ...}}
+        self.profiles = {}
+
+    def sample(self, seconds, interval):
+        """ Profile this process, returns the folded stacks, None when already profiling """
+
+        if self.sampling:
+            return None
+
+        self.sampling = True
+        sampler = Sampler(interval)
+        self.logger.info("Profiling for %.1f seconds ...", seconds)
+        sampler.start()
+        try:
+            gevent.sleep(seconds)
+        finally:
+            sampler.stop()
+            self.sampling = False
+        self.logger.info("Profiled %s samples", sampler.samples)
+
+        return sampler.stacks
+
+    def answer(self, request):
+        """ Profile this slave, and send the stacks to the master """
+
+        stacks = self.sample(request["seconds"], request["interval"])
+        runner = runners.locust_runner
+        runner.client.send(Message(
+            PROFILE_RESULT,
+            {"id": request["id"], "stacks": stacks or {}, "busy": stacks is None},
+            runner.client_id
+        ))
+
+    def on_request(self, request):
+        gevent.spawn(self.answer, request)
+
+    def on_result(self, client_id, result):
+        profile = self.profiles.get(result["id"])
+        if profile is None or client_id not in profile["pending"]:
+            return
+
+        if result["busy"]:
+            self.logger.warning("Slave %s is already profiling", client_id)
+        profile["pending"].discard(client_id)
+        profile["stacks"][client_id] = result["stacks"]
+        if not profile["pending"]:
+            profile["done"].set()
+
+    def profile_slaves(self, client_ids, seconds, interval):
+        """ Profile slaves, returns {client ID: stacks} of the slaves which answered in time """
+
+        id = uuid.uuid4().hex
+        profile = self.profiles[id] = {"pending": set(client_ids), "stacks": {}, "done": gevent.event.Event()}
+        request = {"id": id, "seconds": seconds, "interval": interval}
+        for client_id in client_ids:
+            runners.locust_runner.server.send_to_client(Message(PROFILE, request, client_id))
+
+        profile["done"].wait(seconds + GRACE)
+        del self.profiles[id]
+        if profile["pending"]:
+            self.logger.warning("No profile from %s slave(s) in time", len(profile["pending"]))
+
+        return profile["stacks"]
+
+    def view(self):
+        from flask import Response, request
+
+        seconds = min(max(float(request.args.get("seconds", 10)), 0.1), self.max_seconds)
+        interval = max(float(request.args.get("interval", 0.005)), 0.001)
+        slave = request.args.get("slave")
+        runner = runners.locust_runner
+
+        if isinstance(runner, runners.MasterLocustRunner) and slave != "master":
+            client_ids = [slave] if slave else [
+                client.id for client in runner.clients.values() if client.state != runners.STATE_MISSING
+            ]
+            results = self.profile_slaves(client_ids, seconds, interval)
+        else:
+            stacks = self.sample(seconds, interval)
+            if stacks is None:
+                return Response("Already profiling\n", status=409, mimetype="text/plain")
+            results = {slave or "local": stacks}
+
+        if request.args.get("by_slave") == "1":
+            body = "".join(folded(stacks, client_id) for client_id, stacks in sorted(results.items()))
+        else:
+            merged = {}
+            for stacks in results.values():
+                for stack, count in stacks.items():
+                    merged[stack] = merged.get(stack, 0) + count
+            body = folded(merged)
+
+        response = Response(body, mimetype="text/plain")
+        response.headers["X-Profile-Slaves"] = ",".join(sorted(results))
+
+        return response
+
+    def intercept(self):
+        """ Handle the profile messages of the master's and slaves' sockets, ahead of Locust's runners """
+
+        client_recv = rpc.Client.recv
+        server_recv = rpc.Server.recv_from_client
+        profiler = self
+
+        def recv(socket):
+            while True:
+                msg = client_recv(socket)
+                if msg.type != PROFILE:
+                    return msg
+                profiler.on_request(msg.data)
+
+        def recv_from_client(socket):
+            while True:
+                client_id, msg = server_recv(socket)
+                if msg.type != PROFILE_RESULT:
+                    return client_id, msg
+                profiler.on_result(client_id, msg.data)
+
+        rpc.Client.recv = recv
+        rpc.Server.recv_from_client = recv_from_client
+
+    def install(self):
+        """ Handle the profile messages, and serve /profile """
+
+        self.intercept()
+
+        from locust.web import app
+
+        app.add_url_rule("/profile", "profile", self.view)
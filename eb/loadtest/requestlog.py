@@ -0,0 +1,100 @@
+# coding=utf-8
+
+# Request logging for CustomTaskSequence, cheap enough for the hot path
+#
+# * Messages are only formatted when the logger's level is enabled (lazy
+#   %-style arguments, checked before touching the response)
+# * Only 1 in `sample_rate` requests is logged (0 disables request logging)
+# * A bounded ring buffer keeps short summaries of the most recent requests,
+#   which can be dumped on demand, eg. with `kill -USR1 <follower pid>`
+
+from collections import deque
+from loadtest import client
+import logging
+import signal
+import time
+
+
+class RequestLog(object):
+    """ Log requests and keep a ring buffer of recent request summaries """
+
+    def __init__(self, logger, sample_rate=1, buffer_size=1000):
+        self.logger = logger
+        self.sample_rate = sample_rate
+        self.count = 0
+        # (timestamp, name, method, url, status code, response time in ms)
+        self.buffer = deque(maxlen=buffer_size) if buffer_size > 0 else None
+
+    def log(self, task_sequence, step, response, start_time):
+        """ Log a finished request, formatting only what will be emitted """
+
+        self.count += 1
+
+        if self.buffer is not None:
+            self.buffer.append((
+                start_time,
+                step.name,
+                step.method,
+                step.url,
+                response.status_code,
+                (time.time() - start_time) * 1000
+            ))
+
+        if not self.sample_rate or self.count % self.sample_rate:
+            return
+
+        if self.logger.isEnabledFor(logging.INFO):
+            self.logger.info(
+                "Run task_%s '%s' -- HTTP %s",
+                step.id,
+                step.description,
+                response.status_code
+            )
+
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("locust.client: %s", task_sequence.client.__dict__)
+            self.logger.debug(
+                "Response for task_%s '%s' -- HTTP %s (%s %s) -- Headers: %s -- Cookies: %s",
+                step.id,
+                step.description,
+                response.status_code,
+                step.method,
+                step.url,
+                response.headers,
+                client.cookies(task_sequence.client)
+            )
+
+    def summaries(self):
+        """ Format the buffered request summaries, oldest first """
+
+        if self.buffer is None:
+            return []
+
+        return [
+            "{} {} {} {} -- HTTP {} -- {:.0f} ms".format(
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(timestamp)),
+                name,
+                method,
+                url,
+                status_code,
+                response_time
+            )
+            for timestamp, name, method, url, status_code, response_time in list(self.buffer)
+        ]
+
+    def dump(self, *args):
+        """ Write the buffered request summaries to the log
+
+        Accepts (and ignores) signal handler arguments, see `install_dump_signal()`.
+
+        """
+
+        summaries = self.summaries()
+        self.logger.warning("Dumping the last %s request(s) ...", len(summaries))
+        for summary in summaries:
+            self.logger.warning(summary)
+
+    def install_dump_signal(self, signum=signal.SIGUSR1):
+        """ Dump the ring buffer when the process receives `signum` """
+
+        signal.signal(signum, self.dump)
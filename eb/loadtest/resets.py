@@ -0,0 +1,42 @@
+# coding=utf-8
+
+# An event for resets of Locust's statistics
+#
+# Locust 0.13 clears its statistics when a test starts, and resets them from
+# the web UI (/stats/reset) or once all users hatched (--reset-stats), without
+# an event. Statistics merged next to Locust's (see `loadtest/histogram.py`,
+# `loadtest/phases.py` and `loadtest/connections.py`) listen to
+# `reset_stats` instead, fired by the master or a local Locust whenever its
+# RequestStats are cleared or reset. Slaves reset their statistics with every
+# report, and don't fire it.
+
+from locust import runners
+from locust.events import EventHook
+from locust.stats import RequestStats
+
+reset_stats = EventHook()
+
+_installed = False
+
+
+def fire(method):
+    def wrapper(self, *args, **kwargs):
+        result = method(self, *args, **kwargs)
+        if not isinstance(runners.locust_runner, runners.SlaveLocustRunner):
+            reset_stats.fire()
+
+        return result
+
+    return wrapper
+
+
+def install():
+    """ Fire `reset_stats` from Locust's RequestStats (once per process) """
+
+    global _installed
+    if _installed:
+        return
+
+    RequestStats.reset_all = fire(RequestStats.reset_all)
+    RequestStats.clear_all = fire(RequestStats.clear_all)
+    _installed = True
@@ -0,0 +1,141 @@
+# coding=utf-8
+
+# Response handling modes of the steps
+#
+# By default, both HTTP client backends download every response body into
+# memory, and decompress it, though no task reads most of them. Each step of
+# the scenario file (see `loadtest/scenario.py`) picks how its responses are
+# handled, with LOCUST_RESPONSE_MODE as the default:
+#
+# * full: download and decode the whole body, Locust's behavior
+# * validate: decode at most the first `max_bytes` of the body, which must
+#   contain a substring ("contains") or match a regular expression
+#   ("matches") when set, and drain the rest without decoding it
+# * discard: drain the body without decoding it
+#
+# For example:
+#
+#   "response": {"mode": "validate", "contains": "<title>BlazeDemo", "max_bytes": 8192}
+#   "response": "discard"
+#
+# The streamed modes (validate and discard) read the body in chunks, so their
+# memory doesn't grow with the page size, and keep the connection alive. The
+# response time includes the download, and the response size counts the
+# bytes as sent (compressed). A validated response's `content` holds the
+# decoded prefix (eg. for CSRF tokens in the <head>, see `loadtest/csrf.py`),
+# a discarded response's is empty. A full response is checked as a whole.
+
+from loadtest import client
+import re
+import time
+import zlib
+
+MODES = ("full", "validate", "discard")
+
+# Decoded bytes of a validated response's body, when the step doesn't say
+MAX_BYTES = 16384
+
+# Bytes read from the socket at once, while draining
+CHUNK_SIZE = 65536
+
+
+class ResponseModeError(Exception):
+    """ Raised when a response mode is invalid """
+
+
+def decoder(response):
+    """ A zlib decompressor for a response's Content-Encoding, None when it's not compressed """
+
+    encoding = (response.headers.get("content-encoding") or "").lower()
+    if encoding == "gzip":
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if encoding == "deflate":
+        return zlib.decompressobj()
+
+    return None
+
+
+class ResponseMode(object):
+    """ How the responses of a step are handled, prebuilt from its definition """
+
+    __slots__ = ("mode", "contains", "matches", "max_bytes", "streamed")
+
+    def __init__(self, mode="full", contains=None, matches=None, max_bytes=MAX_BYTES):
+        if mode not in MODES:
+            raise ResponseModeError(
+                "Unknown response mode '{}', expected one of: {}".format(mode, ", ".join(MODES))
+            )
+        if mode == "discard" and (contains is not None or matches is not None):
+            raise ResponseModeError("Discarded responses can't be checked")
+
+        self.mode = mode
+        self.contains = contains.encode() if contains is not None else None
+        try:
+            self.matches = re.compile(matches.encode()) if matches is not None else None
+        except re.error as e:
+            raise ResponseModeError("Invalid regular expression '{}': {}".format(matches, e))
+        self.max_bytes = int(max_bytes) if mode == "validate" else 0
+        # Whether the body is read by `consume()`, rather than by the backend
+        self.streamed = mode != "full"
+
+    @classmethod
+    def load(cls, definition):
+        """ Build a step's response mode from the scenario file: a mode, or a dict with its options """
+
+        if isinstance(definition, dict):
+            definition = dict(definition)
+            mode = definition.pop("mode", "validate")
+            try:
+                return cls(mode, **definition)
+            except TypeError:
+                raise ResponseModeError("Unknown response options: {}".format(", ".join(sorted(definition))))
+
+        return cls(definition)
+
+    def check(self, content):
+        """ None when `content` passes the checks, otherwise the failure """
+
+        if self.contains is not None and self.contains not in content:
+            return "Response doesn't contain '{}'".format(self.contains.decode())
+        if self.matches is not None and self.matches.search(content) is None:
+            return "Response doesn't match '{}'".format(self.matches.pattern.decode())
+
+        return None
+
+    def consume(self, response):
+        """ Read a streamed response's body, returns the failure of its checks, or None
+
+        Decodes the first `max_bytes`, and drains the rest as is. The body's
+        download counts in the response time.
+
+        """
+
+        start = time.perf_counter()
+        size = 0
+        prefix = b""
+        decompressor = decoder(response) if self.max_bytes else None
+
+        try:
+            while True:
+                chunk = client.read_body(response, CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if len(prefix) < self.max_bytes:
+                    if decompressor is None:
+                        prefix += chunk[:self.max_bytes - len(prefix)]
+                    else:
+                        prefix += decompressor.decompress(chunk, self.max_bytes - len(prefix))
+        except Exception as e:
+            client.release_body(response, complete=False)
+            client.add_download(response, time.perf_counter() - start, size)
+            return e
+
+        client.release_body(response)
+        client.set_content(response, prefix)
+        client.add_download(response, time.perf_counter() - start, size)
+
+        return self.check(prefix)
+
+    def __repr__(self):
+        return "<ResponseMode {}>".format(self.mode)
@@ -0,0 +1,185 @@
+# coding=utf-8
+
+# Load generator saturation
+#
+# A slave whose CPU is maxed out can't keep up with its simulated users: its
+# gevent loop lags (see `loadtest/loop.py`), and the response times it
+# reports include its own queueing, not just the system under test. Every
+# slave (or a local run) measures, per report interval:
+#
+# * the mean event loop lag, and the maximum of the recent samples
+# * its CPU usage, and CPU time per request
+#
+# and flags itself as saturated when the mean lag exceeds `max_lag`, or the
+# CPU usage `max_cpu`. Slaves send this with their report to the master
+# (through an aggregator too, per slave), which logs when slaves become
+# saturated (and recover), marks them in the web UI's list of slaves
+# ("running (saturated)"), and serves the details at /saturation (JSON).
+
+from locust import events, runners
+import gevent
+import os
+
+# Seconds between checks of a local run (Locust's SLAVE_REPORT_INTERVAL)
+INTERVAL = 3.0
+
+
+class SaturationMonitor(object):
+    """ Measure a load generator's event loop lag and CPU usage, and flag saturation """
+
+    def __init__(self, logger, loop_lag, max_lag=0.05, max_cpu=0.9, board=None):
+        self.logger = logger
+        self.loop_lag = loop_lag
+        self.max_lag = max_lag
+        self.max_cpu = max_cpu
+        # SaturationBoard of a local run
+        self.board = board
+        self.saturated = False
+        # (elapsed time, CPU time, lag samples, lag total) of the previous check
+        self.previous = None
+        self.greenlet = None
+
+    def check(self, requests):
+        """ The status since the previous check, None at the first check """
+
+        times = os.times()
+        current = (times[4], times[0] + times[1], self.loop_lag.count, self.loop_lag.total)
+        previous, self.previous = self.previous, current
+        if previous is None:
+            return None
+
+        elapsed = max(current[0] - previous[0], 0.001)
+        cpu_time = current[1] - previous[1]
+        samples = current[2] - previous[2]
+        lag = (current[3] - previous[3]) / samples if samples else 0
+        cpu = cpu_time / elapsed
+        saturated = lag > self.max_lag or cpu > self.max_cpu
+
+        if saturated and not self.saturated:
+            self.logger.warning(
+                "Load generator saturated (event loop lag %.0f ms, CPU %.0f%%), response times include its own queueing",
+                lag * 1000,
+                cpu * 100
+            )
+        elif self.saturated and not saturated:
+            self.logger.info("Load generator no longer saturated")
+        self.saturated = saturated
+
+        return {
+            "saturated": saturated,
+            "lag": lag,
+            "max_lag": self.loop_lag.max(),
+            "cpu": cpu,
+            # Milliseconds
+            "cpu_per_request": cpu_time / requests * 1000 if requests else None,
+        }
+
+    def on_report_to_master(self, client_id, data):
+        status = self.check(data["stats_total"]["num_requests"])
+        if status is not None:
+            data["saturation"] = status
+
+    def run(self):
+        total = runners.locust_runner.stats.total
+        requests = total.num_requests
+        while True:
+            gevent.sleep(INTERVAL)
+            # Reset stats starts over
+            requests = min(requests, total.num_requests)
+            status = self.check(total.num_requests - requests)
+            requests = total.num_requests
+            if status is not None and self.board is not None:
+                # The monitor logs a local run's saturation itself
+                self.board.update("local", status, log=False)
+
+    def start(self, **kwargs):
+        runner = runners.locust_runner
+        if isinstance(runner, runners.MasterLocustRunner):
+            return
+
+        self.loop_lag.start()
+        if not isinstance(runner, runners.SlaveLocustRunner) and self.greenlet is None:
+            self.greenlet = gevent.spawn(self.run)
+
+    def install(self):
+        """ Hook into Locust's events
+
+        Install ahead of the compact reports' encoder (see
+        `loadtest/compact.py`), which leaves no requests in Locust's total.
+
+        """
+
+        events.report_to_master += self.on_report_to_master
+        events.locust_start_hatching += self.start
+
+
+class SaturationBoard(object):
+    """ The saturation status of each slave (master), or of a local run """
+
+    def __init__(self, logger):
+        self.logger = logger
+        # {client ID: status}
+        self.slaves = {}
+
+    def update(self, client_id, status, log=True):
+        previous = self.slaves.get(client_id)
+        self.slaves[client_id] = status
+        was_saturated = previous is not None and previous["saturated"]
+        if not log or status["saturated"] == was_saturated:
+            return
+
+        if status["saturated"]:
+            self.logger.warning(
+                "Slave %s saturated (event loop lag %.0f ms, CPU %.0f%%), its response times include its own queueing",
+                client_id,
+                status["lag"] * 1000,
+                status["cpu"] * 100
+            )
+        else:
+            self.logger.info("Slave %s no longer saturated", client_id)
+
+    def on_slave_report(self, client_id, data):
+        if "saturation" in data:
+            self.update(client_id, data["saturation"])
+
+        # Aggregated reports (see `loadtest/aggregator.py`)
+        for slave_id, slave in data.get("slaves", {}).items():
+            if "saturation" in slave:
+                self.update(slave_id, slave["saturation"])
+
+    def current(self):
+        """ {client ID: status} of the connected slaves """
+
+        runner = runners.locust_runner
+        if not isinstance(runner, runners.MasterLocustRunner):
+            return dict(self.slaves)
+
+        return {
+            client_id: status
+            for client_id, status in self.slaves.items()
+            if client_id in runner.clients
+        }
+
+    def annotate(self, report):
+        """ Mark saturated slaves in the web UI's report (see `loadtest/snapshot.py`) """
+
+        current = self.current()
+        for slave in report.get("slaves", []):
+            status = current.get(slave["id"])
+            if status is not None and status["saturated"]:
+                slave["state"] = "{} (saturated)".format(slave["state"])
+        report["saturated"] = sorted(client_id for client_id, status in current.items() if status["saturated"])
+
+    def install(self, snapshot=None):
+        """ Hook into Locust's events, the web UI's report, and serve /saturation """
+
+        events.slave_report += self.on_slave_report
+        if snapshot is not None:
+            snapshot.extensions.append(self.annotate)
+
+        from locust.web import app
+        from flask import jsonify
+
+        @app.route("/saturation")
+        def saturation():
+            return jsonify(self.current())
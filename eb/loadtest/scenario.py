@@ -0,0 +1,224 @@
+# coding=utf-8
+
+# Data-driven scenarios: TaskSequences built from a scenario file
+#
+# The scenario file is read once, at import of the Locustfile. Each step is
+# turned into a prebuilt Step, so running a task does no string building.
+# Request bodies and URLs are payload templates, see `loadtest/payload.py`.
+#
+# Scenario file format (JSON, or YAML when PyYAML is installed):
+#
+#   {
+#     "sequences": [
+#       {
+#         "name": "UserLogin",
+#         "weight": 100,
+#         "arrival_rate": 2.5,  (optional, iterations/sec, see loadtest/arrival.py)
+#         "steps": [
+#           {
+#             "id": "1103",
+#             "description": "(UserLogin) Log in as a unique user",
+#             "method": "POST",
+#             "url": "/login",
+#             "body": "email={email}&password={password}",
+#             "weight": 1,
+#             "order": 1103,
+#             "response": "discard"  (optional, see loadtest/responses.py)
+#           }
+#         ]
+#       }
+#     ]
+#   }
+
+from locust import seq_task, task
+from loadtest.arrival import ArrivalSchedule
+from loadtest.payload import Template, TemplateError
+from loadtest.responses import ResponseMode, ResponseModeError
+import json
+import os
+
+METHODS = ("GET", "POST")
+
+
+class ScenarioError(Exception):
+    """ Raised when a scenario file is invalid """
+
+
+class Step(object):
+    """ A single, prebuilt request in a TaskSequence
+
+    Steps are callables which Locust schedules like any other task: calling a
+    Step with a TaskSequence instance hands it to `run_step()`.
+
+    """
+
+    __slots__ = (
+        "id",
+        "description",
+        "method",
+        "url",
+        "url_template",
+        "body",
+        "response",
+        "name",
+        "locust_task_order",
+        "locust_task_weight",
+    )
+
+    def __init__(self, id, description, method, url, body=None, weight=1, order=None, response=None):
+        self.id = str(id)
+        self.description = description
+        self.method = method.upper()
+        # Template of a URL with placeholders (see `render_url()`), None for a constant URL
+        self.url_template = Template(url)
+        if self.url_template.slots:
+            self.url = url
+        else:
+            self.url = self.url_template.segments[0].decode()
+            self.url_template = None
+        self.body = body
+        # ResponseMode, None for the default (LOCUST_RESPONSE_MODE)
+        self.response = response
+        # Request name, as shown in the Locust statistics
+        self.name = "#{}: {}".format(self.id, self.description)
+        # Scheduling attributes, as set by @seq_task() and @task()
+        self.locust_task_order = int(self.id) if order is None else order
+        self.locust_task_weight = weight
+
+    def __call__(self, task_set):
+        return task_set.run_step(self)
+
+    def render_url(self, user_data):
+        """ The URL, with the values of `user_data` (see `loadtest/payload.py`) """
+
+        if self.url_template is None:
+            return self.url
+
+        return self.url_template.render(user_data).decode()
+
+    def __repr__(self):
+        return "<Step {} {} {}>".format(self.name, self.method, self.url)
+
+
+def read_scenario_file(path):
+    """ Parse a JSON or YAML scenario file """
+
+    with open(path) as f:
+        if os.path.splitext(path)[1] in (".yaml", ".yml"):
+            import yaml  # Optional, only required for YAML scenario files
+            return yaml.safe_load(f)
+
+        return json.load(f)
+
+
+def load_body(body):
+    """ Precompile a step's body into a payload Template """
+
+    if body is None:
+        return None
+
+    return Template(body)
+
+
+def load_response(response):
+    """ Prebuild a step's response handling into a ResponseMode """
+
+    if response is None:
+        return None
+
+    return ResponseMode.load(response)
+
+
+def load_steps(sequence):
+    """ Build the Steps of a single sequence definition """
+
+    steps = []
+
+    for definition in sequence.get("steps", []):
+        try:
+            step = Step(
+                id=definition["id"],
+                description=definition["description"],
+                method=definition.get("method", "GET"),
+                url=definition["url"],
+                body=load_body(definition.get("body")),
+                weight=definition.get("weight", 1),
+                order=definition.get("order"),
+                response=load_response(definition.get("response")),
+            )
+        except KeyError as e:
+            raise ScenarioError(
+                "Step in sequence '{}' is missing {}".format(sequence.get("name"), e)
+            )
+        except TemplateError as e:
+            raise ScenarioError(
+                "Step in sequence '{}' has an invalid body or URL: {}".format(sequence.get("name"), e)
+            )
+        except ResponseModeError as e:
+            raise ScenarioError(
+                "Step in sequence '{}' has an invalid response: {}".format(sequence.get("name"), e)
+            )
+
+        if step.method not in METHODS:
+            raise ScenarioError(
+                "Step {} has unsupported method '{}'".format(step.name, step.method)
+            )
+
+        steps.append(step)
+
+    steps.sort(key=lambda step: step.locust_task_order)
+
+    return steps
+
+
+def build_task_sequences(path, base_class, arrival_rate=0, max_lag=1.0, paced=False, data_columns=None):
+    """ Create a TaskSequence subclass per sequence in the scenario file
+
+    Sequences with an "arrival_rate" get an ArrivalSchedule (as `schedule`).
+    A total `arrival_rate` is split over the other sequences by weight. With
+    `paced`, all sequences get an ArrivalSchedule, paused until the rate is
+    set (eg. by the requests/sec budget, see `loadtest/budget.py`). The
+    bodies' and URLs' {data.<column>} placeholders must be in `data_columns`,
+    the columns of the dataset (None without one, see `loadtest/feeder.py`).
+
+    Returns a {TaskSequence: weight} dict, for use as `TaskSet.tasks`.
+
+    """
+
+    scenario = read_scenario_file(path)
+    sequences = scenario.get("sequences", [])
+    task_sequences = {}
+    total_weight = sum(sequence.get("weight", 100) for sequence in sequences)
+
+    for sequence in sequences:
+        if "name" not in sequence:
+            raise ScenarioError("Sequence without a name in {}".format(path))
+
+        rate = sequence.get("arrival_rate")
+        if rate is None and arrival_rate:
+            rate = arrival_rate * sequence.get("weight", 100) / total_weight
+
+        class_dict = {
+            "schedule": ArrivalSchedule(sequence["name"], rate or 0, max_lag) if rate or paced else None,
+        }
+        for step in load_steps(sequence):
+            if step.body is not None:
+                try:
+                    step.body.check_columns(data_columns)
+                except TemplateError as e:
+                    raise ScenarioError("Step {} has an invalid body: {}".format(step.name, e))
+            if step.url_template is not None:
+                try:
+                    step.url_template.check_columns(data_columns)
+                except TemplateError as e:
+                    raise ScenarioError("Step {} has an invalid URL: {}".format(step.name, e))
+
+            # Register the step like @seq_task(order) @task(weight) would
+            class_dict["task_{}".format(step.id)] = seq_task(step.locust_task_order)(
+                task(step.locust_task_weight)(step)
+            )
+
+        task_sequence = type(str(sequence["name"]), (base_class,), class_dict)
+        task_sequences[task_sequence] = sequence.get("weight", 100)
+
+    return task_sequences
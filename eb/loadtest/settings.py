@@ -0,0 +1,130 @@
+# coding=utf-8
+
+# Load test settings, read from environment variables
+#
+# On Elastic Beanstalk, set these as environment properties (see
+# `aws:elasticbeanstalk:application:environment` in .ebextensions/setup.config).
+# Locally, export them before running `make smoketest`.
+
+import os
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Scenario file (JSON, or YAML when PyYAML is installed) defining the TaskSequences
+SCENARIO_FILE = os.environ.get(
+    "LOCUST_SCENARIO_FILE",
+    os.path.join(BASE_DIR, "scenarios.json")
+)
+
+# Log level of the "locust" logger used by the Locustfile
+LOG_LEVEL = os.environ.get("LOCUST_LOG_LEVEL", "INFO").upper()
+
+# Log 1 in N requests (1: log every request, 0: disable request logging)
+REQUEST_LOG_SAMPLE_RATE = int(os.environ.get("LOCUST_REQUEST_LOG_SAMPLE_RATE", "1"))
+
+# Number of recent request summaries kept in memory, dumped on SIGUSR1 (0: disabled)
+REQUEST_LOG_BUFFER_SIZE = int(os.environ.get("LOCUST_REQUEST_LOG_BUFFER_SIZE", "1000"))
+
+# HTTP client backend: "requests" (HttpLocust) or "fasthttp" (FastHttpLocust)
+CLIENT_BACKEND = os.environ.get("LOCUST_CLIENT_BACKEND", "requests").lower()
+
+# Send a CSRF token with POST requests (0: disabled, 1: enabled)
+CSRF = os.environ.get("LOCUST_CSRF", "0") == "1"
+
+# Seconds a CSRF token is reused before fetching a new one
+CSRF_TTL = float(os.environ.get("LOCUST_CSRF_TTL", "300"))
+
+# Pick up CSRF tokens from pages fetched by GET steps (0: disabled, 1: enabled)
+CSRF_HARVEST = os.environ.get("LOCUST_CSRF_HARVEST", "1") == "1"
+
+# Seconds each simulated user waits between tasks, picked at random between min and max
+WAIT_TIME_MIN = float(os.environ.get("LOCUST_WAIT_TIME_MIN", "0.5"))
+WAIT_TIME_MAX = float(os.environ.get("LOCUST_WAIT_TIME_MAX", "1.5"))
+
+# Iterations/sec of all sequences together, per Locust slave, split by weight (0: closed model)
+ARRIVAL_RATE = float(os.environ.get("LOCUST_ARRIVAL_RATE", "0"))
+
+# Seconds an iteration may start after its slot, before the slot counts as missed
+ARRIVAL_MAX_LAG = float(os.environ.get("LOCUST_ARRIVAL_MAX_LAG", "1"))
+
+# Directory for the time-series statistics export of the master (empty: disabled)
+EXPORT_DIR = os.environ.get("LOCUST_EXPORT_DIR", "")
+
+# Seconds per exported interval
+EXPORT_INTERVAL = float(os.environ.get("LOCUST_EXPORT_INTERVAL", "10"))
+
+# Size in bytes after which the export starts a new file
+EXPORT_MAX_BYTES = int(os.environ.get("LOCUST_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Requests/sec of the whole cluster, split over the slaves by the master (0: disabled)
+TARGET_RPS = float(os.environ.get("LOCUST_TARGET_RPS", "0"))
+
+# Seconds between rebalancing the requests/sec budget
+BUDGET_INTERVAL = float(os.environ.get("LOCUST_BUDGET_INTERVAL", "5"))
+
+# Port of the master's web UI, from which slaves fetch their requests/sec budget
+MASTER_WEB_PORT = int(os.environ.get("LOCUST_MASTER_WEB_PORT", "9876"))
+
+# Host of the master's web UI, when slaves connect to the master through an
+# aggregator (set by the supervisor; empty: the master host)
+MASTER_WEB_HOST = os.environ.get("LOCUST_MASTER_WEB_HOST", "")
+
+# Send compact slave reports, with interned names and errors, once the master
+# accepts them (0: Locust's format)
+COMPACT_REPORTS = os.environ.get("LOCUST_COMPACT_REPORTS", "1") == "1"
+
+# Seconds between rebuilds of the web UI's statistics snapshot
+STATS_SNAPSHOT_INTERVAL = float(os.environ.get("LOCUST_STATS_SNAPSHOT_INTERVAL", "2"))
+
+# Port of the first slave's /metrics endpoint on each instance, the next
+# slaves use the next ports (0: disabled)
+SLAVE_METRICS_PORT = int(os.environ.get("LOCUST_SLAVE_METRICS_PORT", "0"))
+
+# Mean event loop lag (seconds) and CPU usage (1: a whole core) per report
+# interval above which a load generator counts as saturated
+SATURATION_MAX_LAG = float(os.environ.get("LOCUST_SATURATION_MAX_LAG", "0.05"))
+SATURATION_MAX_CPU = float(os.environ.get("LOCUST_SATURATION_MAX_CPU", "0.9"))
+
+# Time the phases of every request: DNS, connect, TLS, TTFB, download (0: disabled, 1: enabled)
+PHASE_TIMING = os.environ.get("LOCUST_PHASE_TIMING", "0") == "1"
+
+# Connections of the simulated users: "user" (kept alive per user), "shared"
+# (one pool per slave) or "iteration" (new connections every iteration)
+CONNECTION_POLICY = os.environ.get("LOCUST_CONNECTION_POLICY", "user")
+
+# Connections per host of each pool (0: 10 per user, 100 for the shared pool)
+POOL_SIZE = int(os.environ.get("LOCUST_POOL_SIZE", "0"))
+
+# Simulated users close their connections before waits of at least this many
+# seconds (0: disabled)
+IDLE_RELEASE = float(os.environ.get("LOCUST_IDLE_RELEASE", "0"))
+
+# Seconds to cache name resolutions of the target (0: disabled)
+DNS_CACHE_TTL = float(os.environ.get("LOCUST_DNS_CACHE_TTL", "0"))
+
+# Count the requests which opened a new connection or reused one (0: disabled, 1: enabled)
+CONNECTION_STATS = os.environ.get("LOCUST_CONNECTION_STATS", "0") == "1"
+
+# Response handling of the steps which don't set one in the scenario file:
+# "full" (download and decode), "validate" (decode the first 16 KB) or "discard"
+RESPONSE_MODE = os.environ.get("LOCUST_RESPONSE_MODE", "full")
+
+# CSV or JSONL dataset whose rows fill the payload templates, split over the
+# slaves so no two simulated users share a row (empty: disabled)
+FEEDER_FILE = os.environ.get("LOCUST_FEEDER_FILE", "")
+
+# Order of the rows: "sequential", "random" or "unique" (each row used once)
+FEEDER_POLICY = os.environ.get("LOCUST_FEEDER_POLICY", "sequential")
+
+# Simulated users take a row once ("user"), or every iteration ("iteration")
+FEEDER_SCOPE = os.environ.get("LOCUST_FEEDER_SCOPE", "user")
+
+# Rows per block which the master leases to a slave
+FEEDER_BLOCK_SIZE = int(os.environ.get("LOCUST_FEEDER_BLOCK_SIZE", "1000"))
+
+# JSON or YAML file of a load shape (stages, step, ramp, spike, or a capacity
+# search), which the master follows from the start of the test (empty: disabled)
+SHAPE_FILE = os.environ.get("LOCUST_SHAPE_FILE", "")
+
+# Serve on-demand stack profiles of the slaves at /profile (0: disabled, 1: enabled)
+PROFILER = os.environ.get("LOCUST_PROFILER", "0") == "1"
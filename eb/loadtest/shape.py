@@ -0,0 +1,478 @@
+# coding=utf-8
+
+# Load shapes: the number of simulated users over time, set by the master
+#
+# With LOCUST_SHAPE_FILE (JSON, or YAML like the scenario file), the master
+# (or a local Locust) sets the number of users and the hatch rate as the
+# test goes, from the start of the swarm: started from the web UI (whose
+# numbers are overridden), by POST /shape, or with --no-web. The test
+# stops at the end of the shape. Shapes:
+#
+#   {"shape": "stages", "stages": [{"duration": 60, "users": 10, "hatch_rate": 10}, ...]}
+#   {"shape": "step", "start_users": 10, "step_users": 10, "steps": 5, "step_duration": 60, "hatch_rate": 10}
+#   {"shape": "ramp", "start_users": 0, "end_users": 100, "duration": 300, "interval": 10}
+#   {"shape": "spike", "users": 20, "spike_users": 200, "before": 60, "duration": 30, "after": 60, "hatch_rate": 100}
+#   {"shape": "capacity", "start_users": 10, "step_users": 10, "step_duration": 60, "max_users": 1000,
+#    "hatch_rate": 10, "slo_ms": 500, "slo_percentile": 95, "max_failure_ratio": 0.01}
+#
+# The capacity search raises the users in steps, and measures each step's
+# requests/sec, response time percentile and failure ratio, once the step
+# has settled (after `settle` of its duration, and up to the last reports).
+# Only the requests to the target count: the iterations and missed slots of
+# the arrival-rate mode (see `loadtest/arrival.py`) are left out.
+# It stops at the knee: the first step which breaks the latency SLO or the
+# failure ratio, or the `patience`-th step in a row whose requests/sec grew
+# by less than `min_efficiency` of its users, over the best step so far (eg.
+# 0.2: 10% more users for less than 2% more requests/sec). The maximum
+# sustainable requests/sec is the highest of the steps within the SLO. The
+# steps and the result are logged, and served at /shape, along with the
+# shape's progress.
+#
+# Shapes can be defined in the Locustfile as well: any LoadShape, whose
+# tick() returns the users and hatch rate for the elapsed time.
+
+from locust import events, runners
+from loadtest.arrival import REQUEST_TYPE as ITERATION
+from loadtest.histogram import Histogram
+from loadtest.scenario import read_scenario_file
+import gevent
+import math
+import time
+
+# Seconds between ticks of the shape
+TICK_INTERVAL = 1
+
+# Seconds before the requests of a second are all reported: Locust's slaves
+# report every 3 seconds
+REPORT_LAG = 4
+
+# Seconds of per-second request counts kept
+HISTORY = 3600
+
+
+class ShapeError(Exception):
+    """ Raised when a load shape is invalid """
+
+
+class LoadMonitor(object):
+    """ Requests and failures per second, and response times since the last take, of the whole test
+
+    Iterations and missed slots of the arrival-rate mode (see
+    `loadtest/arrival.py`) aren't requests of the target, and are left out.
+
+    """
+
+    def __init__(self):
+        # {second: [requests, failures]}
+        self.seconds = {}
+        self.histogram = Histogram()
+
+    def add(self, second, requests, failures):
+        counts = self.seconds.get(second)
+        if counts is None:
+            counts = self.seconds[second] = [0, 0]
+            if len(self.seconds) > HISTORY:
+                for old in sorted(self.seconds)[:len(self.seconds) - HISTORY]:
+                    del self.seconds[old]
+        counts[0] += requests
+        counts[1] += failures
+
+    def on_request_success(self, request_type, name, response_time, response_length, **kwargs):
+        if request_type == ITERATION:
+            return
+        self.add(int(time.time()), 1, 0)
+        if response_time is not None:
+            self.histogram.record(response_time * 1000)
+
+    def on_request_failure(self, request_type, name, response_time, response_length, exception, **kwargs):
+        if request_type == ITERATION:
+            return
+        self.add(int(time.time()), 1, 1)
+        if response_time is not None:
+            self.histogram.record(response_time * 1000)
+
+    def on_slave_report(self, client_id, data):
+        iterations = set()
+        for entry in data["stats"]:
+            if entry["method"] == ITERATION:
+                iterations.add(entry["name"])
+                continue
+            failures = entry["num_fail_per_sec"]
+            for second, requests in entry["num_reqs_per_sec"].items():
+                self.add(int(second), requests, failures.get(second, 0))
+
+        for name, encoded in data.get("histograms", {}).items():
+            if name not in iterations:
+                self.histogram.merge_encoded(encoded)
+
+    def counts(self, start, end):
+        """ (requests, failures) from second `start` up to `end` """
+
+        requests = failures = 0
+        for second in range(int(start), int(end)):
+            counts = self.seconds.get(second)
+            if counts is not None:
+                requests += counts[0]
+                failures += counts[1]
+
+        return requests, failures
+
+    def take_histogram(self):
+        """ The response times since the last take """
+
+        histogram, self.histogram = self.histogram, Histogram()
+
+        return histogram
+
+    def reset(self):
+        self.seconds = {}
+        self.histogram = Histogram()
+
+
+class LoadShape(object):
+    """ Users and hatch rate over time """
+
+    def tick(self, elapsed, monitor):
+        """ (users, hatch rate) `elapsed` seconds into the test, None once the shape is over """
+
+        raise NotImplementedError
+
+    def reset(self):
+        """ Start over, for a new test """
+
+    def status(self):
+        return {}
+
+
+class Stages(LoadShape):
+    """ A number of users for a duration, stage after stage """
+
+    def __init__(self, stages):
+        # (end, users, hatch rate) of each stage, in seconds from the start
+        self.stages = []
+        end = 0
+        for duration, users, hatch_rate in stages:
+            if duration <= 0 or users < 0 or hatch_rate <= 0:
+                raise ShapeError("Invalid stage: {} users at {}/s for {} s".format(users, hatch_rate, duration))
+            end += duration
+            self.stages.append((end, int(users), hatch_rate))
+        if not self.stages:
+            raise ShapeError("A load shape needs at least one stage")
+        self.reset()
+
+    def reset(self):
+        self.stage = 0
+
+    def tick(self, elapsed, monitor):
+        # Response times aren't needed
+        monitor.take_histogram()
+
+        for index, (end, users, hatch_rate) in enumerate(self.stages):
+            if elapsed < end:
+                self.stage = index
+                return users, hatch_rate
+
+        return None
+
+    def status(self):
+        return {"stage": self.stage + 1, "stages": len(self.stages), "duration": self.stages[-1][0]}
+
+
+def step(start_users, step_users, steps, step_duration, hatch_rate):
+    """ Stages of `start_users`, raised by `step_users` every `step_duration` seconds """
+
+    return Stages([(step_duration, start_users + index * step_users, hatch_rate) for index in range(steps)])
+
+
+def ramp(start_users, end_users, duration, hatch_rate=None, interval=10):
+    """ Stages of `interval` seconds, from `start_users` to `end_users` in `duration` seconds """
+
+    count = max(int(math.ceil(duration / float(interval))), 1)
+    change = (end_users - start_users) / float(count)
+    if hatch_rate is None:
+        # Fast enough for each stage's users
+        hatch_rate = max(abs(change) / interval * 2, 1)
+
+    return Stages([
+        (duration / float(count), int(round(start_users + (index + 1) * change)), hatch_rate)
+        for index in range(count)
+    ])
+
+
+def spike(users, spike_users, before, duration, after, hatch_rate):
+    """ `users`, `spike_users` for `duration` seconds, then `users` again """
+
+    return Stages([(before, users, hatch_rate), (duration, spike_users, hatch_rate), (after, users, hatch_rate)])
+
+
+class CapacitySearch(LoadShape):
+    """ Raise the users in steps, until the knee: throughput plateaus, or the latency SLO breaks """
+
+    def __init__(self, start_users=10, step_users=10, step_duration=60, max_users=10000, hatch_rate=10,
+                 slo_ms=0, slo_percentile=95, max_failure_ratio=0.01, min_efficiency=0.2, patience=2, settle=0.3):
+        if start_users <= 0 or step_users <= 0 or hatch_rate <= 0:
+            raise ShapeError("A capacity search needs positive start_users, step_users and hatch_rate")
+        if step_duration * (1 - settle) <= REPORT_LAG + 1:
+            raise ShapeError("Steps of {} s are too short to measure, once settled".format(step_duration))
+
+        self.start_users = int(start_users)
+        self.step_users = int(step_users)
+        self.step_duration = step_duration
+        self.max_users = max_users
+        self.hatch_rate = hatch_rate
+        self.slo_ms = slo_ms
+        self.slo_percentile = slo_percentile
+        self.max_failure_ratio = max_failure_ratio
+        self.min_efficiency = min_efficiency
+        self.patience = patience
+        self.settle = settle
+
+        self.reset()
+
+    def reset(self):
+        self.started = None
+        self.step = 0
+        # Response times of the current step, once settled
+        self.histogram = Histogram()
+        # Measurements of the finished steps, and the knee once found
+        self.steps = []
+        self.flat_steps = 0
+        self.result = None
+
+    def users(self, step):
+        return self.start_users + step * self.step_users
+
+    def tick(self, elapsed, monitor):
+        if self.started is None:
+            self.started = time.time() - elapsed
+
+        if self.result is not None:
+            return None
+
+        step = int(elapsed // self.step_duration)
+        if step > self.step:
+            self.measure(monitor)
+            if self.result is None and self.users(step) > self.max_users:
+                self.finish("max_users reached, no knee found")
+            if self.result is not None:
+                return None
+            self.step = step
+            self.histogram = Histogram()
+
+        # Response times of the settled part of the step
+        histogram = monitor.take_histogram()
+        if elapsed - self.step * self.step_duration >= self.step_duration * self.settle + REPORT_LAG:
+            self.histogram.merge(histogram)
+
+        return self.users(self.step), self.hatch_rate
+
+    def measure(self, monitor):
+        """ Measure the finished step, and look for the knee """
+
+        step_start = self.started + self.step * self.step_duration
+        start = step_start + self.step_duration * self.settle
+        end = step_start + self.step_duration - REPORT_LAG
+        requests, failures = monitor.counts(start, end)
+        seconds = int(end) - int(start)
+
+        measured = {
+            "users": self.users(self.step),
+            "rps": requests / float(seconds),
+            "latency_ms": self.histogram.percentile(self.slo_percentile / 100.0) / 1000,
+            "failure_ratio": failures / float(requests) if requests else 0,
+            "efficiency": None,
+        }
+        measured["within_slo"] = (not self.slo_ms or measured["latency_ms"] <= self.slo_ms) and \
+            measured["failure_ratio"] <= self.max_failure_ratio and requests > 0
+
+        # Growth over the best step so far, relative to the users added
+        best = max(self.steps, key=lambda step: step["rps"]) if self.steps else None
+        if best is not None and best["rps"] > 0:
+            measured["efficiency"] = (measured["rps"] / best["rps"] - 1) / (measured["users"] / float(best["users"]) - 1)
+        self.steps.append(measured)
+
+        if not measured["within_slo"]:
+            self.finish("SLO broken at {} users".format(measured["users"]))
+        elif measured["efficiency"] is not None and measured["efficiency"] < self.min_efficiency:
+            self.flat_steps += 1
+            if self.flat_steps >= self.patience:
+                self.finish("throughput plateaued at {} users".format(measured["users"]))
+        else:
+            self.flat_steps = 0
+
+        return measured
+
+    def finish(self, reason):
+        within = [measured for measured in self.steps if measured["within_slo"]]
+        best = max(within, key=lambda measured: measured["rps"]) if within else None
+        self.result = {
+            "reason": reason,
+            "max_sustainable_rps": best["rps"] if best else None,
+            "users": best["users"] if best else None,
+        }
+
+    def status(self):
+        return {
+            "step": self.step + 1,
+            "users": self.users(self.step),
+            "slo_ms": self.slo_ms,
+            "slo_percentile": self.slo_percentile,
+            "steps": self.steps,
+            "result": self.result,
+        }
+
+
+SHAPES = {
+    "stages": lambda definition: Stages(
+        (stage["duration"], stage["users"], stage.get("hatch_rate", stage["users"] or 1))
+        for stage in definition.pop("stages")
+    ),
+    "step": lambda definition: step(**definition),
+    "ramp": lambda definition: ramp(**definition),
+    "spike": lambda definition: spike(**definition),
+    "capacity": lambda definition: CapacitySearch(**definition),
+}
+
+
+def load_shape(definition):
+    """ Build a LoadShape from its definition, eg. {"shape": "step", ...} """
+
+    definition = dict(definition)
+    name = definition.pop("shape", None)
+    if name not in SHAPES:
+        raise ShapeError("Unknown load shape '{}', expected one of: {}".format(name, ", ".join(sorted(SHAPES))))
+
+    try:
+        return SHAPES[name](definition)
+    except (KeyError, TypeError) as e:
+        raise ShapeError("Invalid {} shape: {}".format(name, e))
+
+
+def load_shape_file(path):
+    """ Build a LoadShape from a JSON or YAML file """
+
+    try:
+        return load_shape(read_scenario_file(path))
+    except (OSError, ValueError) as e:
+        raise ShapeError("Can't read load shape '{}': {}".format(path, e))
+
+
+class ShapeController(object):
+    """ Apply a LoadShape to the swarm (master, or a local Locust) """
+
+    def __init__(self, logger, shape, interval=TICK_INTERVAL):
+        self.logger = logger
+        self.shape = shape
+        self.interval = interval
+        self.monitor = LoadMonitor()
+        self.greenlet = None
+        self.started = None
+        self.target = None
+        self.logged_steps = 0
+
+    def start(self, **kwargs):
+        """ Follow the shape from the start of the swarm """
+
+        if self.greenlet is not None or isinstance(runners.locust_runner, runners.SlaveLocustRunner):
+            return
+
+        self.shape.reset()
+        self.monitor.reset()
+        self.started = time.time()
+        self.target = None
+        self.logged_steps = 0
+        self.greenlet = gevent.spawn(self.run)
+
+    def stop(self, **kwargs):
+        if self.greenlet is not None:
+            greenlet, self.greenlet = self.greenlet, None
+            if greenlet is not gevent.getcurrent():
+                greenlet.kill(block=False)
+
+    def run(self):
+        # After the hatching which started the swarm
+        gevent.sleep(0)
+        while True:
+            target = self.shape.tick(time.time() - self.started, self.monitor)
+            self.log_steps()
+            if target is None:
+                self.finish()
+                return
+
+            if target != self.target:
+                self.target = target
+                self.logger.info("Load shape: %s users, hatch rate %g/s", target[0], target[1])
+                runners.locust_runner.start_hatching(target[0], target[1])
+
+            gevent.sleep(self.interval)
+
+    def log_steps(self):
+        """ Log the capacity search's newly measured steps """
+
+        steps = getattr(self.shape, "steps", [])
+        for measured in steps[self.logged_steps:]:
+            self.logger.info(
+                "Capacity step: %s users, %.1f requests/sec, p%g %.1f ms, %.2f%% failures, efficiency %s",
+                measured["users"],
+                measured["rps"],
+                self.shape.slo_percentile,
+                measured["latency_ms"],
+                measured["failure_ratio"] * 100,
+                "-" if measured["efficiency"] is None else "{:.2f}".format(measured["efficiency"])
+            )
+        self.logged_steps = len(steps)
+
+    def finish(self):
+        result = getattr(self.shape, "result", None)
+        if result is not None:
+            self.logger.info(
+                "Capacity: %s; max sustainable %s requests/sec, at %s users",
+                result["reason"],
+                "-" if result["max_sustainable_rps"] is None else "{:.1f}".format(result["max_sustainable_rps"]),
+                "-" if result["users"] is None else result["users"]
+            )
+        self.logger.info("Load shape finished, stopping the test")
+
+        runner = runners.locust_runner
+        self.stop()
+        if runner.options.no_web:
+            runner.quit()
+        else:
+            runner.stop()
+
+    def status(self):
+        return dict(
+            self.shape.status(),
+            running=self.greenlet is not None,
+            elapsed=time.time() - self.started if self.started is not None else None,
+            target_users=self.target[0] if self.target else None,
+        )
+
+    def install(self):
+        """ Hook into Locust's events, and serve the shape's progress at /shape """
+
+        events.request_success += self.monitor.on_request_success
+        events.request_failure += self.monitor.on_request_failure
+        events.slave_report += self.monitor.on_slave_report
+        events.master_start_hatching += self.start
+        events.master_stop_hatching += self.stop
+        events.locust_stop_hatching += self.stop
+
+        # A local run's start (slaves fire it too, but don't follow the shape)
+        def on_locust_start_hatching(**kwargs):
+            if not isinstance(runners.locust_runner, runners.MasterLocustRunner):
+                self.start()
+        events.locust_start_hatching += on_locust_start_hatching
+
+        from locust.web import app
+        from flask import jsonify, request
+
+        @app.route("/shape", methods=["GET", "POST"])
+        def shape():
+            if request.method == "POST" and self.greenlet is None:
+                # Start the swarm at the shape's first step
+                target = self.shape.tick(0, self.monitor)
+                if target is not None:
+                    runners.locust_runner.start_hatching(target[0], target[1])
+
+            return jsonify(self.status())
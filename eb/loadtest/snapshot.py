@@ -0,0 +1,151 @@
+# coding=utf-8
+
+# Cached statistics snapshot for the web UI
+#
+# The web UI polls /stats/requests every 2 seconds, and Locust builds and
+# serializes the whole report for every poll of every browser. With a team
+# watching a big test, that's work for the master's single gevent loop which
+# the load test itself needs. Instead:
+#
+# * the report is built at most once per `interval`, when polled, and kept as
+#   compact JSON with a version; the version only changes when the report does
+# * /stats/requests (Locust's own, used by its UI) serves the snapshot with an
+#   ETag, so browsers revalidate, and get "304 Not Modified" while it's unchanged
+# * /stats/snapshot?since=<version> serves only the request and error rows
+#   which changed since that version (all rows when it's unknown, or rows were
+#   removed since, eg. by a reset), with the same top-level fields
+# * nginx (see .ebextensions/nginx/nginx.conf) caches both for a second, so
+#   the master's load doesn't grow with the number of viewers
+#
+# Versions are "<process>-<counter>", so versions of a restarted master
+# never match.
+
+from flask import Response, json, request
+from locust import web
+import time
+import uuid
+
+# Fields of the report which are lists of rows, and the fields identifying a row
+ROWS = {
+    "stats": ("method", "name"),
+    "errors": ("method", "name", "error"),
+}
+
+
+class StatsSnapshot(object):
+    """ Build Locust's statistics report once per interval, serve it with ETags and incrementally """
+
+    def __init__(self, interval=2.0, max_increments=100):
+        self.interval = interval
+        self.process = uuid.uuid4().hex[:8]
+        self.counter = 0
+        self.built = None
+        self.report = None
+        self.body = None
+        # {(field, row key): (counter at which the row last changed, row)}
+        self.rows = {}
+        # Counter at which rows were last removed
+        self.removed = 0
+        # Incremental bodies of the current version, by `since`
+        self.increments = {}
+        self.max_increments = max_increments
+        # Functions which add to Locust's report (in place), before it's versioned
+        self.extensions = []
+
+    @property
+    def version(self):
+        return "{}-{}".format(self.process, self.counter)
+
+    def refresh(self):
+        """ Rebuild the report when it's older than `interval` """
+
+        now = time.time()
+        if self.built is not None and now - self.built < self.interval:
+            return
+
+        self.built = now
+        # Locust's report (memoized by Locust for a few seconds)
+        web.request_stats.clear_cache()
+        report = json.loads(web.request_stats().get_data())
+        for extend in self.extensions:
+            extend(report)
+        if report == self.report:
+            return
+
+        self.counter += 1
+        self.report = report
+        self.increments = {}
+
+        rows = {}
+        for field, key_fields in ROWS.items():
+            for row in report.get(field, []):
+                key = (field,) + tuple(row.get(name) for name in key_fields)
+                previous = self.rows.get(key)
+                changed = self.counter if previous is None or previous[1] != row else previous[0]
+                rows[key] = (changed, row)
+
+        if any(key not in rows for key in self.rows):
+            self.removed = self.counter
+        self.rows = rows
+
+        self.body = json.dumps(dict(report, version=self.version), separators=(",", ":"))
+
+    def since(self, version):
+        """ The report's rows changed since `version`, None when all rows are needed """
+
+        process, _, counter = version.partition("-")
+        if process != self.process or not counter.isdigit() or int(counter) > self.counter:
+            return None
+
+        counter = int(counter)
+        if counter < self.removed:
+            return None
+
+        report = {field: value for field, value in self.report.items() if field not in ROWS}
+        for field in ROWS:
+            report[field] = []
+        for key, (changed, row) in self.rows.items():
+            if changed > counter:
+                report[key[0]].append(row)
+
+        report["version"] = self.version
+        report["since"] = version
+
+        return report
+
+    def respond(self, body):
+        response = Response(body, mimetype="application/json")
+        response.set_etag(self.version)
+        # Cached, but revalidated with every poll
+        response.headers["Cache-Control"] = "no-cache"
+
+        return response.make_conditional(request)
+
+    def requests_view(self):
+        self.refresh()
+
+        return self.respond(self.body)
+
+    def snapshot_view(self):
+        self.refresh()
+
+        version = request.args.get("since")
+        if not version:
+            return self.respond(self.body)
+
+        body = self.increments.get(version)
+        if body is None:
+            report = self.since(version)
+            body = self.body if report is None else json.dumps(report, separators=(",", ":"))
+            if len(self.increments) < self.max_increments:
+                self.increments[version] = body
+
+        return self.respond(body)
+
+    def install(self):
+        """ Serve /stats/requests from the snapshot, and /stats/snapshot """
+
+        for rule in web.app.url_map.iter_rules():
+            if rule.rule == "/stats/requests":
+                web.app.view_functions[rule.endpoint] = self.requests_view
+        web.app.add_url_rule("/stats/snapshot", "stats_snapshot", self.snapshot_view)
@@ -0,0 +1,408 @@
+# coding=utf-8
+
+# Supervisor for the Locust slave (follower) processes of an instance
+#
+# * Starts one slave per physical CPU core, pinned to that core (all its
+#   hyperthreads), instead of one unpinned slave per logical CPU
+# * Keeps the first core free for the Locust master and nginx, when the
+#   master runs on this instance
+# * Restarts slaves which exit, re-reading the master's IP (.masterIP); a
+#   slave which keeps exiting soon after its start is restarted after a
+#   doubling delay (up to a minute), instead of every second
+# * Waits for .masterIP, and restarts all slaves when the master's IP changes
+#   (eg. on redeploy), so followers reconnect to the new master
+# * Optionally (LOCUST_AGGREGATOR=1) starts an aggregator, which merges the
+#   local slaves' reports before they reach the master (see
+#   `loadtest/aggregator.py`), and points the slaves at it
+# * Optionally (LOCUST_SLAVE_METRICS_PORT) gives every slave its own port for
+#   its /metrics endpoint (see `loadtest/metrics.py`)
+# * Optionally calibrates the number of slaves, and the number of users per
+#   slave, with a short benchmark against a local stand-in server
+# * Builds the line index of the test dataset (LOCUST_FEEDER_FILE, see
+#   `loadtest/feeder.py`) once, before the slaves start, when it's missing
+#
+# Run by the "locust-follower" process in the Procfile. To review the plan for
+# another machine, pass its /proc/cpuinfo:
+#
+#   python3 -m loadtest.supervisor --cpuinfo ./cpuinfo --dry-run
+
+import argparse
+import json
+import logging
+import os
+import signal
+import subprocess
+import sys
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+LOCAL_MASTER_HOSTS = ("127.0.0.1", "localhost")
+
+logger = logging.getLogger("locust.supervisor")
+
+
+def read_cores(cpuinfo="/proc/cpuinfo", allowed=None):
+    """ Group the logical CPUs in `cpuinfo` by physical core
+
+    Returns a list of sorted logical CPU lists, one per physical core, in
+    order of their first logical CPU. Logical CPUs not in `allowed` (eg. the
+    process' CPU affinity) are left out.
+
+    """
+
+    with open(cpuinfo) as f:
+        blocks = f.read().strip().split("\n\n")
+
+    cores = {}
+    for block in blocks:
+        fields = {}
+        for line in block.splitlines():
+            name, _, value = line.partition(":")
+            fields[name.strip()] = value.strip()
+
+        if "processor" not in fields:
+            continue
+
+        cpu = int(fields["processor"])
+        if allowed is not None and cpu not in allowed:
+            continue
+
+        # Without topology information, each logical CPU is its own core
+        core = (fields.get("physical id", cpu), fields.get("core id", cpu))
+        cores.setdefault(core, []).append(cpu)
+
+    return sorted(sorted(cpus) for cpus in cores.values())
+
+
+def plan_slaves(cores, reserve=0, count=None):
+    """ Assign CPUs to slave processes
+
+    Reserves the first `reserve` cores (for the master and nginx), unless that
+    would leave no cores for the slaves. By default, plans one slave per
+    remaining core; with `count`, slaves are spread round-robin over the
+    remaining logical CPUs.
+
+    Returns a list of CPU lists, one per slave.
+
+    """
+
+    available = cores[reserve:] if len(cores) > reserve else cores
+
+    if count is None:
+        return [list(cpus) for cpus in available]
+
+    if count <= len(available):
+        return [list(core) for core in available[:count]]
+
+    # First thread of every core, then the second thread of every core, ...
+    cpus = [
+        core[thread]
+        for thread in range(max(len(core) for core in available))
+        for core in available
+        if thread < len(core)
+    ]
+
+    return [[cpus[index % len(cpus)]] for index in range(count)]
+
+
+def restart_backoff(failures, delay=1, max_delay=60):
+    """ Seconds before restarting a slave which exited soon after its start `failures` times in a row """
+
+    return min(delay * 2 ** max(failures - 1, 0), max_delay)
+
+
+def read_master_host(path):
+    """ Read the master's IP, as written by build.rb """
+
+    with open(path) as f:
+        return f.read().strip()
+
+
+def calibrate(cores, reserve, args):
+    """ Benchmark slave counts, returns the best {"slaves": ..., "users_per_slave": ...} """
+
+    best = None
+    physical = len(plan_slaves(cores, reserve))
+    logical = len([cpu for core in plan_slaves(cores, reserve) for cpu in core])
+
+    for count in sorted(set((physical, logical))):
+        output = os.path.join(BASE_DIR, "bench", "results", "calibration-{}.json".format(count))
+        command = [
+            sys.executable, os.path.join(BASE_DIR, "bench", "swarm.py"),
+            "--slaves", str(count),
+            "--clients", str(args.calibration_users * count),
+            "--hatch-rate", str(args.calibration_users * count),
+            "--run-time", str(args.calibration_time),
+            "--output", output,
+        ]
+        logger.info("Calibrating with %s slave(s) ...", count)
+        subprocess.check_call(command, stdout=subprocess.DEVNULL)
+
+        with open(output) as f:
+            results = json.load(f)["results"]
+
+        logger.info("%s slave(s): %.0f requests/sec", count, results["requests_per_second"])
+        if best is None or results["requests_per_second"] > best["requests_per_second"]:
+            # Little's law: users per slave = requests/sec * seconds per task
+            wait_time = (args.wait_time_min + args.wait_time_max) / 2
+            seconds_per_task = wait_time + results["average_response_time"] / 1000
+            best = {
+                "slaves": count,
+                "requests_per_second": results["requests_per_second"],
+                "users_per_slave": int(results["requests_per_second_per_slave"] * seconds_per_task),
+            }
+
+    return best
+
+
+class Supervisor(object):
+    """ Start pinned slave processes, and restart them when they exit """
+
+    def __init__(self, plan, command, master_host_file, restart_delay=1, aggregator_command=None, aggregator_port=None,
+                 metrics_port=None, max_restart_delay=60, stable_time=30):
+        self.plan = plan
+        self.command = command
+        self.master_host_file = master_host_file
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+        # Slaves which ran for this many seconds exited on their own, not in a crash loop
+        self.stable_time = stable_time
+        self.aggregator_command = aggregator_command
+        self.aggregator_port = aggregator_port
+        self.metrics_port = metrics_port
+        self.processes = [None] * len(plan)
+        # Per slave: start time, exits soon after the start in a row, and the
+        # time of its pending restart
+        self.started = [None] * len(plan)
+        self.failures = [0] * len(plan)
+        self.restart_at = [None] * len(plan)
+        self.aggregator = None
+        self.master_host = None
+        self.stopping = False
+
+    def start(self, index):
+        cpus = self.plan[index]
+        env = dict(os.environ)
+        if self.aggregator_command is None:
+            command = self.command + ["--master-host={}".format(self.master_host)]
+        else:
+            # Through the local aggregator, which relays to the master
+            command = self.command + ["--master-host=127.0.0.1", "--master-port={}".format(self.aggregator_port)]
+            env["LOCUST_MASTER_WEB_HOST"] = self.master_host
+        if self.metrics_port:
+            env["LOCUST_SLAVE_METRICS_PORT"] = str(self.metrics_port + index)
+
+        def pin():
+            os.sched_setaffinity(0, cpus)
+
+        logger.info("Starting slave %s on CPU(s) %s", index, ",".join(str(cpu) for cpu in cpus))
+        self.processes[index] = subprocess.Popen(command, preexec_fn=pin, env=env)
+        self.started[index] = time.time()
+        self.restart_at[index] = None
+
+    def start_aggregator(self):
+        command = self.aggregator_command + [
+            "--master-host={}".format(self.master_host),
+            "--port={}".format(self.aggregator_port),
+        ]
+
+        logger.info("Starting aggregator on port %s", self.aggregator_port)
+        self.aggregator = subprocess.Popen(command)
+
+    def stop(self, signum=None, frame=None):
+        """ Stop all slaves, used as signal handler """
+
+        self.stopping = True
+        self.terminate()
+
+    def terminate(self):
+        for process in self.processes:
+            if process is not None and process.poll() is None:
+                process.terminate()
+
+    def stop_aggregator(self):
+        """ Stop the aggregator, after the slaves (so their "quit" reaches the master) """
+
+        if self.aggregator is not None:
+            if self.aggregator.poll() is None:
+                self.aggregator.terminate()
+            self.aggregator.wait()
+
+    def read_master_host(self):
+        """ The master's IP, or None when build.rb didn't write it (yet) """
+
+        try:
+            return read_master_host(self.master_host_file) or None
+        except FileNotFoundError:
+            return None
+
+    def reconnect(self):
+        """ Restart all slaves when the master's IP changed, returns True if it did """
+
+        master_host = self.read_master_host()
+        if master_host is None or master_host == self.master_host:
+            return False
+
+        logger.info("Master changed from %s to %s, restarting slaves", self.master_host, master_host)
+        self.master_host = master_host
+        self.terminate()
+        for process in self.processes:
+            process.wait()
+
+        if self.aggregator is not None:
+            self.stop_aggregator()
+            self.start_aggregator()
+        for index in range(len(self.processes)):
+            self.failures[index] = 0
+            self.start(index)
+
+        return True
+
+    def restart_exited(self, now):
+        """ Restart the slaves which exited, backing off those which keep exiting """
+
+        for index, process in enumerate(self.processes):
+            if self.stopping:
+                return
+
+            if self.restart_at[index] is not None:
+                if now >= self.restart_at[index]:
+                    self.start(index)
+                continue
+
+            if process.poll() is None:
+                continue
+
+            if now - self.started[index] < self.stable_time:
+                self.failures[index] += 1
+            else:
+                self.failures[index] = 1
+            delay = restart_backoff(self.failures[index], self.restart_delay, self.max_restart_delay)
+            logger.warning("Slave %s exited with %s, restarting in %.0f s", index, process.returncode, delay)
+            self.restart_at[index] = now + delay
+
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.master_host = self.read_master_host()
+        if self.master_host is None:
+            logger.info("Waiting for the master's IP in %s ...", self.master_host_file)
+        while self.master_host is None and not self.stopping:
+            time.sleep(0.1)
+            self.master_host = self.read_master_host()
+
+        if not self.stopping:
+            if self.aggregator_command is not None:
+                self.start_aggregator()
+            for index in range(len(self.plan)):
+                self.start(index)
+
+        while not self.stopping:
+            time.sleep(self.restart_delay)
+            if not self.stopping and self.reconnect():
+                continue
+            if not self.stopping and self.aggregator is not None and self.aggregator.poll() is not None:
+                logger.warning("Aggregator exited with %s, restarting", self.aggregator.returncode)
+                self.start_aggregator()
+            self.restart_exited(time.time())
+
+        for process in self.processes:
+            if process is not None:
+                process.wait()
+        self.stop_aggregator()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Start pinned Locust slave processes")
+    parser.add_argument("--cpuinfo", default="/proc/cpuinfo")
+    parser.add_argument("--master-host-file", default=os.path.join(BASE_DIR, ".masterIP"))
+    parser.add_argument("--locust", default="/usr/local/bin/locust")
+    parser.add_argument("--slaves", type=int, default=None, help="number of slaves (default: one per physical core)")
+    parser.add_argument("--reserve", type=int, default=None, help="cores kept free (default: 1 when the master runs locally)")
+    parser.add_argument(
+        "--calibrate",
+        action="store_true",
+        default=os.environ.get("LOCUST_CALIBRATE", "0") == "1",
+        help="pick the number of slaves with a short benchmark"
+    )
+    parser.add_argument("--calibration-file", default=os.path.join(BASE_DIR, ".calibration.json"))
+    parser.add_argument("--calibration-time", type=int, default=10)
+    parser.add_argument("--calibration-users", type=int, default=100, help="users per slave during calibration")
+    parser.add_argument("--wait-time-min", type=float, default=float(os.environ.get("LOCUST_WAIT_TIME_MIN", "0.5")))
+    parser.add_argument("--wait-time-max", type=float, default=float(os.environ.get("LOCUST_WAIT_TIME_MAX", "1.5")))
+    parser.add_argument(
+        "--aggregator",
+        action="store_true",
+        default=os.environ.get("LOCUST_AGGREGATOR", "0") == "1",
+        help="merge the slaves' reports in a local aggregator"
+    )
+    parser.add_argument("--aggregator-port", type=int, default=int(os.environ.get("LOCUST_AGGREGATOR_PORT", "5567")))
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.environ.get("LOCUST_SLAVE_METRICS_PORT", "0")),
+        help="port of the first slave's /metrics endpoint (0: disabled)"
+    )
+    parser.add_argument("--dry-run", action="store_true", help="print the plan, don't start slaves")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="[%(asctime)s] %(name)s/%(levelname)s: %(message)s")
+
+    allowed = os.sched_getaffinity(0) if args.cpuinfo == "/proc/cpuinfo" else None
+    cores = read_cores(args.cpuinfo, allowed)
+
+    reserve = args.reserve
+    if reserve is None:
+        local_master = os.path.exists(args.master_host_file) and \
+            read_master_host(args.master_host_file) in LOCAL_MASTER_HOSTS
+        reserve = 1 if local_master else 0
+
+    count = args.slaves
+    if count is None and args.calibrate:
+        calibration = calibrate(cores, reserve, args)
+        with open(args.calibration_file, "w") as f:
+            json.dump(calibration, f, indent=2)
+        logger.info(
+            "Calibrated: %s slave(s), about %s users per slave",
+            calibration["slaves"],
+            calibration["users_per_slave"]
+        )
+        count = calibration["slaves"]
+    elif count is None and os.path.exists(args.calibration_file):
+        with open(args.calibration_file) as f:
+            count = json.load(f)["slaves"]
+
+    plan = plan_slaves(cores, reserve, count)
+
+    logger.info(
+        "%s physical core(s), %s reserved, %s slave(s): %s",
+        len(cores),
+        reserve,
+        len(plan),
+        " ".join(",".join(str(cpu) for cpu in cpus) for cpus in plan)
+    )
+
+    if args.dry_run:
+        return
+
+    feeder_file = os.environ.get("LOCUST_FEEDER_FILE", "")
+    if feeder_file:
+        # In a separate process: the feeder imports Locust, which monkey-patches with gevent
+        subprocess.call([sys.executable, "-m", "loadtest.feeder", "index", feeder_file], cwd=BASE_DIR)
+
+    command = [args.locust, "--locustfile", "locustfile.py", "--port=9876", "--slave"]
+    aggregator_command = [sys.executable, "-m", "loadtest.aggregator"] if args.aggregator else None
+    Supervisor(
+        plan,
+        command,
+        args.master_host_file,
+        aggregator_command=aggregator_command,
+        aggregator_port=args.aggregator_port,
+        metrics_port=args.metrics_port
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# coding=utf-8
+
+# Streaming time-series export of the load test's statistics
+#
+# The master (or a local, non-distributed Locust) writes a row per request
+# name, and an "Aggregated" row, every LOCUST_EXPORT_INTERVAL seconds to CSV
+# files in LOCUST_EXPORT_DIR:
+#
+#   timestamp, name, user_count, requests, failures, requests_per_second,
+#   mean, p50, p90, p99, p99.9, max (response times in milliseconds),
+#   dns, connect, tls, ttfb, download (mean of each phase in milliseconds,
+#   with LOCUST_PHASE_TIMING=1, see `loadtest/phases.py`)
+#
+# * Memory is bounded by the number of request names, not by the run length:
+#   only the current interval is kept (counts, and a response time Histogram
+#   per name, see `loadtest/histogram.py`), rows are handed to the writer
+# * A single background OS thread writes the rows, so the master's report
+#   handling never blocks on disk. When the writer falls behind by more than
+#   `max_pending` intervals, rows are dropped (and counted) instead of queued
+# * Files rotate after `max_bytes`; all files are kept, so a multi-hour soak
+#   test's whole timeline is on disk
+
+from gevent.threadpool import ThreadPool
+from locust import events, runners
+from loadtest.histogram import Histogram
+from loadtest.phases import PHASES
+import csv
+import gevent
+import os
+import time
+
+COLUMNS = (
+    "timestamp",
+    "name",
+    "user_count",
+    "requests",
+    "failures",
+    "requests_per_second",
+    "mean",
+    "p50",
+    "p90",
+    "p99",
+    "p99.9",
+    "max",
+) + PHASES
+
+
+class Interval(object):
+    """ Statistics of a single request name, during the current interval """
+
+    __slots__ = ("requests", "failures", "histogram")
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.histogram = Histogram()
+
+    def row(self, timestamp, name, user_count, seconds):
+        histogram = self.histogram
+
+        return (
+            timestamp,
+            name,
+            user_count,
+            self.requests,
+            self.failures,
+            round(self.requests / seconds, 2),
+            round(histogram.mean() / 1000, 3),
+            histogram.percentile(0.5) / 1000,
+            histogram.percentile(0.9) / 1000,
+            histogram.percentile(0.99) / 1000,
+            histogram.percentile(0.999) / 1000,
+            histogram.max / 1000,
+        )
+
+
+class TimeSeriesExport(object):
+    """ Write per-interval statistics to rotating CSV files, from a background thread """
+
+    def __init__(self, logger, directory, interval=10, max_bytes=50 * 1024 * 1024, max_pending=100, phases=None):
+        self.logger = logger
+        # PhaseHistograms of the master (or local Locust), and their totals at the previous flush
+        self.phases = phases
+        self.phase_totals = {}
+        self.directory = directory
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.max_pending = max_pending
+        self.intervals = {}
+        self.started = None
+        self.interval_start = None
+        self.greenlet = None
+        self.pool = None
+        self.pending = []
+        self.dropped = 0
+        # Used by the writer thread only
+        self.file = None
+        self.writer = None
+        self.file_index = 0
+
+    def get(self, name):
+        interval = self.intervals.get(name)
+        if interval is None:
+            interval = self.intervals[name] = Interval()
+
+        return interval
+
+    def on_request_success(self, request_type, name, response_time, response_length, **kwargs):
+        if self.greenlet is not None:
+            interval = self.get(name)
+            interval.requests += 1
+            if response_time is not None:
+                interval.histogram.record(response_time * 1000)
+
+    def on_request_failure(self, request_type, name, response_time, response_length, exception, **kwargs):
+        if self.greenlet is not None:
+            interval = self.get(name)
+            interval.requests += 1
+            interval.failures += 1
+            if response_time is not None:
+                interval.histogram.record(response_time * 1000)
+
+    def on_slave_report(self, client_id, data):
+        if self.greenlet is None:
+            return
+
+        # Locust's stats in a report only cover the slave's last report interval
+        for entry in data["stats"]:
+            interval = self.get(entry["name"])
+            interval.requests += entry["num_requests"]
+            interval.failures += entry["num_failures"]
+
+        for name, encoded in data.get("histograms", {}).items():
+            self.get(name).histogram.merge_encoded(encoded)
+
+    def start(self, **kwargs):
+        """ Start exporting, on the master or a local Locust (once) """
+
+        if self.greenlet is not None or isinstance(runners.locust_runner, runners.SlaveLocustRunner):
+            return
+
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.started = time.strftime("%Y%m%d-%H%M%S")
+        self.interval_start = time.time()
+        self.pool = ThreadPool(1)
+        self.greenlet = gevent.spawn(self.run)
+        self.logger.info("Exporting statistics every %s s to %s", self.interval, self.directory)
+
+    def run(self):
+        while True:
+            gevent.sleep(self.interval)
+            self.flush()
+
+    def flush(self):
+        """ Hand the current interval's rows to the writer thread, and start a new interval """
+
+        now = time.time()
+        seconds = max(now - self.interval_start, 0.001)
+        timestamp = time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(now))
+        user_count = runners.locust_runner.user_count if runners.locust_runner else 0
+
+        intervals, self.intervals = self.intervals, {}
+        self.interval_start = now
+
+        total = Interval()
+        for interval in intervals.values():
+            total.requests += interval.requests
+            total.failures += interval.failures
+            total.histogram.merge(interval.histogram)
+
+        phase_means = self.phase_means()
+        rows = [
+            interval.row(timestamp, name, user_count, seconds) + phase_means.get(name, ("",) * len(PHASES))
+            for name, interval in sorted(intervals.items())
+            if interval.requests
+        ]
+        rows.append(
+            total.row(timestamp, "Aggregated", user_count, seconds) + phase_means.get(None, ("",) * len(PHASES))
+        )
+
+        self.pending = [result for result in self.pending if not result.ready()]
+        if len(self.pending) >= self.max_pending:
+            self.dropped += len(rows)
+            self.logger.warning("Statistics writer is behind, dropped %s row(s) so far", self.dropped)
+            return
+
+        self.pending.append(self.pool.spawn(self.write, rows))
+
+    def phase_means(self):
+        """ {name (None: all names): mean of each phase in milliseconds} since the previous flush """
+
+        if self.phases is None:
+            return {}
+
+        totals, previous_totals = self.phases.totals(), self.phase_totals
+        self.phase_totals = totals
+
+        means = {}
+        aggregated = {}
+        for name, phases in totals.items():
+            previous = previous_totals.get(name, {})
+            counts = {}
+            for phase, (count, total) in phases.items():
+                previous_count, previous_total = previous.get(phase, (0, 0))
+                count, total = count - previous_count, total - previous_total
+                if count > 0:
+                    counts[phase] = (count, total)
+                    aggregated_count, aggregated_total = aggregated.get(phase, (0, 0))
+                    aggregated[phase] = (aggregated_count + count, aggregated_total + total)
+            means[name] = counts
+
+        means[None] = aggregated
+
+        return {
+            name: tuple(
+                round(counts[phase][1] / counts[phase][0] / 1000, 3) if phase in counts else ""
+                for phase in PHASES
+            )
+            for name, counts in means.items()
+        }
+
+    def write(self, rows):
+        """ Write rows, rotating files after `max_bytes` (runs in the writer thread) """
+
+        if self.file is None:
+            self.file_index += 1
+            path = os.path.join(
+                self.directory,
+                "stats-{}-{:04d}.csv".format(self.started, self.file_index)
+            )
+            self.file = open(path, "w", newline="")
+            self.writer = csv.writer(self.file)
+            self.writer.writerow(COLUMNS)
+
+        self.writer.writerows(rows)
+        self.file.flush()
+
+        if self.file.tell() >= self.max_bytes:
+            self.close()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+            self.writer = None
+
+    def stop(self):
+        """ Write the last (partial) interval and wait for the writer """
+
+        if self.greenlet is None:
+            return
+
+        self.greenlet.kill()
+        self.greenlet = None
+        self.flush()
+        for result in self.pending:
+            result.get()
+        self.pool.spawn(self.close).get()
+        self.pool.kill()
+
+    def install(self):
+        """ Hook into Locust's events """
+
+        events.request_success += self.on_request_success
+        events.request_failure += self.on_request_failure
+        events.slave_report += self.on_slave_report
+        events.master_start_hatching += self.start
+        events.locust_start_hatching += self.start
+        events.quitting += self.stop
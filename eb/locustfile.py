@@ -2,19 +2,153 @@
 
 # Locustfile for http://blazedemo.com/
 
-from locust import HttpLocust, TaskSet, TaskSequence, seq_task, task, between
-# from bs4 import BeautifulSoup  # With CSRF
+from locust import Locust, TaskSet, TaskSequence, between
+from loadtest import aggregator, arrival, client, settings
+from loadtest.budget import BudgetController, BudgetFollower
+from loadtest.compact import ReportDecoder, ReportEncoder
+from loadtest.connections import ConnectionPolicy, ConnectionStats, DnsCache
+from loadtest.csrf import CsrfCache
+from loadtest.feeder import DataFeeder, Dataset
+from loadtest.histogram import HistogramSet
+from loadtest.loop import LoopLag
+from loadtest.metrics import MasterMetrics, SlaveMetrics
+from loadtest.payload import UserData
+from loadtest.phases import PhaseHistograms, PhaseTimer
+from loadtest.profiler import Profiler
+from loadtest.requestlog import RequestLog
+from loadtest.responses import ResponseMode
+from loadtest.saturation import SaturationBoard, SaturationMonitor
+from loadtest.scenario import build_task_sequences
+from loadtest.shape import ShapeController, load_shape_file
+from loadtest.snapshot import StatsSnapshot
+from loadtest.timeseries import TimeSeriesExport
+import gevent
 import logging
-import sys
+import time
 
 # Log to stdout during Locust run
 logger = logging.getLogger("locust")
-logger.setLevel(logging.INFO)
+logger.setLevel(settings.LOG_LEVEL)
+
+# Sampled request logging, `kill -USR1 <pid>` dumps the most recent requests
+request_log = RequestLog(
+    logger,
+    sample_rate=settings.REQUEST_LOG_SAMPLE_RATE,
+    buffer_size=settings.REQUEST_LOG_BUFFER_SIZE
+)
+request_log.install_dump_signal()
+
+# Event loop lag and CPU usage of the load generators, which warn when they're
+# saturated (see `loadtest/saturation.py`). Installed ahead of the compact
+# reports, which leave no requests in Locust's total
+loop_lag = LoopLag()
+saturation = SaturationBoard(logger)
+SaturationMonitor(
+    logger,
+    loop_lag,
+    max_lag=settings.SATURATION_MAX_LAG,
+    max_cpu=settings.SATURATION_MAX_CPU,
+    board=saturation
+).install()
+
+# On-demand profiles of the slaves, from /profile of the master (see
+# `loadtest/profiler.py`); its hooks into Locust's sockets see every message
+if settings.PROFILER:
+    Profiler(logger).install()
+
+# Compact slave reports (see `loadtest/compact.py`); the master reads both
+# formats. Installed ahead of the other listeners of slave reports, so they get
+# Locust's format
+ReportDecoder(logger).install()
+if settings.COMPACT_REPORTS:
+    ReportEncoder().install()
+
+# High-resolution response time percentiles, merged on the master (see
+# `loadtest/histogram.py`), served at /stats/percentiles
+histograms = HistogramSet(logger)
+histograms.install()
+
+# The web UI's statistics, built once per interval and served with ETags, also
+# incrementally at /stats/snapshot?since=<version> (see `loadtest/snapshot.py`)
+snapshot = StatsSnapshot(interval=settings.STATS_SNAPSHOT_INTERVAL)
+snapshot.install()
+saturation.install(snapshot)
+
+# Connection policy and pool size of the simulated users, DNS cache, and the
+# connections opened and reused per request name, merged on the master, served
+# at /stats/connections (see `loadtest/connections.py`); the master merges the
+# slaves' counts regardless. Installed ahead of the phase timer, which times
+# the cached lookups
+connection_policy = ConnectionPolicy(
+    settings.CONNECTION_POLICY,
+    settings.POOL_SIZE,
+    idle_release=settings.IDLE_RELEASE
+)
+dns_cache = None
+if settings.DNS_CACHE_TTL:
+    dns_cache = DnsCache(settings.DNS_CACHE_TTL)
+    dns_cache.install()
+connection_stats = ConnectionStats(dns_cache)
+connection_stats.install(snapshot)
+if settings.CONNECTION_STATS:
+    connection_stats.hook()
+
+# Per-phase timing of the requests (DNS, connect, TLS, TTFB, download), merged
+# on the master like the percentiles, served at /stats/phases (see
+# `loadtest/phases.py`); the master merges the slaves' phases regardless
+phases = PhaseHistograms()
+phases.install(snapshot)
+if settings.PHASE_TIMING:
+    PhaseTimer(phases).install()
+
+# OpenMetrics at /metrics of the master's web UI, and optionally of every
+# slave, on its own port (see `loadtest/metrics.py`)
+MasterMetrics().install()
+slave_metrics = None
+if settings.SLAVE_METRICS_PORT:
+    slave_metrics = SlaveMetrics(settings.SLAVE_METRICS_PORT, loop_lag)
+    slave_metrics.install()
+
+# Per-instance aggregators merge their slaves' reports, and carry each slave's
+# user count (see `loadtest/aggregator.py`)
+aggregator.install()
+
+# Per-interval statistics of the whole run, streamed to rotating CSV files by
+# the master (see `loadtest/timeseries.py`)
+if settings.EXPORT_DIR:
+    TimeSeriesExport(
+        logger,
+        settings.EXPORT_DIR,
+        interval=settings.EXPORT_INTERVAL,
+        max_bytes=settings.EXPORT_MAX_BYTES,
+        phases=phases
+    ).install()
+
+# Response handling of the steps without their own (see `loadtest/responses.py`)
+default_response = ResponseMode(settings.RESPONSE_MODE)
+
+# Rows of a dataset for the payload templates, in blocks which the master
+# leases to the slaves, at /feeder (see `loadtest/feeder.py`)
+feeder = None
+if settings.FEEDER_FILE:
+    feeder = DataFeeder(
+        logger,
+        Dataset(settings.FEEDER_FILE),
+        policy=settings.FEEDER_POLICY,
+        scope=settings.FEEDER_SCOPE,
+        block_size=settings.FEEDER_BLOCK_SIZE,
+        master_web_port=settings.MASTER_WEB_PORT,
+        master_web_host=settings.MASTER_WEB_HOST or None
+    )
+    feeder.install()
 
 
 class CustomTaskSequence(TaskSequence):
     """ TaskSequence with customized request handling (eg. login, CSRF, ...)
 
+    The tasks themselves are Steps, loaded from the scenario file (see
+    `loadtest/scenario.py`), which all run through `run_step()`.
+
     For example:
     * Automated user login before running tasks
     * CSRF handling
@@ -22,774 +156,227 @@ class CustomTaskSequence(TaskSequence):
 
     """
 
+    # ArrivalSchedule of the sequence, None for the closed model (wait_time)
+    schedule = None
+
     def on_start(self):
         """ Called by every Locust slave before tasks are scheduled """
 
+        # Intended start of the current iteration, in arrival-rate mode
+        self.intended_start = None
+
+        # Values for the payload templates, unique per simulated user
+        self.user_data = UserData(feeder=feeder)
+
+        # CSRF token of the simulated user's session
+        self.csrf = CsrfCache(settings.CSRF_TTL) if settings.CSRF else None
+
         # For Example:
         # Each simulated user should log in before running tasks
         # UserLogin.login()
         # self.login()
 
-    # def get_csrf(self, url):
-    #     """ Retrieve a CSRF token for use with POST requests """
-
-    #     # Get page HTML
-    #     response = self.client.get(
-    #         name="(Locust) Get CSRF token",
-    #         url=url
-    #     )
-
-    #     soup = BeautifulSoup(response.content, 'html.parser')
-
-    #     # Parse CSRF token from page HTML
-    #     csrf_param = soup.find(
-    #         'meta',
-    #         attrs={'name': 'csrf-param'}
-    #     ).get("content")
-    #     csrf_token = soup.find(
-    #         'meta',
-    #         attrs={'name': 'csrf-token'}
-    #     ).get("content")
-
-    #     return {
-    #         "param": csrf_param,
-    #         "token": csrf_token
-    #     }
-
-    def get(self, task_url, task_id, task_description):
-        """ Send a GET request to the web application """
-
-        response = self.client.get(
-            name="#{}: {}".format(task_id, task_description),
-            url="{}".format(task_url),
-        )
-
-        return response
-
-    def post(self, task_url, task_id, task_description, task_data_params):
-        """ Send a POST request to the web application """
-
-        # With CSRF:
-        # csrf_data = self.get_csrf(task_url)
-        # logger.debug(
-        #     "Running '{}': ".format(sys._getframe().f_code.co_name) +
-        #     "CSRF: {}".format(csrf_data)
-        # )
-
-        response = self.client.post(
-            name="#{}: {}".format(task_id, task_description),
-            url=task_url,
-            # Without CSRF:
-            data=task_data_params,
-            # With CSRF:
-            # headers={
-            #    csrf_data['param']: csrf_data['token']
-            # },
-            # data={
-            #    csrf_data['param']: csrf_data['token'],
-            #    task_data_params
-            # },
-        )
-
-        return response
-
-
-class UserRegistration(CustomTaskSequence):
-
-    @seq_task(1000)
-    @task(1)
-    def task_1000(self):
-        task_url = "/"  # NOQA
-        task_id = "1000"  # NOQA
-        task_description = "(UserRegistration) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1001)
-    @task(1)
-    def task_1001(self):
-        task_url = "/home"  # NOQA
-        task_id = "1001"  # NOQA
-        task_description = "(UserRegistration) Click 'home'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1002)
-    @task(1)
-    def task_1002(self):
-        task_url = "/register"  # NOQA
-        task_id = "1002"  # NOQA
-        task_description = "(UserRegistration) Click 'Register'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1003)
-    @task(1)
-    def task_1003(self):
-        task_url = "/register"  # NOQA
-        task_id = "1003"  # NOQA
-        task_description = "(UserRegistration) Register as user test@example.org"  # NOQA
-        task_data_params = "name=Test&company=Test&email=test%40example.org&password=test&password_confirmation=test"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-
-class UserLogin(CustomTaskSequence):
-
-    @seq_task(1100)
-    @task(1)
-    def task_1100(self):
-        task_url = "/"  # NOQA
-        task_id = "1100"  # NOQA
-        task_description = "(UserLogin) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1101)
-    @task(1)
-    def task_1101(self):
-        task_url = "/"  # NOQA
-        task_id = "1101"  # NOQA
-        task_description = "(UserLogin) Click 'home'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1102)
-    @task(1)
-    def task_1102(self):
-        task_url = "/"  # NOQA
-        task_id = "1102"  # NOQA
-        task_description = "(UserLogin) Click 'Login'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-    @seq_task(1103)
-    @task(1)
-    def task_1103(self):
-        task_url = "/login"  # NOQA
-        task_id = "1103"  # NOQA
-        task_description = "(UserLogin) Log in as user test@example.org"  # NOQA
-        task_data_params = "email=test%40example.org&password=test"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
-
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
-
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
-
-
-class UserPasswordReset(CustomTaskSequence):
+        # Wait for the slot of the first iteration
+        if self.schedule is not None:
+            self.wait()
 
-    @seq_task(1200)
-    @task(1)
-    def task_1200(self):
-        task_url = "/"  # NOQA
-        task_id = "1200"  # NOQA
-        task_description = "(UserPasswordReset) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
+    def get_csrf(self, url):
+        """ Retrieve a CSRF token for use with POST requests, unless one is cached """
 
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
+        if self.csrf.get() is None:
+            response = client.request(
+                self.client,
+                "GET",
+                url,
+                name="(Locust) Get CSRF token"
             )
-        )
+            self.csrf.update(response)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        return self.csrf
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+    def get_next_task(self):
+        """ Pick the next Step, starting a new iteration of the sequence at its first Step """
 
-    @seq_task(1201)
-    @task(1)
-    def task_1201(self):
-        task_url = "/home"  # NOQA
-        task_id = "1201"  # NOQA
-        task_description = "(UserPasswordReset) Click 'home'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        if self._index == 0:
+            self.user_data.next_iteration()
+            connection_policy.next_iteration(self.client)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        return super(CustomTaskSequence, self).get_next_task()
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+    def _sleep(self, seconds):
+        """ Wait before the next Step, releasing the user's idle connections during long waits """
 
-    @seq_task(1202)
-    @task(1)
-    def task_1202(self):
-        task_url = "/password/reset"  # NOQA
-        task_id = "1202"  # NOQA
-        task_description = "(UserPasswordReset) Click 'Forgot Your Password?'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        self.locust.release_idle(seconds)
+        super(CustomTaskSequence, self)._sleep(seconds)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+    def wait_time(self):
+        """ Seconds to wait before the next Step
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+        In arrival-rate mode, the wait before a sequence's first Step lasts
+        until this user claims a start slot (see `loadtest/arrival.py`).
 
-    @seq_task(1203)
-    @task(1)
-    def task_1203(self):
-        task_url = "/password/reset"  # NOQA
-        task_id = "1203"  # NOQA
-        task_description = "(UserPasswordReset) Request new password"  # NOQA
-        task_data_params = "email=test%40example.org"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        """
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        if self.schedule is None or self._index != 0:
+            return super(CustomTaskSequence, self).wait_time()
 
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+        now = time.time()
+        if self.intended_start is not None:
+            self.schedule.record(self.intended_start, now)
 
+        self.intended_start = self.schedule.take(now)
+        while self.intended_start is None:
+            gevent.sleep(self.schedule.delay(now))
+            now = time.time()
+            self.intended_start = self.schedule.take(now)
 
-class TravelTheWorld(CustomTaskSequence):
+        return 0
 
-    @seq_task(1300)
-    @task(1)
-    def task_1300(self):
-        task_url = "/"  # NOQA
-        task_id = "1300"  # NOQA
-        task_description = "(TravelTheWorld) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
+    def run_step(self, step):
+        """ Run a single Step from the scenario file """
 
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        start_time = time.time()
+        url = step.render_url(self.user_data)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        if step.method == "POST":
+            response = self.post(step, url)
+        else:
+            response = self.get(step, url)
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+        request_log.log(self, step, response, start_time)
 
-    @seq_task(1301)
-    @task(1)
-    def task_1301(self):
-        task_url = "/index.php"  # NOQA
-        task_id = "1301"  # NOQA
-        task_description = "(TravelTheWorld) Click 'Travel The World'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        return response
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+    def get(self, step, url):
+        """ Send a GET request to the web application """
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
+        response = client.request(
+            self.client,
+            "GET",
+            url,
+            name=step.name,
+            mode=step.response or default_response,
         )
 
+        if settings.CSRF and settings.CSRF_HARVEST:
+            self.csrf.update(response)
 
-class DestinationOfTheWeek(CustomTaskSequence):
-
-    @seq_task(1400)
-    @task(1)
-    def task_1400(self):
-        task_url = "/"  # NOQA
-        task_id = "1400"  # NOQA
-        task_description = "(DestinationOfTheWeek) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
+        return response
 
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+    def post(self, step, url):
+        """ Send a POST request to the web application """
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        data = step.body.render(self.user_data) if step.body is not None else b""
+        headers = client.FORM_HEADERS
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+        if settings.CSRF:
+            csrf = self.get_csrf(url)
+            if csrf.field is not None:
+                data = data + b"&" + csrf.field if data else csrf.field
+                headers = csrf.headers
 
-    @seq_task(1401)
-    @task(1)
-    def task_1401(self):
-        task_url = "/vacation.html"  # NOQA
-        task_id = "1401"  # NOQA
-        task_description = "(DestinationOfTheWeek) Click 'destination of the week!'"  # NOQA
-        task_data_params = "None"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
+        response = client.request(
+            self.client,
+            "POST",
+            url,
+            name=step.name,
+            data=data,
+            headers=headers,
+            mode=step.response or default_response,
         )
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+        if settings.CSRF:
+            self.csrf.check(response)
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+        return response
 
 
-class BookFlight(CustomTaskSequence):
+# UserRegistration, UserLogin, BookFlight, ... (see scenarios.json)
+task_sequences = build_task_sequences(
+    settings.SCENARIO_FILE,
+    CustomTaskSequence,
+    arrival_rate=settings.ARRIVAL_RATE,
+    max_lag=settings.ARRIVAL_MAX_LAG,
+    paced=bool(settings.TARGET_RPS),
+    data_columns=feeder.dataset.columns if feeder is not None else None
+)
+
+# Arrival slots the sequences' schedules skipped, merged on the master, served
+# at /stats/missed_slots (see `loadtest/arrival.py`)
+arrival.missed_slots.install()
+
+# Cluster-wide requests/sec budget: the master splits it over the slaves,
+# which pace their sequences accordingly (see `loadtest/budget.py`)
+if settings.TARGET_RPS:
+    BudgetController(logger, settings.TARGET_RPS, interval=settings.BUDGET_INTERVAL).install()
+    BudgetFollower(
+        logger,
+        task_sequences,
+        settings.MASTER_WEB_PORT,
+        interval=settings.BUDGET_INTERVAL,
+        local_rps=settings.TARGET_RPS,
+        master_web_host=settings.MASTER_WEB_HOST or None
+    ).install()
+
+# Users and hatch rate over time, set by the master from the start of the test
+# (see `loadtest/shape.py`); shapes can be defined here as well, eg.
+# `shape = step(10, 10, 5, 60, 10)` (from loadtest.shape), or any LoadShape
+shape = load_shape_file(settings.SHAPE_FILE) if settings.SHAPE_FILE else None
+if shape is not None:
+    ShapeController(logger, shape).install()
 
-    @seq_task(1500)
-    @task(1)
-    def task_1500(self):
-        task_url = "/"  # NOQA
-        task_id = "1500"  # NOQA
-        task_description = "(BookFlight) Visit /"  # NOQA
-        task_data_params = "None"  # NOQA
 
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+class UserBehavior(TaskSet):
+    """ Define the TaskSequences to run, and their weight """
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+    tasks = task_sequences
 
-        response = self.get(task_url, task_id, task_description)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
 
-    @seq_task(1501)
-    @task(1)
-    def task_1501(self):
-        task_url = "/reserve.php"  # NOQA
-        task_id = "1501"  # NOQA
-        task_description = "(BookFlight) Click 'Find Flights' for BOS to DUB"  # NOQA
-        task_data_params = "fromPort=Boston&toPort=Dublin"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+class LoadTest(client.locust_class(settings.CLIENT_BACKEND)):
+    """ Create a Locust slave based on the UserBehavior task set
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+    The HTTP client backend (HttpLocust or FastHttpLocust) is selected with
+    LOCUST_CLIENT_BACKEND, see `loadtest/client.py`.
 
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+    """
 
-    @seq_task(1502)
-    @task(1)
-    def task_1502(self):
-        task_url = "/purchase.php"  # NOQA
-        task_id = "1502"  # NOQA
-        task_description = "(BookFlight) Click 'Choose This Flight' for flight nr. 9696"  # NOQA
-        task_data_params = "flight=9696&price=200.98&airline=Aer+Lingus&fromPort=Boston&toPort=Dublin"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+    host = "http://blazedemo.com"
+    task_set = UserBehavior
+    # Speed up things during development: 0.5 to 1.5 seconds (default)
+    # More realistic values for load testing: eg. 5 to 15 seconds
+    # Override with LOCUST_WAIT_TIME_MIN and LOCUST_WAIT_TIME_MAX
+    wait_time = between(settings.WAIT_TIME_MIN, settings.WAIT_TIME_MAX)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+    def __init__(self, *args, **kwargs):
+        # Locust's own, without the backend's: the HTTP session (and its cookie
+        # jar) is only created on first use, see `client`
+        Locust.__init__(self, *args, **kwargs)
+        self.session = None
 
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+    @property
+    def client(self):
+        """ The simulated user's HTTP session, created on first use """
 
-    @seq_task(1503)
-    @task(1)
-    def task_1503(self):
-        task_url = "/purchase.php"  # NOQA
-        task_id = "1503"  # NOQA
-        task_description = "(BookFlight) Click 'Purchase Flight'"  # NOQA
-        task_data_params = "inputName=John+Smith&address=123+Main+St.&city=Anytown&state=State&zipCode=12345&cardType=visa&creditCardNumber=0000000000000000&creditCardMonth=11&creditCardYear=2017&nameOnCard=John+Smith"  # NOQA
-
-        logger.info(
-            "Run {} '{}' ...".format(
-                sys._getframe().f_code.co_name,
-                task_description
-            )
-        )
+        if self.session is None:
+            self.session = client.new_session(self)
 
-        logger.debug(
-            "locust.client: {}".format(self.locust.client.__dict__)
-        )
+            # Connection pool of the simulated user, see LOCUST_CONNECTION_POLICY
+            connection_policy.configure(self.session)
 
-        response = self.post(task_url, task_id, task_description, task_data_params)
-
-        logger.debug(
-            "Response for {} '{}' -- HTTP {} ({} {}) -- Headers: {} -- Cookies: {}".format(
-                sys._getframe().f_code.co_name,
-                task_description,
-                response.status_code,
-                response.request,
-                response.url,
-                response.headers,
-                response.cookies
-            )
-        )
+            # Connection pool usage of the slave's /metrics
+            if slave_metrics is not None:
+                slave_metrics.track(self.session)
 
+        return self.session
 
-class UserBehavior(TaskSet):
-    """ Define the TaskSequences to run, and their weight """
+    def release_idle(self, seconds):
+        """ Before a wait of `seconds`, close the user's connections when it's long (LOCUST_IDLE_RELEASE)
 
-    tasks = {
-        UserRegistration: 100,
-        UserLogin: 100,
-        UserPasswordReset: 100,
-        TravelTheWorld: 100,
-        DestinationOfTheWeek: 100,
-        BookFlight: 100,
-    }
+        A session without cookies is dropped as well, and created again for
+        the next request.
 
+        """
 
-class LoadTest(HttpLocust):
-    """ Create a Locust slave based on the UserBehavior task set """
-    host = "http://blazedemo.com"
-    task_set = UserBehavior
-    # Speed up things during development
-    wait_time = between(0.500, 1.500)
-    # More realistic values for load testing
-    # wait_time = between(5000, 15000)
+        if self.session is not None and connection_policy.release_idle(self.session, seconds):
+            if not client.cookies(self.session):
+                self.session = None
@@ -0,0 +1,5 @@
+# coding=utf-8
+
+# Unit tests of the Locustfile's modules (see `loadtest/`), run from eb/ with:
+#
+#   python -m unittest discover -s tests -t .
@@ -0,0 +1,170 @@
+# coding=utf-8
+
+# Tests of the aggregator's report merging (see loadtest/aggregator.py)
+
+from locust.stats import RequestStats, StatsEntry
+from loadtest.aggregator import ReportMerger
+from loadtest.arrival import REQUEST_TYPE as ITERATION, MissedSlots, target_requests
+from loadtest.connections import ConnectionStats
+from loadtest.histogram import HistogramSet
+from loadtest.phases import PHASES, PhaseHistograms
+import copy
+import logging
+import random
+import unittest
+
+logger = logging.getLogger("test.aggregator")
+logger.addHandler(logging.NullHandler())
+
+NAMES = ("/", "/search", "/cart")
+
+
+def slave_report(seed, cpu, user_count):
+    """ A slave's report, built by the slave side of each of the merged statistics """
+
+    rng = random.Random(seed)
+    stats = RequestStats()
+    histograms = HistogramSet(logger)
+    phases = PhaseHistograms()
+    connections = ConnectionStats()
+    missed_slots = MissedSlots()
+
+    for _ in range(200):
+        name = rng.choice(NAMES)
+        response_time = int(rng.lognormvariate(4, 1))
+        stats.log_request("GET", name, response_time, rng.randint(100, 5000))
+        histograms.record(name, response_time)
+        for phase in PHASES:
+            phases.phases(name)[phase].record(rng.randint(1, 50000))
+        connections.requests.setdefault(name, [0, 0])[rng.randint(0, 1)] += 1
+        if rng.random() < 0.1:
+            stats.log_error("GET", name, "HTTP 500")
+    stats.log_request(ITERATION, "checkout", 900, 0)
+    connections.dns = [rng.randint(0, 10), rng.randint(0, 10)]
+    missed_slots.add("checkout", rng.randint(1, 5))
+
+    data = {
+        "stats": stats.serialize_stats(),
+        "stats_total": stats.total.get_stripped_report(),
+        "errors": stats.serialize_errors(),
+        "user_count": user_count,
+        "cpu": cpu,
+    }
+    histograms.on_report_to_master("slave", data)
+    phases.on_report_to_master("slave", data)
+    connections.on_report_to_master("slave", data)
+    missed_slots.on_report_to_master("slave", data)
+
+    return data
+
+
+def master_totals(reports):
+    """ What the master makes of `reports`, as with Locust's and our slave_report listeners """
+
+    stats = RequestStats()
+    errors = {}
+    histograms = HistogramSet(logger)
+    phases = PhaseHistograms()
+    connections = ConnectionStats()
+    missed_slots = MissedSlots()
+
+    for data in reports:
+        for serialized in data["stats"]:
+            entry = StatsEntry.unserialize(serialized)
+            stats.get(entry.name, entry.method).extend(entry)
+        stats.total.extend(StatsEntry.unserialize(data["stats_total"]))
+        for key, error in data["errors"].items():
+            errors[key] = errors.get(key, 0) + error["occurrences"]
+        histograms.on_slave_report(None, data)
+        phases.on_slave_report(None, data)
+        connections.on_slave_report(None, data)
+        missed_slots.on_slave_report(None, data)
+
+    entries = list(stats.entries.values()) + [stats.total]
+
+    return {
+        "stats": {
+            (entry.method, entry.name): (
+                entry.num_requests,
+                entry.num_failures,
+                entry.total_response_time,
+                entry.min_response_time,
+                entry.max_response_time,
+                entry.total_content_length,
+                entry.response_times,
+            )
+            for entry in entries
+        },
+        "errors": errors,
+        "histograms": histograms.percentiles(),
+        "phases": phases.percentiles(),
+        "connections": connections.totals(),
+        "missed_slots": missed_slots.counts,
+    }
+
+
+class ReportMergerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.reports = {
+            "slave-1": slave_report(1, cpu=0.5, user_count=10),
+            "slave-2": slave_report(2, cpu=0.25, user_count=20),
+            "slave-3": slave_report(3, cpu=0.75, user_count=30),
+        }
+
+    def merge(self, leader="slave-1"):
+        merger = ReportMerger()
+        for client_id, data in self.reports.items():
+            merger.add(client_id, data)
+
+        return merger.pop(leader)
+
+    def test_merged_report_is_the_sum_of_its_inputs(self):
+        merged = self.merge()
+
+        self.assertEqual(master_totals([merged]), master_totals(self.reports.values()))
+
+    def test_reports_are_left_as_they_are(self):
+        expected = copy.deepcopy(self.reports)
+        self.merge()
+
+        self.assertEqual(self.reports, expected)
+
+    def test_merged_report_is_not_empty(self):
+        totals = master_totals([self.merge()])
+
+        self.assertEqual(totals["stats"][(None, "Aggregated")][0], 603)
+        self.assertEqual(set(totals["histograms"]), set(NAMES) | {"Aggregated"})
+        self.assertEqual(set(totals["phases"]), set(NAMES))
+        self.assertEqual(set(totals["connections"]["requests"]), set(NAMES))
+        self.assertTrue(totals["errors"])
+        self.assertEqual(list(totals["missed_slots"]), ["checkout"])
+
+    def test_slaves(self):
+        merged = self.merge(leader="slave-2")
+
+        self.assertEqual(merged["user_count"], 20)
+        self.assertEqual(
+            merged["slaves"],
+            {
+                client_id: {
+                    "num_requests": target_requests(data["stats"]),
+                    "cpu": data["cpu"],
+                    "user_count": data["user_count"],
+                }
+                for client_id, data in self.reports.items()
+            }
+        )
+        self.assertEqual(merged["slaves"]["slave-1"]["num_requests"], 200)
+
+    def test_starts_over(self):
+        merger = ReportMerger()
+        merger.add("slave-1", self.reports["slave-1"])
+        merger.pop("slave-1")
+        merger.add("slave-2", self.reports["slave-2"])
+
+        self.assertEqual(master_totals([merger.pop("slave-2")]), master_totals([self.reports["slave-2"]]))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+# Tests of the arrival-rate schedules' missed slots (see loadtest/arrival.py)
+
+from locust import events
+from loadtest import arrival
+from loadtest.arrival import ArrivalSchedule, MissedSlots
+import unittest
+
+
+class MissedSlotsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.failures = []
+        events.request_failure += self.on_request_failure
+        arrival.missed_slots.reset()
+
+    def tearDown(self):
+        events.request_failure -= self.on_request_failure
+        arrival.missed_slots.reset()
+
+    def on_request_failure(self, name, exception, **kwargs):
+        self.failures.append((name, exception))
+
+    def test_on_time(self):
+        schedule = ArrivalSchedule("Browse", 10, max_lag=1.0)
+        self.assertEqual(schedule.take(100.0), 100.0)
+        self.assertIsNone(schedule.take(100.05))
+        self.assertEqual(schedule.take(100.1), 100.1)
+        self.assertEqual(self.failures, [])
+
+    def test_catch_up_is_one_failure(self):
+        schedule = ArrivalSchedule("Browse", 4, max_lag=1.0)
+        schedule.take(100.0)
+
+        # 10 s behind: the slots from 100.25 to 109.0 are skipped at once
+        self.assertEqual(schedule.take(110.0), 109.25)
+        self.assertEqual(len(self.failures), 1)
+        self.assertEqual(self.failures[0][0], "(Missed slot) Browse")
+        self.assertEqual(schedule.missed, 36)
+        self.assertEqual(arrival.missed_slots.counts, {"Browse": 36})
+
+    def test_merged_on_master(self):
+        slave = MissedSlots()
+        slave.add("Browse", 3)
+        slave.add("Browse", 2)
+        slave.add("Checkout", 1)
+        data = {}
+        slave.on_report_to_master("slave-1", data)
+        self.assertEqual(slave.counts, {})
+
+        master = MissedSlots()
+        master.on_slave_report("slave-1", data)
+        master.on_slave_report("slave-2", {"missed_slots": {"Browse": 1}})
+        master.on_slave_report("slave-3", {})
+        self.assertEqual(master.counts, {"Browse": 6, "Checkout": 1})
+
+        # Nothing to send
+        data = {}
+        slave.on_report_to_master("slave-1", data)
+        self.assertNotIn("missed_slots", data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,110 @@
+# coding=utf-8
+
+# Tests of the requests/sec budget (see loadtest/budget.py)
+
+from locust.stats import RequestStats
+from loadtest import budget
+from loadtest.aggregator import ReportMerger
+from loadtest.budget import BudgetController, SlaveLoad, parse_target, split_budget
+import logging
+import unittest
+
+
+def report(requests, iterations, cpu=0.5):
+    """ A slave report of `requests` requests to the target, and `iterations` arrival-rate iterations """
+
+    stats = RequestStats()
+    for _ in range(requests):
+        stats.log_request("GET", "/", 100, 0)
+    for _ in range(iterations):
+        stats.log_request("ITERATION", "(Iteration) Browse", 300, 0)
+    stats.log_request("ITERATION", "(Missed slot) Browse", 0, 0)
+
+    return {
+        "stats": stats.serialize_stats(),
+        "stats_total": stats.total.get_stripped_report(),
+        "errors": {},
+        "cpu": cpu,
+        "user_count": 10,
+    }
+
+
+class SplitBudgetTest(unittest.TestCase):
+
+    def test_equal_shares(self):
+        self.assertEqual(split_budget(300, {"a": None, "b": 500, "c": 200}), {"a": 100, "b": 100, "c": 100})
+
+    def test_water_filling(self):
+        self.assertEqual(split_budget(300, {"a": 50, "b": None, "c": 500}), {"a": 50, "b": 125, "c": 125})
+
+    def test_short_of_capacity(self):
+        self.assertEqual(split_budget(300, {"a": 50, "b": 100}), {"a": 50, "b": 100})
+
+
+class SlaveLoadTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time = budget.time.time
+        budget.time.time = lambda: self.now
+
+    def tearDown(self):
+        budget.time.time = self.time
+
+    def test_first_report_has_no_rate(self):
+        load = SlaveLoad()
+        load.update(300, 0.5)
+        self.assertEqual(load.rps, 0)
+        self.assertIsNone(load.capacity)
+
+        self.now += 3
+        load.update(300, 0.5)
+        self.assertEqual(load.rps, 100)
+        self.assertAlmostEqual(load.capacity, 160)
+
+
+class ReportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time = budget.time.time
+        budget.time.time = lambda: self.now
+        self.controller = BudgetController(logging.getLogger("test"), 1000)
+
+    def tearDown(self):
+        budget.time.time = self.time
+
+    def test_iterations_are_not_requests(self):
+        # 3 requests per iteration
+        self.controller.on_slave_report("slave-1", report(300, 100))
+        self.now += 3
+        self.controller.on_slave_report("slave-1", report(300, 100))
+
+        self.assertEqual(self.controller.slaves["slave-1"].rps, 100)
+        self.assertAlmostEqual(self.controller.slaves["slave-1"].capacity, 160)
+
+    def test_aggregated_reports(self):
+        for _ in range(2):
+            merger = ReportMerger()
+            merger.add("slave-1", report(300, 100))
+            merger.add("slave-2", report(150, 50, cpu=0.25))
+            self.controller.on_slave_report("slave-1", merger.pop("slave-1"))
+            self.now += 3
+
+        self.assertEqual(self.controller.slaves["slave-1"].rps, 100)
+        self.assertEqual(self.controller.slaves["slave-2"].rps, 50)
+
+
+class ParseTargetTest(unittest.TestCase):
+
+    def test_valid(self):
+        self.assertEqual(parse_target("0"), 0)
+        self.assertEqual(parse_target("250.5"), 250.5)
+
+    def test_invalid(self):
+        for value in (None, "", "fast", "-1", "nan", "inf"):
+            self.assertIsNone(parse_target(value), value)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+# coding=utf-8
+
+# Tests of the request hooks of the HTTP client backends (see loadtest/client.py)
+
+from loadtest import client
+from loadtest.connections import ConnectionStats
+import unittest
+
+
+class Hook(object):
+    def __init__(self):
+        self.calls = []
+
+    def begin(self):
+        self.calls.append("begin")
+
+    def end(self, name):
+        self.calls.append(("end", name))
+
+
+class FailingClient(object):
+    """ A session whose requests raise, eg. on an unexpected error of the backend """
+
+    def request(self, method, url, **kwargs):
+        raise RuntimeError("backend error")
+
+
+class RequestHooksTest(unittest.TestCase):
+    def setUp(self):
+        self.hooks = list(client.request_hooks)
+
+    def tearDown(self):
+        client.request_hooks[:] = self.hooks
+
+    def test_hooks_end_when_the_client_raises(self):
+        hook = Hook()
+        stats = ConnectionStats()
+        client.request_hooks[:] = [hook, stats]
+
+        with self.assertRaises(RuntimeError):
+            client.request(FailingClient(), "GET", "/", "home")
+
+        self.assertEqual(hook.calls, ["begin", ("end", "home")])
+        # The greenlet's request isn't left in progress
+        self.assertEqual(stats.active, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+# coding=utf-8
+
+# Tests of the compact slave reports (see loadtest/compact.py)
+
+from locust.stats import RequestStats
+from loadtest.compact import VERSION, ReportDecoder, ReportEncoder
+import logging
+import unittest
+
+
+def report(requests):
+    """ A slave's report of {(method, name): requests}, in Locust's format, with an error per name """
+
+    stats = RequestStats()
+    for (method, name), count in requests.items():
+        for _ in range(count):
+            stats.log_request(method, name, 100, 1000)
+        stats.log_error(method, name, "HTTPError('500')")
+
+    return {
+        "stats": stats.serialize_stats(),
+        "stats_total": stats.total.get_stripped_report(),
+        "errors": stats.serialize_errors(),
+    }
+
+
+def counts(data):
+    """ {name: requests} and {error name: occurrences} of a report in Locust's format """
+
+    return (
+        {entry["name"]: entry["num_requests"] for entry in data["stats"]},
+        {error["name"]: error["occurrences"] for error in data["errors"].values()},
+    )
+
+
+class Master(object):
+    """ A master's decoder, which delivers its acknowledgements to the slave's encoder """
+
+    def __init__(self, encoder):
+        self.acks = []
+        self.decoder = ReportDecoder(logging.getLogger("test"), send=lambda client_id, ack: self.ack(encoder, ack))
+
+    def ack(self, encoder, ack):
+        self.acks.append(ack)
+        encoder.on_ack(ack)
+
+    def receive(self, data):
+        self.decoder.decode("slave", data)
+        return counts(data)
+
+    def connect(self, encoder):
+        """ The slave's first report, which offers compact reports """
+
+        data = report({})
+        encoder.encode(data)
+        self.receive(data)
+
+
+class CompactReportsTest(unittest.TestCase):
+
+    def test_locust_format_until_accepted(self):
+        encoder = ReportEncoder()
+        data = report({("GET", "/"): 3})
+        encoder.encode(data)
+        self.assertNotIn("compact", data)
+        self.assertEqual(data["compact_offer"], VERSION)
+
+        # A master without the decoder reads it as is
+        self.assertEqual(counts(data), ({"/": 3}, {"/": 1}))
+
+        master = Master(encoder)
+        self.assertEqual(master.receive(data), ({"/": 3}, {"/": 1}))
+        self.assertEqual(master.acks, [{"version": VERSION, "names": 0, "errors": 0}])
+        self.assertTrue(encoder.accepted)
+
+    def test_definitions_sent_until_acknowledged(self):
+        encoder = ReportEncoder()
+        encoder.on_ack({"version": VERSION, "names": 0, "errors": 0})
+
+        data = report({("GET", "/"): 1})
+        encoder.encode(data)
+        self.assertEqual(len(data["compact"][2]), 1)
+
+        # Not acknowledged (lost, or not yet): defined again
+        data = report({("GET", "/"): 1, ("POST", "/login"): 1})
+        encoder.encode(data)
+        self.assertEqual([definition[1] for definition in data["compact"][2]], ["/", "/login"])
+
+        encoder.on_ack({"version": VERSION, "names": 2, "errors": 2})
+        data = report({("GET", "/"): 1, ("POST", "/login"): 1})
+        encoder.encode(data)
+        self.assertEqual(data["compact"][2], [])
+        self.assertEqual(data["compact"][3], [])
+
+    def test_round_trip(self):
+        encoder = ReportEncoder()
+        master = Master(encoder)
+        master.connect(encoder)
+
+        requests = {("GET", "/"): 5, ("POST", "/login"): 2}
+        for _ in range(3):
+            data = report(requests)
+            encoder.encode(data)
+            self.assertIn("compact", data)
+            self.assertEqual(master.receive(data), ({"/": 5, "/login": 2}, {"/": 1, "/login": 1}))
+            self.assertEqual(data["stats_total"]["num_requests"], 7)
+
+    def test_restarted_master_holds_unknown_names(self):
+        encoder = ReportEncoder()
+        master = Master(encoder)
+        master.connect(encoder)
+        data = report({("GET", "/"): 5})
+        encoder.encode(data)
+        master.receive(data)
+
+        # The new master doesn't know the names: it holds the counts back, and asks for them
+        restarted = Master(encoder)
+        data = report({("GET", "/"): 4})
+        encoder.encode(data)
+        self.assertEqual(restarted.receive(data), ({}, {}))
+        self.assertEqual(restarted.acks[-1]["names"], 0)
+
+        data = report({("GET", "/"): 3})
+        encoder.encode(data)
+        self.assertEqual(restarted.receive(data), ({"/": 7}, {"/": 2}))
+        self.assertEqual(data["stats_total"]["num_requests"], 7)
+        self.assertEqual(restarted.decoder.pending, {})
+
+    def test_forget(self):
+        decoder = ReportDecoder(logging.getLogger("test"), send=lambda client_id, ack: None)
+        decoder.decode("slave", {"compact_offer": VERSION})
+        decoder.forget("slave")
+        self.assertEqual(decoder.tables, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
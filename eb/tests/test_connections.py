@@ -0,0 +1,130 @@
+# coding=utf-8
+
+# Tests of the DNS cache (see loadtest/connections.py)
+
+from gevent.event import Event
+from loadtest import connections
+from loadtest.connections import DnsCache
+import gevent
+import socket
+import unittest
+
+ADDRESSES = [(socket.AF_INET, socket.SOCK_STREAM, 6, "", ("10.0.0.1", 80))]
+
+
+class Resolver(object):
+    """ Stand-in for getaddrinfo, counting lookups; fails while `error` is set, waits for `ready` """
+
+    def __init__(self):
+        self.lookups = []
+        self.error = None
+        self.ready = None
+
+    def __call__(self, host, port, *args, **kwargs):
+        self.lookups.append(host)
+        if self.ready is not None:
+            self.ready.wait()
+        if self.error is not None:
+            raise self.error
+
+        return ADDRESSES
+
+
+class DnsCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.monotonic = connections.time.monotonic
+        self.resolver = Resolver()
+        self.cache = DnsCache(ttl=30)
+        self.getaddrinfo = self.cache.cached(self.resolver)
+
+    def tearDown(self):
+        connections.time.monotonic = self.monotonic
+
+    def freeze(self):
+        connections.time.monotonic = lambda: self.now
+
+    def test_ttl_expiry(self):
+        self.freeze()
+        self.assertEqual(self.getaddrinfo("example.com", 80), ADDRESSES)
+        self.now += 29
+        self.assertEqual(self.getaddrinfo("example.com", 80), ADDRESSES)
+        self.assertEqual(self.resolver.lookups, ["example.com"])
+
+        self.now += 1
+        self.assertEqual(self.getaddrinfo("example.com", 80), ADDRESSES)
+        self.assertEqual(self.resolver.lookups, ["example.com"] * 2)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 2))
+
+    def test_arguments_are_cached_apart(self):
+        self.getaddrinfo("example.com", 80)
+        self.getaddrinfo("example.com", 443)
+        self.getaddrinfo("example.com", 80, type=socket.SOCK_STREAM)
+        self.getaddrinfo("example.org", 80)
+        self.getaddrinfo("example.com", 80)
+
+        self.assertEqual(len(self.resolver.lookups), 4)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 4))
+
+    def test_concurrent_lookups_wait_for_the_first(self):
+        self.resolver.ready = Event()
+        greenlets = [gevent.spawn(self.getaddrinfo, "example.com", 80) for _ in range(5)]
+        gevent.sleep(0)
+        self.assertEqual(len(self.cache.pending), 1)
+
+        self.resolver.ready.set()
+        gevent.joinall(greenlets, timeout=5, raise_error=True)
+
+        self.assertEqual([greenlet.value for greenlet in greenlets], [ADDRESSES] * 5)
+        self.assertEqual(self.resolver.lookups, ["example.com"])
+        self.assertEqual((self.cache.hits, self.cache.misses), (4, 1))
+        self.assertEqual(self.cache.pending, {})
+
+    def test_failed_lookups_are_not_cached(self):
+        self.resolver.error = socket.gaierror(socket.EAI_NONAME, "Name or service not known")
+        with self.assertRaises(socket.gaierror):
+            self.getaddrinfo("example.com", 80)
+
+        self.resolver.error = None
+        self.assertEqual(self.getaddrinfo("example.com", 80), ADDRESSES)
+        self.assertEqual(self.resolver.lookups, ["example.com"] * 2)
+        self.assertEqual(self.cache.pending, {})
+
+    def test_concurrent_lookups_share_a_failure(self):
+        self.resolver.ready = Event()
+        self.resolver.error = socket.gaierror(socket.EAI_AGAIN, "Temporary failure in name resolution")
+
+        def lookup():
+            try:
+                return self.getaddrinfo("example.com", 80)
+            except socket.gaierror as e:
+                return e
+
+        greenlets = [gevent.spawn(lookup) for _ in range(3)]
+        gevent.sleep(0)
+
+        self.resolver.ready.set()
+        gevent.joinall(greenlets, timeout=5, raise_error=True)
+
+        for greenlet in greenlets:
+            self.assertIsInstance(greenlet.value, socket.gaierror)
+        self.assertEqual(self.resolver.lookups, ["example.com"])
+
+        # The next lookup resolves again
+        self.resolver.error = None
+        self.assertEqual(self.getaddrinfo("example.com", 80), ADDRESSES)
+        self.assertEqual(len(self.resolver.lookups), 2)
+
+    def test_max_entries(self):
+        self.cache.max_entries = 2
+        for host in ("a.example", "b.example", "c.example"):
+            self.getaddrinfo(host, 80)
+
+        self.assertEqual(len(self.cache.entries), 1)
+        self.getaddrinfo("c.example", 80)
+        self.assertEqual(len(self.resolver.lookups), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+# coding=utf-8
+
+# Tests of the CSRF token handling (see loadtest/csrf.py)
+
+from loadtest import csrf
+from loadtest.csrf import HEADER, CsrfCache, extract_token
+import unittest
+
+PAGE = b"""<!DOCTYPE html>
+<html>
+<head>
+  <title>BlazeDemo</title>
+  %s
+</head>
+<body>
+  %s
+</body>
+</html>
+"""
+
+RAILS = b"""<meta name="csrf-param" content="authenticity_token" />
+  <meta name="csrf-token" content="abc+/123==" />"""
+
+
+class Response(object):
+
+    def __init__(self, content=b"", status_code=200):
+        self.content = content
+        self.status_code = status_code
+
+
+class ExtractTokenTest(unittest.TestCase):
+
+    def test_double_quotes(self):
+        self.assertEqual(extract_token(PAGE % (RAILS, b"")), ("authenticity_token", "abc+/123=="))
+
+    def test_single_quotes_and_attribute_order(self):
+        head = b"""<META content='abc+/123==' NAME='csrf-token'>
+  <meta content="_token" name="csrf-param">"""
+        self.assertEqual(extract_token(PAGE % (head, b"")), ("_token", "abc+/123=="))
+
+    def test_unquoted(self):
+        head = b"<meta name=csrf-param content=_csrf><meta name=csrf-token content=t0ken>"
+        self.assertEqual(extract_token(PAGE % (head, b"")), ("_csrf", "t0ken"))
+
+    def test_missing(self):
+        self.assertIsNone(extract_token(b""))
+        self.assertIsNone(extract_token(None))
+        self.assertIsNone(extract_token(PAGE % (b'<meta name="description" content="x">', b"")))
+
+        # A param without a token
+        self.assertIsNone(extract_token(PAGE % (b'<meta name="csrf-param" content="authenticity_token">', b"")))
+
+    def test_after_head(self):
+        self.assertIsNone(extract_token(PAGE % (b"", RAILS)))
+
+        # Without </head>, the <body> ends the head
+        self.assertIsNone(extract_token(b"<html><head><title>x</title><body>" + RAILS))
+
+
+class CsrfCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time = csrf.time.time
+        csrf.time.time = lambda: self.now
+
+    def tearDown(self):
+        csrf.time.time = self.time
+
+    def test_update(self):
+        cache = CsrfCache(60)
+        self.assertIsNone(cache.get())
+        self.assertEqual(cache.update(Response(PAGE % (RAILS, b""))), ("authenticity_token", "abc+/123=="))
+        self.assertEqual(cache.get(), ("authenticity_token", "abc+/123=="))
+        self.assertEqual(cache.field, b"authenticity_token=abc%2B%2F123%3D%3D")
+        self.assertEqual(cache.headers[HEADER], "abc+/123==")
+
+        # Pages without a token keep the cached one
+        self.assertIsNone(cache.update(Response(PAGE % (b"", b""))))
+        self.assertEqual(cache.get(), ("authenticity_token", "abc+/123=="))
+
+    def test_ttl(self):
+        cache = CsrfCache(60)
+        cache.update(Response(PAGE % (RAILS, b"")))
+        self.now += 59.9
+        self.assertIsNotNone(cache.get())
+        self.now += 0.1
+        self.assertIsNone(cache.get())
+
+    def test_invalidated_when_rejected(self):
+        for status_code in (403, 419):
+            cache = CsrfCache(60)
+            cache.update(Response(PAGE % (RAILS, b"")))
+            cache.check(Response(status_code=200))
+            cache.check(Response(status_code=500))
+            self.assertIsNotNone(cache.get())
+
+            cache.check(Response(status_code=status_code))
+            self.assertIsNone(cache.get())
+            self.assertIsNone(cache.field)
+            self.assertNotIn(HEADER, cache.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+# coding=utf-8
+
+# Tests of the test data feeder (see loadtest/feeder.py)
+
+from locust.exception import StopLocust
+from loadtest.feeder import DataFeeder, Dataset, RowLeases
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+
+class FeederTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def dataset(self, name, lines):
+        path = os.path.join(self.directory, name)
+        with open(path, "w") as f:
+            f.write("".join(line + "\n" for line in lines))
+
+        return Dataset(path)
+
+    def accounts(self, rows):
+        return self.dataset("accounts.csv", ["id,email"] + ["{0},user{0}@example.org".format(row) for row in range(rows)])
+
+    def take(self, feeder, count):
+        return [int(feeder.take()["data.id"]) for _ in range(count)]
+
+    def test_csv(self):
+        dataset = self.dataset("accounts.csv", ["email,name", "", "jane@example.org,Jane Doe", "john@example.org"])
+        self.assertEqual(dataset.rows, 2)
+        self.assertEqual(dataset.columns, ["email", "name"])
+        self.assertEqual(dataset.row(0), {"email": "jane@example.org", "name": "Jane Doe"})
+
+        # Missing values are empty, and columns named after a per-user value replace it
+        values = DataFeeder(logging.getLogger("test"), dataset).values(dataset.row(1))
+        self.assertEqual(values, {"data.email": b"john%40example.org", "data.name": b"", "email": b"john%40example.org"})
+
+    def test_jsonl(self):
+        dataset = self.dataset("accounts.jsonl", ['{"email": "jane@example.org", "age": 30}', '{"email": null}'])
+        self.assertEqual(dataset.columns, ["email", "age"])
+        self.assertEqual(dataset.row(0), {"email": "jane@example.org", "age": "30"})
+        self.assertEqual(dataset.row(1), {"email": ""})
+
+    def test_sequential_starts_over(self):
+        feeder = DataFeeder(logging.getLogger("test"), self.accounts(25), block_size=10)
+        self.assertEqual(self.take(feeder, 30), list(range(25)) + list(range(5)))
+
+    def test_unique_stops(self):
+        feeder = DataFeeder(logging.getLogger("test"), self.accounts(25), policy="unique", block_size=10)
+        self.assertEqual(self.take(feeder, 25), list(range(25)))
+        with self.assertRaises(StopLocust):
+            feeder.take()
+
+    def test_random_shuffles_every_pass(self):
+        feeder = DataFeeder(logging.getLogger("test"), self.accounts(1000), policy="random", block_size=100)
+        first = self.take(feeder, 1000)
+        second = self.take(feeder, 1000)
+        self.assertEqual(sorted(first), list(range(1000)))
+        self.assertEqual(sorted(second), list(range(1000)))
+        self.assertNotEqual(first, list(range(1000)))
+        self.assertNotEqual(first, second)
+
+        # Not a fixed stride: the steps between consecutive rows of a block vary
+        steps = set((b - a) % 100 for a, b in zip(first[:99], first[1:100]))
+        self.assertGreater(len(steps), 10)
+
+    def test_leases_are_disjoint(self):
+        leases = RowLeases(1050, policy="random", block_size=100, seed=1)
+        blocks = [leases.lease("slave-{}".format(index % 3)) for index in range(11)]
+        self.assertEqual(sorted(start for start, _ in blocks), list(range(0, 1100, 100)))
+        self.assertEqual(dict(blocks)[1000], 50)
+        self.assertEqual(leases.status()["slaves"], {"slave-0": 4, "slave-1": 4, "slave-2": 3})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+# coding=utf-8
+
+# Tests of the response time histograms (see loadtest/histogram.py)
+
+from locust.stats import RequestStats
+from loadtest import resets
+from loadtest.histogram import BUCKETS, MAX_VALUE, Histogram, HistogramSet, bucket_index, bucket_range
+import logging
+import random
+import unittest
+
+
+def histogram(values):
+    result = Histogram()
+    for value in values:
+        result.record(value)
+
+    return result
+
+
+def exact_percentile(values, fraction):
+    ordered = sorted(values)
+
+    return ordered[max(1, int(round(fraction * len(ordered)))) - 1]
+
+
+def samples(seed, count):
+    """ Response times in microseconds: log-normal, around 100 ms """
+
+    rng = random.Random(seed)
+
+    return [int(rng.lognormvariate(11.5, 0.8)) for _ in range(count)]
+
+
+class BucketTest(unittest.TestCase):
+
+    def test_buckets_cover_every_value(self):
+        for value in list(range(1000)) + [1 << shift for shift in range(10, 32)] + [MAX_VALUE]:
+            lowest, highest = bucket_range(bucket_index(value))
+            self.assertTrue(lowest <= value <= highest, value)
+        self.assertEqual(bucket_index(MAX_VALUE + 1000), bucket_index(MAX_VALUE))
+        self.assertLess(bucket_index(MAX_VALUE), BUCKETS)
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        original = histogram(samples(1, 10000))
+        decoded = Histogram.decode(original.encode())
+        self.assertEqual(decoded.counts, original.counts)
+        self.assertEqual(
+            (decoded.count, decoded.min, decoded.max, decoded.total),
+            (original.count, original.min, original.max, original.total)
+        )
+        self.assertEqual(Histogram.decode(Histogram().encode()).count, 0)
+        self.assertIsNone(Histogram.decode(Histogram().encode()).min)
+
+    def test_merge_equals_recording_both(self):
+        first, second = samples(1, 5000), samples(2, 7000)
+        both = histogram(first + second)
+
+        merged = histogram(first)
+        merged.merge(histogram(second))
+        merged_encoded = histogram(first)
+        merged_encoded.merge_encoded(histogram(second).encode())
+
+        for result in (merged, merged_encoded):
+            self.assertEqual(result.counts, both.counts)
+            self.assertEqual((result.count, result.min, result.max, result.total), (both.count, both.min, both.max, both.total))
+
+    def test_percentile_error(self):
+        values = samples(3, 100000)
+        result = histogram(values)
+        for fraction in (0.5, 0.9, 0.99, 0.999, 0.9999):
+            exact = exact_percentile(values, fraction)
+            self.assertLessEqual(abs(result.percentile(fraction) - exact), exact * 0.01, fraction)
+
+        self.assertEqual(result.percentile(1), max(values))
+        self.assertEqual(result.percentile(0), min(values))
+        self.assertEqual(Histogram().percentile(0.5), 0)
+
+    def test_small_values_are_exact(self):
+        values = list(range(1, 101))
+        self.assertEqual(histogram(values).percentile(0.9), 90)
+
+
+class HistogramSetTest(unittest.TestCase):
+
+    def test_cleared_with_locust_statistics(self):
+        histograms = HistogramSet(logging.getLogger("test"))
+        resets.install()
+        resets.reset_stats += histograms.reset
+        try:
+            histograms.on_slave_report("slave", {"histograms": {"/": histogram([1000, 2000]).encode()}})
+            self.assertEqual(histograms.percentiles()["/"]["count"], 2)
+
+            RequestStats().reset_all()
+            self.assertEqual(histograms.percentiles(), {})
+        finally:
+            resets.reset_stats -= histograms.reset
+
+    def test_requests_without_response_time(self):
+        histograms = HistogramSet(logging.getLogger("test"))
+        histograms.on_request("GET", "/", 12, 0)
+        histograms.on_request("GET", "/", None, 0)
+        histograms.on_request("GET", "/login", None, 0, exception=Exception("timeout"))
+
+        self.assertEqual(histograms.percentiles()["/"]["count"], 1)
+        self.assertNotIn("/login", histograms.percentiles())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,215 @@
+# coding=utf-8
+
+# Tests of the scenario importer (see loadtest/importer.py)
+
+from loadtest import importer
+from loadtest.importer import Import, Summary, parameterize_url, parse_nginx, sessionize
+import argparse
+import collections
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+LINE = '{} - - [10/Oct/2020:13:55:{:02d} +0000] "{} {} HTTP/1.1" {} 512 "-" "{}" "{}"\n'
+
+
+def line(second, request, status=200, address="10.0.0.1", user_agent="Mozilla/5.0", forwarded_for="-"):
+    method, url = request.split(" ", 1)
+
+    return LINE.format(address, second, method, url, status, user_agent, forwarded_for).encode()
+
+
+class ParseTest(unittest.TestCase):
+
+    def test_parse_nginx(self):
+        counter = [0]
+        requests = list(parse_nginx([
+            line(36, "GET /flights/42?from=BOS"),
+            b"not an access log line\n",
+            line(37, "POST /login", status=302, forwarded_for="203.0.113.7, 10.0.0.2"),
+        ], counter))
+
+        self.assertEqual(counter, [3])
+        self.assertEqual(requests, [
+            (b"10.0.0.1 Mozilla/5.0", 1602338136, "GET", "/flights/42?from=BOS", 200, None),
+            (b"203.0.113.7 Mozilla/5.0", 1602338137, "POST", "/login", 302, None),
+        ])
+
+    def test_time_zone(self):
+        counter = [0]
+        utc = next(parse_nginx([line(0, "GET /")], counter))[1]
+        offset = next(parse_nginx([line(0, "GET /").replace(b"+0000", b"-0700")], counter))[1]
+        self.assertEqual(offset - utc, 7 * 3600)
+
+
+class SessionTest(unittest.TestCase):
+
+    def test_sessions_per_client(self):
+        requests = [
+            ("a", 0, "GET", "/", 200, None),
+            ("b", 1, "GET", "/", 200, None),
+            ("a", 2, "GET", "/login", 200, None),
+            # More than 10 s after a's last request: a new session
+            ("a", 20, "GET", "/", 200, None),
+        ]
+        sessions = list(sessionize(requests, timeout=10, max_steps=30))
+
+        # Least recently active first
+        self.assertEqual(sessions, [
+            [("GET", "/", None)],
+            [("GET", "/", None), ("GET", "/login", None)],
+            [("GET", "/", None)],
+        ])
+
+    def test_max_steps(self):
+        requests = [("a", second, "GET", "/{}".format(second), 200, None) for second in range(5)]
+        self.assertEqual(list(sessionize(requests, timeout=10, max_steps=2)), [[("GET", "/0", None), ("GET", "/1", None)]])
+
+
+class SummaryTest(unittest.TestCase):
+
+    def stream(self):
+        rng = random.Random(0)
+        items = ["common"] * 3000 + ["frequent"] * 1500 + ["item-{}".format(rng.randrange(2000)) for _ in range(5500)]
+        rng.shuffle(items)
+
+        return items
+
+    def check_bounds(self, summary, items):
+        """ Misra-Gries: true count - n / (capacity + 1) <= count <= true count """
+
+        exact = collections.Counter(items)
+        error = len(items) / (summary.capacity + 1.0)
+        for item, count in exact.items():
+            estimate = summary.counts.get(item, 0)
+            self.assertLessEqual(estimate, count)
+            self.assertGreaterEqual(estimate, count - error)
+        self.assertLessEqual(len(summary.counts), summary.capacity)
+
+    def test_exact_within_capacity(self):
+        summary = Summary(capacity=10)
+        for item in ["a", "b", "a", "c", "a"]:
+            summary.add(item)
+        self.assertEqual(summary.most_common(), [("a", 3), ("b", 1), ("c", 1)])
+
+    def test_bounds(self):
+        items = self.stream()
+        summary = Summary(capacity=50)
+        for item in items:
+            summary.add(item)
+
+        self.check_bounds(summary, items)
+        self.assertEqual([item for item, _ in summary.most_common(2)], ["common", "frequent"])
+
+    def test_merge(self):
+        items = self.stream()
+        halves = Summary(capacity=50), Summary(capacity=50)
+        for index, item in enumerate(items):
+            halves[index % 2].add(item)
+        halves[0].merge(halves[1])
+
+        self.check_bounds(halves[0], items)
+        self.assertEqual([item for item, _ in halves[0].most_common(2)], ["common", "frequent"])
+
+
+class ParameterizeTest(unittest.TestCase):
+
+    def test_path_ids(self):
+        self.assertEqual(
+            parameterize_url("/flights/42/seats/7"),
+            ("/flights/{data.flights_id}/seats/{data.seats_id}", (("flights_id", "42"), ("seats_id", "7")))
+        )
+        self.assertEqual(
+            parameterize_url("/orders/3f2a9c1e-17b4-4c7a-9d2e-0123456789ab"),
+            ("/orders/{data.orders_id}", (("orders_id", "3f2a9c1e-17b4-4c7a-9d2e-0123456789ab"),))
+        )
+
+    def test_repeated_names(self):
+        self.assertEqual(
+            parameterize_url("/a/1/2"),
+            ("/a/{data.a_id}/{data.a_id_2}", (("a_id", "1"), ("a_id_2", "2")))
+        )
+
+    def test_query(self):
+        self.assertEqual(
+            parameterize_url("/purchase.php?flight=123&from=BOS&email=jane%40example.org&x"),
+            ("/purchase.php?flight={data.flight}&from=BOS&email={email}&x", (("flight", "123"),))
+        )
+
+    def test_constant(self):
+        self.assertEqual(parameterize_url("/reserve.php?fromPort=Paris"), ("/reserve.php?fromPort=Paris", ()))
+        self.assertEqual(parameterize_url("/search?q={x}"), ("/search?q={{x}}", ()))
+
+
+class ImportTest(unittest.TestCase):
+
+    SESSIONS = (
+        ("GET /", "GET /flights/{n}", "POST /purchase.php?flight={n}"),
+        ("GET /", "GET /login", "POST /login"),
+    )
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.args = argparse.Namespace(capacity=100, dataset_rows=1000, session_timeout=60, max_steps=30)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write_log(self, clients=200):
+        """ An access log of interleaved sessions, one per client """
+
+        rng = random.Random(0)
+        path = os.path.join(self.directory, "access.log")
+        with open(path, "wb") as f:
+            for step in range(3):
+                for client in range(clients):
+                    request = self.SESSIONS[client % 2][step].replace("{n}", str(1000 + client))
+                    f.write(line(step, request, address="10.0.{}.{}".format(client >> 8, client & 255)))
+                    if rng.random() < 0.1:
+                        f.write(line(step, "GET /favicon.ico", address="10.0.0.1"))
+
+        return path
+
+    def test_scenario(self):
+        result = importer.import_chunk((self.write_log(), 0, None, self.args))
+        scenario = result.scenario(10)
+
+        self.assertEqual(result.sessions, 200)
+        self.assertEqual([sequence["weight"] for sequence in scenario["sequences"]], [500, 500])
+        urls = sorted(tuple(step["url"] for step in sequence["steps"]) for sequence in scenario["sequences"])
+        self.assertEqual(urls, [
+            ("/", "/flights/{data.flights_id}", "/purchase.php?flight={data.flight}"),
+            ("/", "/login", "/login"),
+        ])
+
+        columns, rows = result.dataset(scenario)
+        self.assertEqual(columns, ["flight", "flights_id"])
+        self.assertEqual(len(rows), 100)
+        self.assertEqual(rows[0], ["1000", "1000"])
+
+    def test_merge_chunks(self):
+        path = self.write_log()
+        whole = importer.import_chunk((path, 0, None, self.args))
+
+        # Chunks split lines and sessions, which are cut in two where they span chunks
+        size = os.path.getsize(path)
+        bounds = list(range(0, size, 4096)) + [size]
+        merged = Import(self.args.capacity)
+        for start, end in zip(bounds, bounds[1:]):
+            merged.merge(importer.import_chunk((path, start, end, self.args)))
+
+        self.assertEqual(merged.lines, whole.lines)
+        self.assertEqual(merged.requests, whole.requests)
+        self.assertEqual(merged.endpoints.most_common(), whole.endpoints.most_common())
+        self.assertEqual(merged.examples, whole.examples)
+        self.assertEqual(
+            {name: sorted(values) for name, values in merged.values.items()},
+            {name: sorted(values) for name, values in whole.values.items()}
+        )
+        self.assertGreaterEqual(merged.sessions, whole.sessions)
+
+
+if __name__ == "__main__":
+    unittest.main()
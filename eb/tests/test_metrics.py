@@ -0,0 +1,60 @@
+# coding=utf-8
+
+# Tests of the master's OpenMetrics endpoint (see loadtest/metrics.py)
+
+from locust.stats import RequestStats
+from loadtest.metrics import MasterMetrics
+import re
+import unittest
+
+
+def histogram(text):
+    """ {le: cumulative count} of the response time buckets, and the histogram's _count """
+
+    buckets = {
+        found.group(1): int(found.group(2))
+        for found in re.finditer(r'locust_response_time_seconds_bucket\{[^}]*le="([^"]+)"\} (\d+)', text)
+    }
+    count = int(re.search(r"locust_response_time_seconds_count\{[^}]*\} (\d+)", text).group(1))
+
+    return buckets, count
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_slave_reports(self):
+        stats = RequestStats()
+        for response_time in (3, 40, 40, 700, 20000):
+            stats.log_request("GET", "/", response_time, 0)
+        # A request without a response time
+        stats.log_request("GET", "/", None, 0)
+        stats.log_error("GET", "/", "timeout")
+
+        metrics = MasterMetrics()
+        metrics.on_slave_report("slave-1", {"stats": stats.serialize_stats()})
+        text = metrics.render()
+
+        buckets, count = histogram(text)
+        self.assertEqual(buckets["0.005"], 1)
+        self.assertEqual(buckets["0.05"], 3)
+        self.assertEqual(buckets["1.0"], 4)
+        self.assertEqual(buckets["+Inf"], 5)
+        self.assertEqual(count, 5)
+        self.assertIn('locust_requests_total{method="GET",name="/"} 6', text)
+        self.assertIn('locust_request_failures_total{method="GET",name="/"} 1', text)
+
+    def test_local_requests(self):
+        metrics = MasterMetrics()
+        metrics.on_request_success("GET", "/", 30, 0)
+        metrics.on_request_success("GET", "/", None, 0)
+        metrics.on_request_failure("GET", "/", 12000, 0, Exception("timeout"))
+
+        buckets, count = histogram(metrics.render())
+        self.assertEqual(buckets["+Inf"], 2)
+        self.assertEqual(count, 2)
+        self.assertEqual(metrics.get("GET", "/").requests, 3)
+        self.assertAlmostEqual(metrics.get("GET", "/").total, 12030)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+# coding=utf-8
+
+# Tests of the transaction-mix solver (see loadtest/mix.py)
+
+from loadtest import mix
+from loadtest.mix import ARRIVAL, CLOSED, Sequence, mean_durations, nnls, predict, solve_weights
+import unittest
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def sequence(name, *endpoints):
+    return Sequence({
+        "name": name,
+        "steps": [
+            {"id": index, "description": endpoint, "method": endpoint.split()[0], "url": endpoint.split()[1]}
+            for index, endpoint in enumerate(endpoints)
+        ],
+    })
+
+
+@unittest.skipIf(numpy is None, "the mix solver requires numpy")
+class NnlsTest(unittest.TestCase):
+
+    def test_recovers_non_negative_solutions(self):
+        rng = numpy.random.RandomState(1)
+        for _ in range(20):
+            a = rng.uniform(0, 1, (8, 5))
+            x = rng.uniform(0, 10, 5)
+            x[rng.randint(5)] = 0
+
+            numpy.testing.assert_allclose(nnls(a, a.dot(x)), x, atol=1e-8)
+
+    def test_constrained(self):
+        rng = numpy.random.RandomState(2)
+        for _ in range(20):
+            a = rng.normal(0, 1, (8, 5))
+            b = rng.normal(0, 1, 8)
+            x = nnls(a, b)
+
+            # Karush-Kuhn-Tucker conditions of the optimum
+            gradient = a.T.dot(b - a.dot(x))
+            self.assertTrue((x >= 0).all())
+            self.assertTrue((gradient <= 1e-8).all())
+            numpy.testing.assert_allclose(gradient[x > 0], 0, atol=1e-8)
+
+
+@unittest.skipIf(numpy is None, "the mix solver requires numpy")
+class SolveWeightsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sequences = [
+            sequence("Browse", "GET /", "GET /products"),
+            sequence("Buy", "GET /", "GET /products", "GET /products", "POST /cart", "POST /checkout"),
+            sequence("Login", "GET /", "POST /login"),
+        ]
+        self.endpoints = sorted(set(endpoint for sequence in self.sequences for endpoint in sequence.endpoints))
+        self.response_times = {endpoint: 0.1 for endpoint in self.endpoints}
+        self.response_times["POST /checkout"] = 0.5
+        self.wait_mean = 2.0
+        # Weights as solved: WEIGHT_PER_SEQUENCE per sequence
+        self.weights = [120, 60, 120]
+
+    def predicted(self, mode):
+        """ Endpoint and transaction mix of `self.weights` """
+
+        durations = mean_durations(self.sequences, self.wait_mean, self.response_times)
+        endpoint_mix, _, iteration_mix, _ = predict(
+            self.sequences, self.endpoints, self.weights, durations, mode, 100, 1, numpy.random.RandomState(0)
+        )
+
+        return dict(zip(self.endpoints, endpoint_mix)), {
+            sequence.name: share for sequence, share in zip(self.sequences, iteration_mix)
+        }
+
+    def solve(self, target, mode):
+        return solve_weights(self.sequences, self.endpoints, target, mode, self.wait_mean, self.response_times)
+
+    def test_endpoint_target(self):
+        for mode in (CLOSED, ARRIVAL):
+            endpoints, _ = self.predicted(mode)
+            self.assertEqual(self.solve({"endpoints": endpoints}, mode), self.weights, mode)
+
+    def test_endpoint_counts(self):
+        endpoints, _ = self.predicted(ARRIVAL)
+        counts = {endpoint: int(round(share * 1000000)) for endpoint, share in endpoints.items()}
+
+        self.assertEqual(self.solve({"endpoints": counts}, ARRIVAL), self.weights)
+
+    def test_transaction_target(self):
+        for mode in (CLOSED, ARRIVAL):
+            _, transactions = self.predicted(mode)
+            self.assertEqual(self.solve({"transactions": transactions}, mode), self.weights, mode)
+
+    def test_unreachable_endpoint_mix(self):
+        # Every sequence requests "GET /": the closest mix, with weights still
+        target = {"endpoints": {"POST /login": 1, "GET /products": 1}}
+        weights = self.solve(target, ARRIVAL)
+
+        self.assertTrue(all(weight >= 0 for weight in weights))
+        self.assertAlmostEqual(sum(weights), mix.WEIGHT_PER_SEQUENCE * 3, delta=1)
+
+    def test_unknown_names(self):
+        with self.assertRaises(mix.ScenarioError):
+            self.solve({"endpoints": {"GET /missing": 1}}, CLOSED)
+        with self.assertRaises(mix.ScenarioError):
+            self.solve({"transactions": {"Missing": 1}}, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
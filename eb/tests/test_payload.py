@@ -0,0 +1,35 @@
+# coding=utf-8
+
+# Tests of the payload templates (see loadtest/payload.py)
+
+from loadtest.payload import Template, TemplateError, UserData
+import unittest
+
+
+class TemplateTest(unittest.TestCase):
+
+    def test_render(self):
+        user_data = UserData(user="u 1")
+        template = Template("email={email}&password={password}&n={iteration}&brace={{}}")
+        self.assertEqual(template.render(user_data), b"email=test%2Bu+1%40example.org&password=pw-u+1&n=0&brace={}")
+
+        user_data.next_iteration()
+        self.assertTrue(template.render(user_data).endswith(b"&n=1&brace={}"))
+
+    def test_unknown_placeholder(self):
+        with self.assertRaises(TemplateError):
+            Template("email={mail}")
+
+    def test_check_columns(self):
+        template = Template("email={data.email}&name={name}")
+        template.check_columns(["email", "name"])
+        Template("name={name}").check_columns(None)
+
+        with self.assertRaisesRegex(TemplateError, "needs a dataset"):
+            template.check_columns(None)
+        with self.assertRaisesRegex(TemplateError, "Unknown column"):
+            template.check_columns(["mail"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,219 @@
+# coding=utf-8
+
+# Tests of the load shapes and the capacity search (see loadtest/shape.py)
+
+from locust.stats import RequestStats
+from loadtest import shape
+from loadtest.histogram import Histogram
+from loadtest.shape import CapacitySearch, LoadMonitor, ShapeError, Stages, load_shape, ramp, spike, step
+import time
+import unittest
+
+# Clock at the start of the test
+T0 = 1600000000.0
+
+
+class StagesTest(unittest.TestCase):
+
+    def ticks(self, load_shape, elapsed):
+        monitor = LoadMonitor()
+
+        return [load_shape.tick(seconds, monitor) for seconds in elapsed]
+
+    def test_boundaries(self):
+        stages = Stages([(10, 5, 1), (20, 15, 2)])
+        self.assertEqual(self.ticks(stages, [0, 9.9, 10, 29.9, 30]), [(5, 1), (5, 1), (15, 2), (15, 2), None])
+        self.assertEqual(stages.status(), {"stage": 2, "stages": 2, "duration": 30})
+
+    def test_step(self):
+        self.assertEqual(
+            self.ticks(step(10, 10, 3, 60, 5), [0, 59, 60, 119, 120, 179, 180]),
+            [(10, 5), (10, 5), (20, 5), (20, 5), (30, 5), (30, 5), None]
+        )
+
+    def test_ramp(self):
+        shape = ramp(0, 100, 100, interval=10)
+        self.assertEqual(self.ticks(shape, [0, 9, 10, 95, 100]), [(10, 2), (10, 2), (20, 2), (100, 2), None])
+
+        # Down, with a duration which isn't a multiple of the interval
+        shape = ramp(100, 0, 25, hatch_rate=50, interval=10)
+        self.assertEqual(self.ticks(shape, [0, 8.3, 8.4, 24.9, 25]), [(67, 50), (67, 50), (33, 50), (0, 50), None])
+
+    def test_spike(self):
+        self.assertEqual(
+            self.ticks(spike(20, 200, 60, 30, 60, 100), [0, 59, 60, 89, 90, 149, 150]),
+            [(20, 100), (20, 100), (200, 100), (200, 100), (20, 100), (20, 100), None]
+        )
+
+    def test_load_shape(self):
+        stages = load_shape({"shape": "stages", "stages": [{"duration": 60, "users": 10}, {"duration": 60, "users": 0}]})
+        self.assertEqual(self.ticks(stages, [0, 60]), [(10, 10), (0, 1)])
+
+        with self.assertRaises(ShapeError):
+            load_shape({"shape": "wave"})
+        with self.assertRaises(ShapeError):
+            load_shape({"shape": "step", "start_users": 10})
+        with self.assertRaises(ShapeError):
+            load_shape({"shape": "stages", "stages": [{"duration": 0, "users": 10}]})
+        with self.assertRaises(ShapeError):
+            load_shape({"shape": "stages", "stages": []})
+
+
+class LoadMonitorTest(unittest.TestCase):
+
+    def test_requests(self):
+        monitor = LoadMonitor()
+        monitor.on_request_success("GET", "/", 100, 0)
+        monitor.on_request_success("GET", "/", None, 0)
+        monitor.on_request_failure("POST", "/login", 300, 0, Exception("timeout"))
+        # Arrival-rate iterations and missed slots aren't requests
+        monitor.on_request_success("ITERATION", "(Iteration) Browse", 5000, 0)
+        monitor.on_request_failure("ITERATION", "(Missed slot) Browse", 0, 0, Exception("missed"))
+
+        self.assertEqual(monitor.counts(time.time() - 60, time.time() + 60), (3, 1))
+        histogram = monitor.take_histogram()
+        self.assertEqual(histogram.count, 2)
+        self.assertAlmostEqual(histogram.max / 1000, 300, delta=3)
+
+    def test_slave_reports(self):
+        stats = RequestStats()
+        stats.log_request("GET", "/", 100, 0)
+        stats.log_request("GET", "/", 200, 0)
+        stats.log_error("GET", "/", "timeout")
+        stats.log_request("ITERATION", "(Iteration) Browse", 5000, 0)
+        requests, iterations = Histogram(), Histogram()
+        requests.record(100000)
+        requests.record(200000)
+        iterations.record(5000000)
+        data = {
+            "stats": stats.serialize_stats(),
+            "stats_total": stats.total.get_stripped_report(),
+            "histograms": {"/": requests.encode(), "(Iteration) Browse": iterations.encode()},
+        }
+
+        monitor = LoadMonitor()
+        monitor.on_slave_report("slave-1", data)
+        self.assertEqual(monitor.counts(time.time() - 60, time.time() + 60), (2, 1))
+        histogram = monitor.take_histogram()
+        self.assertEqual(histogram.count, 2)
+        self.assertAlmostEqual(histogram.max / 1000, 200, delta=2)
+
+
+class CapacitySearchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = T0
+        self.time = shape.time.time
+        shape.time.time = lambda: self.now
+
+    def tearDown(self):
+        shape.time.time = self.time
+
+    def search(self, **kwargs):
+        options = dict(start_users=10, step_users=10, step_duration=60, max_users=1000, slo_ms=500)
+        options.update(kwargs)
+
+        return CapacitySearch(**options)
+
+    def run_search(self, search, rps, latency_ms=lambda users: 100, failure_ratio=lambda users: 0, seconds=7200):
+        """ Tick the search every second against a target whose requests/sec, latency and failures depend on the users
+
+        Returns the users of each tick.
+
+        """
+
+        monitor = LoadMonitor()
+        users = []
+        for elapsed in range(seconds):
+            self.now = T0 + elapsed
+            if users:
+                # The requests of the last second
+                requests = int(rps(users[-1]))
+                monitor.add(int(self.now) - 1, requests, int(round(requests * failure_ratio(users[-1]))))
+                for _ in range(10):
+                    monitor.histogram.record(latency_ms(users[-1]) * 1000)
+            target = search.tick(elapsed, monitor)
+            if target is None:
+                return users
+            users.append(target[0])
+
+        self.fail("The capacity search didn't finish")
+
+    def test_latency_slo(self):
+        search = self.search()
+        users = self.run_search(search, rps=lambda users: users * 10, latency_ms=lambda users: 100 if users <= 30 else 800)
+
+        self.assertEqual(search.result["reason"], "SLO broken at 40 users")
+        self.assertEqual(search.result["users"], 30)
+        self.assertAlmostEqual(search.result["max_sustainable_rps"], 300)
+        self.assertEqual([measured["within_slo"] for measured in search.steps], [True, True, True, False])
+        self.assertAlmostEqual(search.steps[-1]["latency_ms"], 800, delta=8)
+        self.assertEqual(max(users), 40)
+        self.assertEqual(len(users), 4 * 60)
+
+    def test_failure_ratio(self):
+        search = self.search(max_failure_ratio=0.01)
+        self.run_search(search, rps=lambda users: users * 10, failure_ratio=lambda users: 0.05 if users >= 50 else 0)
+
+        self.assertEqual(search.result["reason"], "SLO broken at 50 users")
+        self.assertEqual(search.result["users"], 40)
+        self.assertAlmostEqual(search.steps[-1]["failure_ratio"], 0.05, places=3)
+
+    def test_plateau(self):
+        search = self.search(patience=2, min_efficiency=0.2)
+        self.run_search(search, rps=lambda users: min(users, 40) * 10)
+
+        self.assertEqual(search.result["reason"], "throughput plateaued at 60 users")
+        self.assertEqual(search.result["users"], 40)
+        self.assertAlmostEqual(search.result["max_sustainable_rps"], 400)
+        self.assertEqual([measured["users"] for measured in search.steps], [10, 20, 30, 40, 50, 60])
+        self.assertIsNone(search.steps[0]["efficiency"])
+        self.assertAlmostEqual(search.steps[1]["efficiency"], 1)
+        self.assertAlmostEqual(search.steps[-1]["efficiency"], 0)
+
+    def test_single_flat_step(self):
+        # One step short of `patience` flat steps, then throughput grows again
+        search = self.search(max_users=60, patience=2)
+        self.run_search(search, rps=lambda users: 200 if users == 30 else users * 10)
+
+        self.assertEqual(search.result["reason"], "max_users reached, no knee found")
+        self.assertEqual(search.result["users"], 60)
+
+    def test_max_users(self):
+        search = self.search(max_users=50)
+        users = self.run_search(search, rps=lambda users: users * 10)
+
+        self.assertEqual(search.result["reason"], "max_users reached, no knee found")
+        self.assertEqual(search.result["users"], 50)
+        self.assertAlmostEqual(search.result["max_sustainable_rps"], 500)
+        self.assertEqual(max(users), 50)
+        self.assertEqual(search.status()["result"], search.result)
+
+    def test_step_boundaries(self):
+        search = self.search(max_users=30)
+        users = self.run_search(search, rps=lambda users: users * 10)
+
+        self.assertEqual(users[0:60], [10] * 60)
+        self.assertEqual(users[60:120], [20] * 60)
+        self.assertEqual(users[120:], [30] * 60)
+
+    def test_settled_measurement(self):
+        # The first seconds of each step are left out (`settle`), as are those not yet reported
+        search = self.search(max_users=20, settle=0.5)
+        self.run_search(
+            search,
+            rps=lambda users: users * 10,
+            latency_ms=lambda users: 5000 if (self.now - T0) % 60 <= 20 else 100
+        )
+
+        self.assertTrue(all(measured["within_slo"] for measured in search.steps))
+
+    def test_invalid(self):
+        with self.assertRaises(ShapeError):
+            CapacitySearch(start_users=0)
+        with self.assertRaises(ShapeError):
+            CapacitySearch(step_duration=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,160 @@
+# coding=utf-8
+
+# Tests of the web UI's statistics snapshot (see loadtest/snapshot.py)
+
+from flask import json
+from loadtest import snapshot
+from loadtest.snapshot import StatsSnapshot
+import copy
+import unittest
+
+
+def row(name, requests):
+    return {"method": "GET", "name": name, "num_requests": requests, "num_failures": 0}
+
+
+class FakeRequestStats(object):
+    """ Stand-in for Locust's (memoized) /stats/requests view, serving `report` """
+
+    def __init__(self, report):
+        self.report = report
+
+    def __call__(self):
+        return snapshot.web.app.response_class(json.dumps(self.report), mimetype="application/json")
+
+    def clear_cache(self):
+        pass
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.request_stats = snapshot.web.request_stats
+        self.locust = FakeRequestStats({
+            "stats": [row("/a", 1), row("/b", 1), row("Aggregated", 2)],
+            "errors": [],
+            "total_rps": 2,
+        })
+        snapshot.web.request_stats = self.locust
+        # Rebuilt with every poll
+        self.snapshot = StatsSnapshot(interval=0)
+        self.snapshot.refresh()
+
+    def tearDown(self):
+        snapshot.web.request_stats = self.request_stats
+
+    def update(self, **fields):
+        self.locust.report = dict(copy.deepcopy(self.locust.report), **fields)
+        self.snapshot.refresh()
+
+    def get(self, since=None, etag=None):
+        url = "/stats/snapshot" if since is None else "/stats/snapshot?since={}".format(since)
+        headers = {} if etag is None else {"If-None-Match": '"{}"'.format(etag)}
+        with snapshot.web.app.test_request_context(url, headers=headers):
+            response = self.snapshot.snapshot_view()
+
+        body = response.get_data()
+        return response.status_code, json.loads(body) if body else None
+
+    def names(self, report):
+        return [stat["name"] for stat in report["stats"]]
+
+    def test_version_changes_with_the_report(self):
+        version = self.snapshot.version
+        self.snapshot.refresh()
+        self.assertEqual(self.snapshot.version, version)
+
+        self.update(total_rps=3)
+        self.assertNotEqual(self.snapshot.version, version)
+
+    def test_etag(self):
+        version = self.snapshot.version
+        status, report = self.get(etag=version)
+        self.assertEqual(status, 304)
+
+        self.update(stats=[row("/a", 2), row("/b", 1), row("Aggregated", 3)])
+        status, report = self.get(etag=version)
+        self.assertEqual(status, 200)
+        self.assertEqual(report["version"], self.snapshot.version)
+
+    def test_changed_rows(self):
+        version = self.snapshot.version
+        status, report = self.get(since=version)
+        self.assertEqual(report["stats"], [])
+        self.assertEqual(report["total_rps"], 2)
+
+        self.update(stats=[row("/a", 2), row("/b", 1), row("Aggregated", 3)], total_rps=3)
+        status, report = self.get(since=version)
+        self.assertEqual(sorted(self.names(report)), ["/a", "Aggregated"])
+        self.assertEqual(report["since"], version)
+        self.assertEqual(report["version"], self.snapshot.version)
+        self.assertEqual(report["total_rps"], 3)
+
+        # New rows are changed rows
+        self.update(stats=[row("/a", 2), row("/b", 1), row("/c", 1), row("Aggregated", 4)])
+        status, report = self.get(since=version)
+        self.assertEqual(sorted(self.names(report)), ["/a", "/c", "Aggregated"])
+
+    def test_unknown_versions(self):
+        counter = self.snapshot.counter
+        for version in (
+            "other-{}".format(counter),
+            "{}-{}".format(self.snapshot.process, counter + 1),
+            "{}-x".format(self.snapshot.process),
+            "garbage",
+        ):
+            self.assertIsNone(self.snapshot.since(version))
+
+            # The whole report
+            status, report = self.get(since=version)
+            self.assertEqual(sorted(self.names(report)), ["/a", "/b", "Aggregated"])
+            self.assertNotIn("since", report)
+
+    def test_reset_stats(self):
+        # Locust resets the rows in place (--reset-stats, /stats/reset)
+        version = self.snapshot.version
+        self.update(stats=[row("/a", 0), row("/b", 0), row("Aggregated", 0)])
+
+        status, report = self.get(since=version)
+        self.assertEqual(sorted(self.names(report)), ["/a", "/b", "Aggregated"])
+        self.assertEqual(report["since"], version)
+
+    def test_removed_rows(self):
+        before = self.snapshot.version
+        self.update(stats=[row("/a", 2), row("/b", 1), row("Aggregated", 3)])
+        # eg. a test started, which clears the statistics
+        self.update(stats=[row("/b", 1), row("Aggregated", 1)])
+        after = self.snapshot.version
+        self.update(stats=[row("/b", 2), row("Aggregated", 2)])
+
+        # Too old: rows were removed since
+        for version in (before, "{}-{}".format(self.snapshot.process, self.snapshot.removed - 1)):
+            self.assertIsNone(self.snapshot.since(version))
+            status, report = self.get(since=version)
+            self.assertEqual(sorted(self.names(report)), ["/b", "Aggregated"])
+            self.assertNotIn("since", report)
+
+        # Versions from the removal on are incremental
+        status, report = self.get(since=after)
+        self.assertEqual(sorted(self.names(report)), ["/b", "Aggregated"])
+        self.assertEqual(report["since"], after)
+
+        status, report = self.get(since=self.snapshot.version)
+        self.assertEqual(report["stats"], [])
+
+    def test_increments_are_kept_for_the_version(self):
+        snapshot = self.snapshot
+        snapshot.max_increments = 1
+        version = snapshot.version
+        self.update(total_rps=3)
+
+        self.get(since=version)
+        self.get(since="other-1")
+        self.assertEqual(list(snapshot.increments), [version])
+
+        self.update(total_rps=4)
+        self.assertEqual(snapshot.increments, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
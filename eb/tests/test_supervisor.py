@@ -0,0 +1,172 @@
+# coding=utf-8
+
+# Tests of the slave supervisor's core detection, slave planning and restarts
+# (see loadtest/supervisor.py)
+
+from loadtest import supervisor
+from loadtest.supervisor import Supervisor, plan_slaves, read_cores, restart_backoff
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def cpuinfo(cpus):
+    """ /proc/cpuinfo of (processor, physical id, core id) tuples, topology left out when None """
+
+    blocks = []
+    for processor, physical_id, core_id in cpus:
+        lines = ["processor\t: {}".format(processor), "model name\t: Intel(R) Xeon(R) Platinum 8175M CPU @ 2.50GHz"]
+        if physical_id is not None:
+            lines += ["physical id\t: {}".format(physical_id), "core id\t\t: {}".format(core_id)]
+        blocks.append("\n".join(lines))
+
+    return "\n\n".join(blocks) + "\n\n"
+
+
+# 4 cores with 2 threads each, the siblings numbered after the first threads (like EC2)
+SMT = cpuinfo([(cpu, 0, cpu % 4) for cpu in range(8)])
+
+# 4 cores, hyperthreading disabled
+NO_SMT = cpuinfo([(cpu, 0, cpu) for cpu in range(4)])
+
+# 2 sockets of 2 cores with 2 threads each, core IDs repeat per socket
+SOCKETS = cpuinfo([(cpu, cpu // 2 % 2, cpu % 2) for cpu in range(8)])
+
+# Without topology (eg. some virtual machines)
+NO_TOPOLOGY = cpuinfo([(cpu, None, None) for cpu in range(3)])
+
+
+class CoresTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def read(self, text, allowed=None):
+        path = os.path.join(self.directory, "cpuinfo")
+        with open(path, "w") as f:
+            f.write(text)
+
+        return read_cores(path, allowed)
+
+    def test_smt(self):
+        self.assertEqual(self.read(SMT), [[0, 4], [1, 5], [2, 6], [3, 7]])
+
+    def test_no_smt(self):
+        self.assertEqual(self.read(NO_SMT), [[0], [1], [2], [3]])
+
+    def test_sockets(self):
+        self.assertEqual(self.read(SOCKETS), [[0, 4], [1, 5], [2, 6], [3, 7]])
+
+    def test_no_topology(self):
+        self.assertEqual(self.read(NO_TOPOLOGY), [[0], [1], [2]])
+
+    def test_allowed(self):
+        self.assertEqual(self.read(SMT, allowed={0, 1, 4}), [[0, 4], [1]])
+
+
+class PlanTest(unittest.TestCase):
+
+    SMT_CORES = [[0, 4], [1, 5], [2, 6], [3, 7]]
+
+    def test_slave_per_core(self):
+        self.assertEqual(plan_slaves(self.SMT_CORES), self.SMT_CORES)
+
+    def test_reserved_master_core(self):
+        self.assertEqual(plan_slaves(self.SMT_CORES, reserve=1), [[1, 5], [2, 6], [3, 7]])
+        self.assertEqual(plan_slaves([[0], [1], [2], [3]], reserve=1), [[1], [2], [3]])
+
+    def test_reserve_keeps_a_core(self):
+        self.assertEqual(plan_slaves([[0, 1]], reserve=1), [[0, 1]])
+
+    def test_fewer_slaves(self):
+        self.assertEqual(plan_slaves(self.SMT_CORES, reserve=1, count=2), [[1, 5], [2, 6]])
+
+    def test_slave_per_thread(self):
+        self.assertEqual(plan_slaves(self.SMT_CORES, reserve=1, count=6), [[1], [2], [3], [5], [6], [7]])
+        self.assertEqual(plan_slaves([[0], [1]], count=3), [[0], [1], [0]])
+
+
+class Process(object):
+    """ A slave process, which exits when told to """
+
+    def __init__(self, *args, **kwargs):
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+
+class RestartTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 1000.0
+        self.time = supervisor.time.time
+        self.popen = supervisor.subprocess.Popen
+        supervisor.time.time = lambda: self.now
+        supervisor.subprocess.Popen = Process
+        logging.getLogger("locust.supervisor").disabled = True
+
+        self.supervisor = Supervisor([[0], [1]], ["locust"], "/nonexistent", max_restart_delay=8, stable_time=30)
+        self.supervisor.master_host = "10.0.0.1"
+        for index in range(2):
+            self.supervisor.start(index)
+
+    def tearDown(self):
+        supervisor.time.time = self.time
+        supervisor.subprocess.Popen = self.popen
+        logging.getLogger("locust.supervisor").disabled = False
+
+    def exit(self, index):
+        first = self.supervisor.processes[index]
+        first.returncode = 1
+
+        return first
+
+    def restarts(self, index, seconds):
+        """ Seconds after which the exited slave was restarted, checking every second """
+
+        exited = self.supervisor.processes[index]
+        for elapsed in range(seconds + 1):
+            self.supervisor.restart_exited(self.now)
+            if self.supervisor.processes[index] is not exited:
+                return elapsed
+            self.now += 1
+
+        return None
+
+    def test_backoff(self):
+        self.assertEqual([restart_backoff(failures) for failures in range(1, 9)], [1, 2, 4, 8, 16, 32, 60, 60])
+
+    def test_crash_loop_backs_off(self):
+        delays = []
+        for _ in range(5):
+            self.exit(0)
+            delays.append(self.restarts(0, 20))
+        self.assertEqual(delays, [1, 2, 4, 8, 8])
+
+        # The other slave kept running
+        self.assertEqual(self.supervisor.failures[1], 0)
+
+    def test_stable_slave_restarts_quickly(self):
+        for _ in range(3):
+            self.exit(0)
+            self.restarts(0, 20)
+        self.now += 60
+        self.exit(0)
+        self.assertEqual(self.restarts(0, 20), 1)
+        self.assertEqual(self.supervisor.failures[0], 1)
+
+    def test_no_restarts_when_stopping(self):
+        exited = self.exit(0)
+        self.supervisor.stopping = True
+        self.assertIsNone(self.restarts(0, 5))
+        self.assertIs(self.supervisor.processes[0], exited)
+
+
+if __name__ == "__main__":
+    unittest.main()
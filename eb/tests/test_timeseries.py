@@ -0,0 +1,155 @@
+# coding=utf-8
+
+# Tests of the time-series export (see loadtest/timeseries.py)
+
+from locust.stats import RequestStats
+from loadtest import timeseries
+from loadtest.histogram import Histogram
+from loadtest.timeseries import COLUMNS, TimeSeriesExport
+import csv
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+
+T0 = 1600000000.0
+
+logger = logging.getLogger("test.timeseries")
+logger.addHandler(logging.NullHandler())
+
+
+class TimeSeriesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = T0
+        self.time = timeseries.time.time
+        timeseries.time.time = lambda: self.now
+        self.export = None
+
+    def tearDown(self):
+        if self.export is not None:
+            self.export.stop()
+        timeseries.time.time = self.time
+        shutil.rmtree(self.directory)
+
+    def start(self, **kwargs):
+        # Intervals are flushed by the tests, not by the export's greenlet
+        self.export = TimeSeriesExport(logger, self.directory, interval=3600, **kwargs)
+        self.export.start()
+
+        return self.export
+
+    def success(self, name, response_time):
+        self.export.on_request_success("GET", name, response_time, 0)
+
+    def failure(self, name, response_time):
+        self.export.on_request_failure("GET", name, response_time, 0, Exception("timeout"))
+
+    def rows(self):
+        """ {file name: [rows as dicts]}, once the export stopped """
+
+        self.export.stop()
+        self.export = None
+        files = {}
+        for file_name in sorted(os.listdir(self.directory)):
+            with open(os.path.join(self.directory, file_name), newline="") as f:
+                reader = csv.reader(f)
+                self.assertEqual(tuple(next(reader)), COLUMNS)
+                files[file_name] = [dict(zip(COLUMNS, row)) for row in reader]
+
+        return files
+
+    def test_intervals(self):
+        self.start()
+        self.success("/", 100)
+        self.success("/", 300)
+        self.failure("/login", 50)
+        self.now += 10
+        self.export.flush()
+
+        # Nothing but the aggregated row in an empty interval
+        self.now += 10
+        self.export.flush()
+
+        self.success("/", 200)
+        self.now += 5
+
+        rows = [row for file_rows in self.rows().values() for row in file_rows]
+        self.assertEqual(
+            [(row["name"], row["requests"], row["failures"], row["requests_per_second"]) for row in rows],
+            [
+                ("/", "2", "0", "0.2"),
+                ("/login", "1", "1", "0.1"),
+                ("Aggregated", "3", "1", "0.3"),
+                ("Aggregated", "0", "0", "0.0"),
+                ("/", "1", "0", "0.2"),
+                ("Aggregated", "1", "0", "0.2"),
+            ]
+        )
+        self.assertAlmostEqual(float(rows[0]["mean"]), 200, delta=2)
+        self.assertAlmostEqual(float(rows[0]["max"]), 300, delta=3)
+        self.assertAlmostEqual(float(rows[4]["p50"]), 200, delta=2)
+
+    def test_requests_without_response_time(self):
+        self.start()
+        self.success("/", None)
+        self.failure("/", None)
+        self.success("/", 100)
+        self.now += 10
+
+        row = self.rows().popitem()[1][0]
+        self.assertEqual((row["requests"], row["failures"]), ("3", "1"))
+        self.assertAlmostEqual(float(row["max"]), 100, delta=1)
+
+    def test_slave_reports(self):
+        self.start()
+        stats = RequestStats()
+        stats.log_request("GET", "/", 100, 0)
+        stats.log_request("GET", "/", 200, 0)
+        stats.log_error("GET", "/", "timeout")
+        histogram = Histogram()
+        histogram.record(100000)
+        histogram.record(200000)
+        report = {"stats": stats.serialize_stats(), "histograms": {"/": histogram.encode()}}
+        self.export.on_slave_report("slave-1", report)
+        self.export.on_slave_report("slave-2", report)
+        self.now += 10
+
+        rows = self.rows().popitem()[1]
+        self.assertEqual((rows[0]["name"], rows[0]["requests"], rows[0]["failures"]), ("/", "4", "2"))
+        self.assertAlmostEqual(float(rows[0]["mean"]), 150, delta=2)
+
+    def test_rotation(self):
+        self.start(max_bytes=500)
+        for _ in range(10):
+            self.success("/", 100)
+            self.now += 10
+            self.export.flush()
+
+        files = self.rows()
+        self.assertGreater(len(files), 1)
+        for name, rows in files.items():
+            self.assertTrue(name.startswith("stats-") and name.endswith(".csv"), name)
+            # Files rotate once they're past max_bytes, after a whole interval
+            self.assertLess(os.path.getsize(os.path.join(self.directory, name)), 500 * 2)
+        rows = [row for file_rows in files.values() for row in file_rows]
+        self.assertEqual(sum(1 for row in rows if row["name"] == "/"), 10)
+        self.assertEqual([row["requests"] for row in rows if row["name"] == "Aggregated"], ["1"] * 10 + ["0"])
+
+    def test_writer_behind(self):
+        self.start(max_pending=0)
+        self.success("/", 100)
+        self.export.flush()
+        self.assertEqual(self.export.dropped, 2)
+
+    def test_not_started(self):
+        export = TimeSeriesExport(logger, self.directory)
+        export.on_request_success("GET", "/", 100, 0)
+        export.on_slave_report("slave-1", {"stats": []})
+        self.assertEqual(export.intervals, {})
+
+
+if __name__ == "__main__":
+    unittest.main()